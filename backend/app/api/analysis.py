@@ -1,72 +1,179 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Path, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Path, BackgroundTasks, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from app.models.schemas import JobSubmissionResponse, ReportResponse # Uses the updated ReportResponse
-from app.services.supabase_client import supabase
+from app.services.repository import JobRepository, get_job_repository
 from app.services import analysis_service
-import uuid
-import google.generativeai as genai
+from app.services.llm_cache import llm_cache
+from app.services.llm_gateway import get_gateway
+from app.services.job_writer import writer as job_writer
+from app.services import job_queue
+from app.services import job_stats
+from app.services import job_events
+from app.services import uploads
 from app.core.config import settings
+from app.core.etag import conditional_json_response
+import uuid
+import json
+import asyncio
 router = APIRouter()
 
 @router.post("/analyze", response_model=JobSubmissionResponse, status_code=202)
 async def analyze_documents(
     background_tasks: BackgroundTasks,
     complaint_file: UploadFile = File(...), 
-    frl_file: UploadFile = File(...)
+    frl_file: UploadFile = File(...),
+    jobs: JobRepository = Depends(get_job_repository)
 ):
-    job_id = uuid.uuid4()
-    complaint_data = await complaint_file.read()
-    frl_data = await frl_file.read()
+    job_id = str(uuid.uuid4())
 
+    # 1. Stream both PDFs to the job's spool directory (never held in memory whole)
+    complaint_path, frl_path = job_queue.payload_paths(job_id)
     try:
-        supabase.table('jobs').insert({
-            'job_id': str(job_id),
-            'status': 'PENDING'
-        }).execute()
+        await uploads.spool_upload(complaint_file, complaint_path)
+        await uploads.spool_upload(frl_file, frl_path)
+    except uploads.UploadTooLarge as e:
+        job_queue.discard_spool(job_id)
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
+        job_queue.discard_spool(job_id)
+        raise HTTPException(status_code=500, detail=f"Failed to store uploads: {e}")
+
+    # 2. Create the job row
+    try:
+        await jobs.create(job_id)
+    except Exception as e:
+        job_queue.discard_spool(job_id)
         raise HTTPException(status_code=500, detail=f"Failed to create job: {e}")
+    job_stats.safe_record_status(job_id, 'PENDING')
 
-    background_tasks.add_task(
-        analysis_service.run_analysis_pipeline, 
-        str(job_id), 
-        complaint_data, 
-        frl_data
-    )
-    
-    return {"job_id": str(job_id), "status": "PENDING"}
+    # 3. Queue it
+    if settings.JOB_WORKERS > 0:
+        # Durable queue: survives restarts and is drained by the worker pool
+        await run_in_threadpool(job_queue.enqueue, job_id)
+    else:
+        background_tasks.add_task(job_queue.run_in_process, job_id)
+
+    return {"job_id": job_id, "status": "PENDING"}
 
 @router.get("/report/{job_id}", response_model=ReportResponse)
-async def get_report(job_id: str = Path(..., title="The ID of the analysis job")):
+async def get_report(
+    request: Request,
+    job_id: str = Path(..., title="The ID of the analysis job"),
+    jobs: JobRepository = Depends(get_job_repository)
+):
     try:
-        result = supabase.table('jobs').select('*').eq('job_id', job_id).single().execute()
-        job = result.data
+        job = await jobs.get(job_id, 'job_id, status, report_data')
         if not job:
             raise HTTPException(status_code=404, detail="Job not found")
         
         # This now matches the updated schema and frontend expectation
-        return {
-            "job_id": job['job_id'],
-            "status": job['status'],
-            "report": job.get('report_data') # Key changed from "report_data" to "report"
-        }
+        report = ReportResponse(
+            job_id=job['job_id'],
+            status=job['status'],
+            report=job.get('report_data') # Key changed from "report_data" to "report"
+        )
+        # Pollers sending If-None-Match get a bodiless 304 until the report changes
+        return conditional_json_response(request, report)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
 
-@router.post("/report/{job_id}/explain")
-async def explain_report_prediction(job_id: str):
+@router.get("/report/{job_id}/events")
+async def stream_job_events(request: Request, job_id: str, jobs: JobRepository = Depends(get_job_repository)):
+    """Server-sent events with per-stage progress; the stream ends after report_ready or error."""
+    try:
+        last_event_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_event_id = 0
+    backlog, queue, subscriber = job_events.bus.subscribe(job_id, last_event_id)
+
+    if not backlog and last_event_id == 0:
+        # Nothing buffered here (job finished long ago, or runs elsewhere): start from the stored state
+        job = await jobs.get(job_id, 'job_id, status, report_data')
+        if not job:
+            job_events.bus.unsubscribe(job_id, subscriber)
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job['status'] == 'COMPLETE':
+            backlog = [{'job_id': job_id, 'stage': 'report_ready', 'data': {'report': job.get('report_data')}}]
+        elif job['status'] == 'ERROR':
+            backlog = [{'job_id': job_id, 'stage': 'error', 'data': {}}]
+        else:
+            backlog = [{'job_id': job_id, 'stage': 'status', 'data': {'status': job['status']}}]
+
+    async def event_stream():
+        try:
+            for event in backlog:
+                yield job_events.format_sse(event)
+                if event['stage'] in job_events.TERMINAL_STAGES:
+                    return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield job_events.format_sse(event)
+                if event['stage'] in job_events.TERMINAL_STAGES:
+                    return
+        finally:
+            job_events.bus.unsubscribe(job_id, subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def explanation_points(value) -> list:
+    """
+    Normalises a rationale (list of bullets, or one string with one bullet per
+    line) to a list of points without their leading hyphens. Hyphens inside a
+    point ("low-risk") are kept.
+    """
+    lines = value if isinstance(value, list) else str(value).split('\n')
+    points = [str(point).strip().lstrip('-').strip() for point in lines]
+    return [point for point in points if point]
+
+
+async def load_rationale(jobs: JobRepository, job_id: str, key: str, build_prompt) -> list:
+    """
+    Serves a rationale from report_data; the analysis writes both rationales
+    alongside the report. Reports from before that (or where the model left one
+    out) fall back to a dedicated LLM call, whose answer is stored for next time.
+    """
+    # 1. Fetch only the report; the texts are needed only for the fallback
+    job_data = await jobs.get(job_id, 'report_data') or {}
+    report = job_data.get('report_data')
+    if not report:
+        raise HTTPException(status_code=404, detail="Required data for explanation not found.")
+    if report.get(key):
+        return explanation_points(report[key])
+
+    # 2. Fallback: fetch the texts and ask Gemini (repeat clicks are served from the response cache)
+    job_data = await jobs.get(job_id, 'complaint_text, frl_text') or {}
+    if not all([job_data.get('complaint_text'), job_data.get('frl_text')]):
+        raise HTTPException(status_code=404, detail="Required data for explanation not found.")
+    response_text = await run_in_threadpool(analysis_service.generate_text, build_prompt(job_data, report))
+    points = explanation_points(response_text)
+
+    # 3. Store the rationale with the report so the next request skips the LLM
     try:
-        # 1. Fetch the original job data, including texts and the report
-        res = supabase.table('jobs').select('complaint_text, frl_text, report_data').eq('job_id', job_id).single().execute()
-        job_data = res.data
-        if not all([job_data.get('complaint_text'), job_data.get('frl_text'), job_data.get('report_data')]):
-            raise HTTPException(status_code=404, detail="Required data for explanation not found.")
-
-        # 2. Construct the explanation prompt
-        explanation_prompt = f"""
+        await jobs.update(job_id, {'report_data': {**report, key: points}})
+    except Exception as e:
+        print(f"Could not store {key} for job {job_id}: {e}")
+    return points
+
+
+def outcome_explanation_prompt(job_data: dict, report: dict) -> str:
+    return f"""
         **Context:**
         An AI model previously analyzed a customer complaint and a firm's Final Response Letter (FRL).
-        The model's final analysis was: {json.dumps(job_data['report_data'])}
+        The model's final analysis was: {json.dumps(report)}
 
         **Original Complaint:**
         {job_data['complaint_text']}
@@ -82,41 +189,12 @@ async def explain_report_prediction(job_id: str):
         Return ONLY the three bullet points as a single string, with each point separated by a newline character.
         """
 
-        # 3. Call the Gemini API
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel('models/gemini-2.5-flash-preview-05-20') # Use your working model
-        response = model.generate_content(explanation_prompt)
-        
-        # 4. Format and return the response
-        explanation_points = [point.strip() for point in response.text.split('-') if point.strip()]
-        
-        return {"explanation": explanation_points}
-
-    except Exception as e:
-        print(f"Error generating explanation for job {job_id}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate explanation.")
-    
-
-
-# ... (keep all existing imports and endpoints at the top of the file)
 
-# --- ADD THIS NEW ENDPOINT AT THE BOTTOM ---
-@router.post("/report/{job_id}/explain-confidence")
-async def explain_confidence_score(job_id: str):
-    try:
-        # 1. Fetch the original job data, including texts and the report
-        res = supabase.table('jobs').select('complaint_text, frl_text, report_data').eq('job_id', job_id).single().execute()
-        job_data = res.data
-        if not all([job_data.get('complaint_text'), job_data.get('frl_text'), job_data.get('report_data')]):
-            raise HTTPException(status_code=404, detail="Required data for explanation not found.")
-
-        report = job_data['report_data']
-        predicted_outcome = report.get('predicted_fos_outcome', {})
-        outcome_text = predicted_outcome.get('outcome', 'N/A')
-        confidence_score = predicted_outcome.get('confidence', 'N/A')
-
-        # 2. Construct a specific prompt for the explanation
-        explanation_prompt = f"""
+def confidence_explanation_prompt(job_data: dict, report: dict) -> str:
+    predicted_outcome = report.get('predicted_fos_outcome', {})
+    outcome_text = predicted_outcome.get('outcome', 'N/A')
+    confidence_score = predicted_outcome.get('confidence', 'N/A')
+    return f"""
         **Context:**
         An AI model previously analyzed a customer complaint and a firm's Final Response Letter (FRL).
         The model predicted the FOS outcome would be "{outcome_text}" with a confidence score of "{confidence_score}".
@@ -136,16 +214,47 @@ async def explain_confidence_score(job_id: str):
         Return ONLY the three bullet points as a single string, with each point separated by a newline character.
         """
 
-        # 3. Call the Gemini API
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel('models/gemini-2.5-flash-preview-05-20') # Use your working model
-        response = model.generate_content(explanation_prompt)
-        
-        # 4. Format and return the response
-        explanation_points = [point.strip() for point in response.text.split('-') if point.strip()]
-        
-        return {"explanation": explanation_points}
 
+@router.post("/report/{job_id}/explain")
+async def explain_report_prediction(job_id: str, jobs: JobRepository = Depends(get_job_repository)):
+    try:
+        points = await load_rationale(jobs, job_id, 'outcome_rationale', outcome_explanation_prompt)
+        return {"explanation": points}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error generating explanation for job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to generate explanation.")
+
+
+@router.post("/report/{job_id}/explain-confidence")
+async def explain_confidence_score(job_id: str, jobs: JobRepository = Depends(get_job_repository)):
+    try:
+        points = await load_rationale(jobs, job_id, 'confidence_rationale', confidence_explanation_prompt)
+        return {"explanation": points}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating confidence explanation for job {job_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate explanation.")
+
+
+@router.get("/queue/stats")
+async def get_queue_stats():
+    return job_queue.queue_stats()
+
+
+@router.get("/job-writer/stats")
+async def get_job_writer_stats():
+    return job_writer.stats()
+
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    """Gateway counters plus latency percentiles over recent calls (this process only)."""
+    return get_gateway().stats()
+
+
+@router.get("/llm-cache/stats")
+async def get_llm_cache_stats():
+    return llm_cache.stats()
@@ -1,32 +1,26 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Depends
 from app.models.schemas import UserCreate, UserLogin, Token
-from app.services.supabase_client import supabase
+from app.services.repository import AuthRepository, get_auth_repository
 
 router = APIRouter()
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register_user(user_credentials: UserCreate):
+async def register_user(user_credentials: UserCreate, auth: AuthRepository = Depends(get_auth_repository)):
     # This is a placeholder. Full implementation in Step 4.4
     # with password hashing and error handling.
     try:
-        res = supabase.auth.sign_up({
-            "email": user_credentials.email,
-            "password": user_credentials.password,
-        })
+        res = await auth.sign_up(user_credentials.email, user_credentials.password)
         return {"message": "User registered successfully. Please check your email for verification."}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/login", response_model=Token)
-async def login_for_access_token(form_data: UserLogin):
+async def login_for_access_token(form_data: UserLogin, auth: AuthRepository = Depends(get_auth_repository)):
     # This is a placeholder. Full implementation in Step 4.4.
     try:
-        res = supabase.auth.sign_in_with_password({
-            "email": form_data.email,
-            "password": form_data.password
-        })
-        return {"access_token": res.session.access_token, "token_type": "bearer"}
+        res = await auth.sign_in_with_password(form_data.email, form_data.password)
+        return {"access_token": res["access_token"], "token_type": "bearer"}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,187 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends, Query, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from app.models.schemas import BatchSubmissionResponse, BatchProgress
+from app.services.repository import JobRepository, get_job_repository
+from app.services import batch_service
+from app.services import job_queue
+from app.services import job_stats
+from app.services import uploads
+from app.core.config import settings
+from app.core.etag import conditional_json_response
+import csv
+import io
+import json
+import os
+import uuid
+router = APIRouter()
+
+RESULT_COLUMNS = ("name", "job_id", "status", "predicted_outcome", "confidence", "executive_summary", "error_message")
+
+
+def pair_uploads(complaints: List[UploadFile], frls: List[UploadFile]) -> list:
+    """Pairs the i-th complaint with the i-th FRL; each pair is named after its complaint file."""
+    if len(complaints) != len(frls):
+        raise HTTPException(status_code=400, detail=f"Got {len(complaints)} complaints but {len(frls)} FRLs; they are paired in order.")
+    names = []
+    for upload in complaints:
+        stem = os.path.splitext(os.path.basename(upload.filename or ""))[0]
+        match = batch_service.PAIR_FILE.match(stem)
+        names.append((match["name"] if match else stem) or f"pair-{len(names) + 1}")
+    return names
+
+
+@router.post("/batch", response_model=BatchSubmissionResponse, status_code=202)
+async def submit_batch(
+    background_tasks: BackgroundTasks,
+    archive: Optional[UploadFile] = File(None),
+    complaints: Optional[List[UploadFile]] = File(None),
+    frls: Optional[List[UploadFile]] = File(None),
+    jobs: JobRepository = Depends(get_job_repository)
+):
+    """
+    Submits many complaint/FRL pairs at once, either as a zip `archive` or as
+    repeated `complaints` and `frls` files paired in order. Creates one child
+    job per pair under a parent batch.
+    """
+    # 1. Stream the pairs to the batch's spool directory (never held in memory whole)
+    batch_id = str(uuid.uuid4())
+    max_bytes = settings.BATCH_MAX_UPLOAD_MB * 1024 * 1024
+    too_large = f"Upload is larger than {settings.BATCH_MAX_UPLOAD_MB} MB."
+    try:
+        if archive is not None:
+            zip_path = os.path.join(job_queue.spool_dir(batch_id), "upload.zip")
+            await uploads.spool_upload(archive, zip_path, max_bytes)
+            try:
+                names = await run_in_threadpool(batch_service.unpack_zip, zip_path, batch_id)
+            finally:
+                os.remove(zip_path)
+        elif complaints and frls:
+            names = pair_uploads(complaints, frls)
+            if len(names) > settings.BATCH_MAX_PAIRS:
+                raise HTTPException(status_code=400, detail=f"Batch has {len(names)} pairs; the limit is {settings.BATCH_MAX_PAIRS}.")
+            size = 0
+            for position, files in enumerate(zip(complaints, frls)):
+                for upload, path in zip(files, batch_service.spool_paths(batch_id, position)):
+                    if size >= max_bytes:
+                        raise uploads.UploadTooLarge(too_large)
+                    size += await uploads.spool_upload(upload, path, max_bytes - size)
+        else:
+            raise HTTPException(status_code=400, detail="Send either a zip 'archive' or matching 'complaints' and 'frls' files.")
+    except HTTPException:
+        job_queue.discard_spool(batch_id)
+        raise
+    except uploads.UploadTooLarge:
+        job_queue.discard_spool(batch_id)
+        raise HTTPException(status_code=413, detail=too_large)
+    except ValueError as e:
+        job_queue.discard_spool(batch_id)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        job_queue.discard_spool(batch_id)
+        raise HTTPException(status_code=500, detail=f"Failed to store uploads: {e}")
+
+    # 2. Create the child jobs in one insert
+    children = [{"position": position, "name": name, "job_id": str(uuid.uuid4())} for position, name in enumerate(names)]
+    try:
+        await jobs.create_many([child["job_id"] for child in children])
+    except Exception as e:
+        job_queue.discard_spool(batch_id)
+        raise HTTPException(status_code=500, detail=f"Failed to create jobs: {e}")
+    for child in children:
+        job_stats.safe_record_status(child["job_id"], "PENDING")
+
+    # 3. Record the batch and queue it as one unit
+    try:
+        await run_in_threadpool(batch_service.create_batch, batch_id, children)
+        if settings.JOB_WORKERS > 0:
+            await run_in_threadpool(job_queue.enqueue_batch, batch_id)
+    except Exception as e:
+        # The child rows exist already; don't leave them PENDING forever
+        job_ids = [child["job_id"] for child in children]
+        try:
+            await jobs.update_many(job_ids, {"status": "ERROR", "error_message": f"Failed to queue batch: {e}"})
+        except Exception as update_error:
+            print(f"Could not mark the jobs of batch {batch_id} as failed: {update_error}")
+        for job_id in job_ids:
+            job_stats.safe_record_status(job_id, "ERROR")
+        job_queue.discard_spool(batch_id)
+        raise HTTPException(status_code=500, detail=f"Failed to queue batch: {e}")
+    if settings.JOB_WORKERS == 0:
+        background_tasks.add_task(job_queue.run_batch_in_process, batch_id)
+
+    return {
+        "batch_id": batch_id,
+        "status": "PENDING",
+        "total": len(children),
+        "jobs": [{"name": child["name"], "job_id": child["job_id"]} for child in children],
+    }
+
+
+async def load_batch(batch_id: str) -> dict:
+    batch = await run_in_threadpool(batch_service.get_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+
+@router.get("/batch/{batch_id}", response_model=BatchProgress)
+async def get_batch_progress(request: Request, batch_id: str):
+    """Aggregate progress of a batch; poll with If-None-Match to get 304s while nothing changed."""
+    batch = await load_batch(batch_id)
+    progress = await run_in_threadpool(batch_service.batch_progress, batch)
+    return conditional_json_response(request, progress)
+
+
+def result_row(item: dict, job: dict) -> dict:
+    """One flat CSV row per child: outcome, confidence and summary from its report."""
+    report = job.get("report_data") or {}
+    predicted = report.get("predicted_fos_outcome")
+    if not isinstance(predicted, dict):
+        predicted = {"outcome": predicted}
+    summary = report.get("executive_summary")
+    return {
+        "name": item["name"],
+        "job_id": item["job_id"],
+        "status": job.get("status", "PENDING"),
+        "predicted_outcome": predicted.get("outcome") or "",
+        "confidence": predicted.get("confidence") or "",
+        "executive_summary": summary if isinstance(summary, str) else json.dumps(summary) if summary else "",
+        "error_message": job.get("error_message") or "",
+    }
+
+
+@router.get("/batch/{batch_id}/results")
+async def download_batch_results(
+    batch_id: str,
+    format: str = Query("json", pattern="^(json|csv)$"),
+    jobs: JobRepository = Depends(get_job_repository)
+):
+    """Every child's status and report as one JSON document, or a CSV summary with one row per pair."""
+    batch = await load_batch(batch_id)
+    rows = await jobs.get_many([item["job_id"] for item in batch["items"]], "job_id, status, report_data, error_message")
+    by_id = {row["job_id"]: row for row in rows}
+
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        for item in batch["items"]:
+            writer.writerow(result_row(item, by_id.get(item["job_id"], {})))
+        body, media_type = buffer.getvalue(), "text/csv"
+    else:
+        results = [{
+            "name": item["name"],
+            "job_id": item["job_id"],
+            "status": by_id.get(item["job_id"], {}).get("status", "PENDING"),
+            "report": by_id.get(item["job_id"], {}).get("report_data"),
+            "error_message": by_id.get(item["job_id"], {}).get("error_message"),
+        } for item in batch["items"]]
+        body, media_type = json.dumps({"batch_id": batch_id, "total": batch["total"], "results": results}), "application/json"
+
+    return Response(
+        content=body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id}.{format}"'}
+    )
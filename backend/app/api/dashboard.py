@@ -1,23 +1,54 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from app.models.schemas import DashboardStats, DashboardCase
-from app.services.supabase_client import supabase
+from app.core.etag import conditional_json_response
+from app.services.repository import JobRepository, get_job_repository
+from app.services import job_stats
+from app.core.config import settings
+import base64
+import binascii
 import json
+import uuid
+from datetime import datetime
 
 router = APIRouter()
 
+# Only what the summary cards need; never the complaint/FRL texts
+CASE_CARD_COLUMNS = "job_id, status, created_at, report_data"
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(job: dict) -> str:
+    return base64.urlsafe_b64encode(f"{job['created_at']}|{job['job_id']}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    The (created_at, job_id) keyset of a cursor. Both are parsed and
+    re-serialised, so nothing from the client reaches the PostgREST filter verbatim.
+    """
+    try:
+        created_at, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        created_at = datetime.fromisoformat(created_at)
+        job_id = uuid.UUID(job_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return created_at.isoformat(), str(job_id)
+
 @router.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats():
-    # This function is working correctly, no changes needed here.
+async def get_dashboard_stats(jobs: JobRepository = Depends(get_job_repository)):
     try:
-        open_complaints_res = supabase.table('jobs').select('*', count='exact').in_('status', ['PENDING', 'PROCESSING']).execute()
-        at_risk_res = supabase.table('jobs').select('*', count='exact').ilike('report_data->predicted_fos_outcome->>outcome', '%Upheld%').execute()
-        total_completed_res = supabase.table('jobs').select('*', count='exact').eq('status', 'COMPLETE').execute()
-        at_risk_count = at_risk_res.count
-        total_completed = total_completed_res.count
+        # O(1) read of this host's maintained counters; until reconcile_stats.py
+        # has run once (or with DASHBOARD_USE_COUNTERS off), fall back to three
+        # concurrent count queries with the same definitions
+        counters = job_stats.get_counters() if settings.DASHBOARD_USE_COUNTERS else None
+        if counters is not None:
+            counts = job_stats.dashboard_counts(counters)
+        else:
+            counts = await jobs.dashboard_counts()
+        at_risk_count = counts['at_risk']
+        total_completed = counts['completed']
         predicted_uphold_percent = int((at_risk_count / total_completed) * 100) if total_completed > 0 else 0
 
         return {
-            "open_complaints": open_complaints_res.count,
+            "open_complaints": counts['open'],
             "at_risk_fos": at_risk_count,
             "predicted_uphold": predicted_uphold_percent,
             "avg_frl_readability": "Grade 8.2",
@@ -28,10 +59,15 @@ async def get_dashboard_stats():
         raise HTTPException(status_code=500, detail="Could not fetch dashboard statistics.")
 
 @router.get("/dashboard/cases", response_model=list[DashboardCase])
-async def get_dashboard_cases():
+async def get_dashboard_cases(
+    request: Request,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None, description="X-Next-Cursor value from the previous page"),
+    jobs: JobRepository = Depends(get_job_repository)
+):
+    before = decode_cursor(cursor) if cursor else None
     try:
-        res = supabase.table('jobs').select('*').order('created_at', desc=True).limit(10).execute()
-        db_jobs = res.data
+        db_jobs = await jobs.list_recent(limit=limit, columns=CASE_CARD_COLUMNS, before=before)
         dashboard_cases = []
 
         for job in db_jobs:
@@ -79,8 +115,12 @@ async def get_dashboard_cases():
                 topActions=[recommendations] if isinstance(recommendations, str) else recommendations
             )
             dashboard_cases.append(case)
-            
-        return dashboard_cases
+
+        # The body stays a plain list; the cursor for the next page travels in a header
+        headers = {}
+        if len(db_jobs) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(db_jobs[-1])
+        return conditional_json_response(request, dashboard_cases, headers)
     except Exception as e:
         print(f"Error fetching dashboard cases: {e}")
         raise HTTPException(status_code=500, detail="Could not fetch recent cases.")
\ No newline at end of file
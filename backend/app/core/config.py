@@ -5,7 +5,166 @@ class Settings(BaseSettings):
     SUPABASE_SERVICE_KEY: str
     GEMINI_API_KEY: str
 
+    # Pooled async HTTP client used by the API routes for Supabase calls
+    SUPABASE_TIMEOUT_SECONDS: float = 10.0
+    SUPABASE_MAX_CONNECTIONS: int = 20
+
+    # Local precedent index built by ingest_data.py (falls back to the
+    # hybrid_search RPC when the directory does not exist). An index that is
+    # rebuilt is reopened, and the old one is closed LOCAL_INDEX_CLOSE_DELAY_SECONDS
+    # later, once searches already using it have finished
+    PRECEDENT_INDEX_DIR: str = "precedent_index"
+    PRECEDENT_INDEX_QUANTIZE: bool = False
+    LOCAL_INDEX_CLOSE_DELAY_SECONDS: float = 60.0
+
+    # Packed knowledge-base corpus (build_corpus_pack.py): ingest_data.py --pack
+    # reads documents from it, and the pipeline fetches precedent full texts
+    # from it by case_id when retrieval did not return them (a rebuilt pack is
+    # reopened like the indexes, see LOCAL_INDEX_CLOSE_DELAY_SECONDS)
+    CORPUS_PACK_PATH: str = "knowledge_base.pack"
+
+    # Passage-level retrieval: decisions are split into overlapping passages
+    # at ingest time and the pipeline retrieves the best passages per case
+    PASSAGE_INDEX_DIR: str = "passage_index"
+    PASSAGE_MAX_WORDS: int = 180
+    PASSAGE_OVERLAP_WORDS: int = 40
+    PASSAGE_MATCH_COUNT: int = 15
+    PRECEDENT_CASE_COUNT: int = 5
+
+    # Hybrid retrieval: the vector ranking and a BM25 ranking over the local
+    # index's texts (each HYBRID_CANDIDATES deep) merged by reciprocal rank fusion
+    HYBRID_RETRIEVAL: bool = True
+    HYBRID_CANDIDATES: int = 50
+    RRF_K: int = 60
+
+    # Complaint/decision metadata (product, themes, firm, outcome, amounts) is
+    # extracted with the spaCy tokenizer, phrase matchers and rules; NER only
+    # runs as a fallback for the firm. Batches go through nlp.pipe with
+    # NLP_BATCH_SIZE texts per batch and NLP_N_PROCESS processes
+    NLP_MODEL_NAME: str = "en_core_web_sm"
+    NLP_BATCH_SIZE: int = 32
+    NLP_N_PROCESS: int = 1
+
+    # Sentence embeddings: EMBEDDING_BACKEND is "torch" (reference), "torch-int8"
+    # (dynamically quantized) or "onnx" (ONNX Runtime, EMBEDDING_ONNX_FILE picks
+    # the exported graph). EMBEDDING_THREADS = 0 keeps the library's thread
+    # count. With dynamic batching, concurrent encode calls in one process are
+    # merged into batches of up to EMBEDDING_MAX_BATCH texts; it only applies
+    # when jobs run in the API process (JOB_WORKERS = 0), since worker
+    # processes encode for one job at a time
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_FILE: str = "onnx/model.onnx"
+    EMBEDDING_THREADS: int = 0
+    EMBEDDING_DYNAMIC_BATCHING: bool = True
+    EMBEDDING_MAX_BATCH: int = 64
+    EMBEDDING_BATCH_WAIT_MS: float = 5.0
+
+    # Master prompt token budget and the share of it given to the complaint and
+    # FRL (precedents get the rest; unused shares are redistributed)
+    PROMPT_TOKEN_BUDGET: int = 12000
+    PROMPT_COMPLAINT_SHARE: float = 0.35
+    PROMPT_FRL_SHARE: float = 0.25
+
+    # Gemini model and the (model, prompt hash) response cache; an empty
+    # LLM_CACHE_DIR disables the on-disk tier
+    GEMINI_MODEL_NAME: str = "models/gemini-2.5-flash-preview-05-20"
+    LLM_CACHE_MAX_ENTRIES: int = 512
+    LLM_CACHE_TTL_SECONDS: int = 86400
+    LLM_CACHE_DIR: str = ""
+
+    # LLM gateway: "gemini" or "fake" (local stand-in with LLM_FAKE_LATENCY_SECONDS),
+    # concurrency cap, per-process quota buckets, retries, timeout and hedging
+    # (LLM_HEDGE_AFTER_SECONDS = 0 disables hedged requests)
+    LLM_BACKEND: str = "gemini"
+    LLM_FAKE_LATENCY_SECONDS: float = 0.5
+    LLM_MAX_IN_FLIGHT: int = 4
+    LLM_REQUESTS_PER_MINUTE: float = 60
+    LLM_TOKENS_PER_MINUTE: float = 1000000
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BACKOFF_SECONDS: float = 1.0
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    LLM_HEDGE_AFTER_SECONDS: float = 0.0
+
+    # Stream the report from Gemini, publishing (and optionally persisting)
+    # each top-level key as it completes; malformed output is repaired
+    # locally first and otherwise re-asked up to LLM_REPAIR_ATTEMPTS times. A
+    # stream that breaks after its first chunk is restarted up to
+    # LLM_STREAM_RESTARTS times (earlier failures are retried by the gateway)
+    LLM_STREAMING: bool = True
+    LLM_PERSIST_PARTIAL_REPORT: bool = True
+    LLM_REPAIR_ATTEMPTS: int = 1
+    LLM_STREAM_RESTARTS: int = 2
+
+    # /api/analyze uploads are streamed to the spool directory in
+    # UPLOAD_CHUNK_KB chunks and rejected past UPLOAD_MAX_MB per file; the
+    # complaint and FRL are then extracted in parallel in a pool of
+    # EXTRACT_PROCESSES processes per API/worker process (0 = in-thread)
+    UPLOAD_MAX_MB: int = 50
+    UPLOAD_CHUNK_KB: int = 1024
+    EXTRACT_PROCESSES: int = 2
+
+    # Durable job queue (SQLite + spooled uploads) and its worker processes;
+    # JOB_WORKERS = 0 runs jobs in-process with FastAPI BackgroundTasks
+    JOB_QUEUE_PATH: str = "data/job_queue.db"
+    JOB_SPOOL_DIR: str = "data/spool"
+    JOB_WORKERS: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    # A claimed job is re-queued once its worker has not renewed the claim for
+    # this long (the worker or the whole API process died)
+    JOB_LEASE_SECONDS: float = 60.0
+    # Retries of the non-LLM pipeline stages; LLM calls are retried only by the
+    # gateway (LLM_MAX_RETRIES)
+    PIPELINE_STAGE_RETRIES: int = 2
+    PIPELINE_RETRY_BACKOFF_SECONDS: float = 1.0
+
+    # Bulk analysis (/api/batch): limits on a submission, how many children are
+    # processed together (one nlp.pipe / encode / retrieval pass per chunk) and
+    # how many of a chunk's LLM calls run at once
+    BATCH_MAX_PAIRS: int = 500
+    BATCH_MAX_UPLOAD_MB: int = 500
+    BATCH_CHUNK_SIZE: int = 32
+    BATCH_EMBED_BATCH_SIZE: int = 32
+    BATCH_LLM_CONCURRENCY: int = 4
+
+    # Write-behind coalescing of job row updates; durability is one of
+    # "always", "terminal" (COMPLETE/ERROR written through) or "interval".
+    # A flush PATCHes each job's row, JOB_STATE_FLUSH_CONCURRENCY at a time
+    JOB_STATE_FLUSH_INTERVAL_SECONDS: float = 0.5
+    JOB_STATE_BATCH_SIZE: int = 50
+    JOB_STATE_DURABILITY: str = "terminal"
+    JOB_STATE_FLUSH_CONCURRENCY: int = 8
+
+    # Load and exercise the models in the background at startup when jobs run
+    # in-process (worker processes always warm up before claiming jobs)
+    MODEL_WARMUP: bool = True
+
+    # Prometheus-style /metrics, per-stage spans and per-job timings stored in
+    # report_data["timings"]; disabling makes the instrumentation a no-op
+    METRICS_ENABLED: bool = True
+
+    # Reuse the report of an earlier job whose complaint/FRL texts are the same
+    # or nearly the same (MinHash similarity >= DEDUP_THRESHOLD) instead of
+    # re-running the analysis; rebuild the index with rebuild_dedup_index.py
+    DEDUP_ENABLED: bool = True
+    DEDUP_INDEX_PATH: str = "data/dedup_index.db"
+    DEDUP_THRESHOLD: float = 0.9
+    DEDUP_NUM_PERM: int = 128
+    DEDUP_BANDS: int = 32
+    DEDUP_SHINGLE_SIZE: int = 5
+
+    # Incrementally maintained dashboard counters (rebuild with reconcile_stats.py).
+    # They are local to each host; with several API hosts set
+    # DASHBOARD_USE_COUNTERS = false so the dashboard counts in Supabase instead
+    JOB_STATS_PATH: str = "data/job_stats.db"
+    DASHBOARD_USE_COUNTERS: bool = True
+
+    # Per-job progress events streamed over SSE (bounded buffer per job)
+    JOB_EVENT_BUFFER_SIZE: int = 50
+    JOB_EVENT_MAX_JOBS: int = 1000
+
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,25 @@
+import hashlib
+import json
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+
+def etag_for(payload) -> str:
+    """Weak ETag derived from the JSON body, so any change in the data changes the tag."""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return f'W/"{hashlib.sha1(body.encode("utf-8")).hexdigest()}"'
+
+
+def conditional_json_response(request: Request, payload, headers: dict = None) -> Response:
+    """
+    Returns 304 Not Modified when the client's If-None-Match already matches the
+    payload, otherwise the JSON payload with its ETag. Lets polling clients
+    revalidate without downloading the body again.
+    """
+    etag = etag_for(payload)
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(payload), headers=headers)
@@ -0,0 +1,178 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters and histograms live in this module's registry. Durations arrive
+through the timing hooks (`app.core.timing`): every `timed(...)` span is
+turned into a histogram observation (and an error count when the span
+raised). Everything else (tokens, cache hits, retries) is counted directly.
+
+Worker processes keep their own registry and periodically send a
+`snapshot()` to the API process, which merges them into `/metrics`.
+
+With METRICS_ENABLED=false no listener is registered and every `inc` or
+`observe` returns immediately.
+"""
+import threading
+from bisect import bisect_left
+from app.core.config import settings
+from app.core import timing
+
+ENABLED = settings.METRICS_ENABLED
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 12000, 16000, 32000, 64000)
+
+REGISTRY = []
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (the last slot is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+
+# --- Metric definitions ---
+JOB_DURATION = Histogram("complai_job_duration_seconds", "End-to-end analysis pipeline duration.", ("outcome",))
+STAGE_DURATION = Histogram("complai_stage_duration_seconds", "Duration of each analysis pipeline stage.", ("stage",))
+STAGE_ERRORS = Counter("complai_stage_errors_total", "Spans that raised, by stage.", ("stage",))
+STAGE_RETRIES = Counter("complai_stage_retries_total", "Pipeline stage retries.", ("stage",))
+QUEUE_WAIT = Histogram("complai_queue_wait_seconds", "Time jobs spent queued before a worker claimed them.")
+SUPABASE_DURATION = Histogram("complai_supabase_request_seconds", "Supabase request latency.", ("operation",))
+LLM_CALL_DURATION = Histogram("complai_llm_call_seconds", "LLM call latency.", ("kind", "ok"))
+LLM_TOKENS = Counter("complai_llm_tokens_total", "LLM tokens by direction.", ("direction",))
+PROMPT_TOKENS = Histogram("complai_prompt_tokens", "Estimated master prompt size.", buckets=TOKEN_BUCKETS)
+LLM_CACHE_LOOKUPS = Counter("complai_llm_cache_lookups_total", "LLM response cache lookups.", ("result",))
+EMBEDDING_BATCH_TEXTS = Histogram("complai_embedding_batch_texts", "Texts per dynamically batched embedding call.",
+                                  buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+DEDUP_LOOKUPS = Counter("complai_dedup_lookups_total", "Duplicate submission lookups (exact, near, stale, miss).", ("result",))
+HTTP_DURATION = Histogram("complai_http_request_seconds", "API request latency.", ("method", "route", "status"))
+
+# Span names (from timing.timed/record) that feed a histogram other than STAGE_DURATION
+_SPAN_HISTOGRAMS = {
+    "job": (JOB_DURATION, ("outcome",)),
+    "queue_wait": (QUEUE_WAIT, ()),
+    "supabase": (SUPABASE_DURATION, ("operation",)),
+    "llm_call": (LLM_CALL_DURATION, ("kind", "ok")),
+}
+
+
+def _observe_span(stage: str, seconds: float, labels: dict):
+    histogram, labelnames = _SPAN_HISTOGRAMS.get(stage, (STAGE_DURATION, None))
+    if labelnames is None:
+        histogram.observe(seconds, stage=stage)
+    else:
+        histogram.observe(seconds, **{name: labels.get(name, "") for name in labelnames})
+    if labels.get("error"):
+        STAGE_ERRORS.inc(stage=f"supabase:{labels.get('operation', '')}" if stage == "supabase" else stage)
+
+
+if ENABLED:
+    timing.add_listener(_observe_span)
+
+
+# --- Snapshots (for worker processes) and exposition ---
+def snapshot() -> dict:
+    """JSON-serialisable copy of every metric's current values."""
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def merge(target: dict, other: dict) -> dict:
+    """Adds the values of snapshot `other` into snapshot `target` (in place) and returns it."""
+    kinds = {metric.name: metric.kind for metric in REGISTRY}
+    for name, series in other.items():
+        merged = {tuple(key): value for key, value in target.get(name, [])}
+        for key, value in series:
+            key = tuple(key)
+            if key not in merged:
+                merged[key] = value
+            elif kinds.get(name) == "histogram":
+                merged[key] = [[a + b for a, b in zip(merged[key][0], value[0])], merged[key][1] + value[1]]
+            else:
+                merged[key] += value
+        target[name] = [[list(key), value] for key, value in merged.items()]
+    return target
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render(extra_snapshots=()) -> str:
+    """Prometheus text format for this process's metrics plus any worker snapshots."""
+    combined = snapshot()
+    for other in extra_snapshots:
+        merge(combined, other)
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(combined.get(metric.name, []), key=lambda item: item[0]):
+            if metric.kind == "counter":
+                lines.append(f"{metric.name}{_labels(metric.labelnames, key)} {value:g}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _labels(metric.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{metric.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labelnames, key)} {total:g}")
+            lines.append(f"{metric.name}_count{_labels(metric.labelnames, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
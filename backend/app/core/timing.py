@@ -0,0 +1,76 @@
+"""
+Stage timing hooks.
+
+Code wraps a unit of work in `timed(stage)` (or reports a measured duration
+with `record`); every listener registered with `add_listener` is called with
+(stage, seconds, labels), where labels include error=True if the span raised.
+Inside `trace()` the spans of the current thread are also collected, which is
+how a job's own timings are stored with its report. With no listeners and no
+active trace, `timed` does no clock reads at all.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+_listeners = []
+_local = threading.local()
+
+
+def add_listener(listener):
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def record(stage: str, seconds: float, **labels):
+    for listener in _listeners:
+        try:
+            listener(stage, seconds, labels)
+        except Exception as e:
+            print(f"Timing listener failed for stage '{stage}': {e}")
+
+
+@contextmanager
+def trace(enabled: bool = True):
+    """Collects the spans timed on this thread; yields the list (None when disabled)."""
+    if not enabled:
+        yield None
+        return
+    previous = getattr(_local, "trace", None)
+    spans = []
+    _local.trace = (spans, time.perf_counter())
+    try:
+        yield spans
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def timed(stage: str, **labels):
+    active = getattr(_local, "trace", None)
+    if not _listeners and active is None:
+        yield
+        return
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        if active is not None:
+            spans, origin = active
+            span = {"stage": stage, "start": round(started - origin, 4), "seconds": round(seconds, 4)}
+            if labels:
+                span.update(labels)
+            if failed:
+                span["error"] = True
+            spans.append(span)
+        if failed:
+            labels = {**labels, "error": True}
+        record(stage, seconds, **labels)
@@ -1,11 +1,41 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import threading
+import time
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, analysis, dashboard
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api import auth, analysis, dashboard, batch
+from app.core.config import settings
+from app.core import metrics
+from app.services import job_queue
+from app.services import analysis_service
+from app.services import pdf_text
+from app.services.repository import close_http_client
+from app.services.job_writer import flush_on_exit as flush_job_state
+
+STARTED_AT = time.time()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the analysis worker pool (re-queues jobs orphaned by the last shutdown);
+    # workers load their models before claiming jobs
+    job_queue.start_worker_pool()
+    # Without workers jobs run in this process: warm up in the background so
+    # startup stays fast and /ready reports when the models are loaded
+    if settings.JOB_WORKERS == 0 and settings.MODEL_WARMUP:
+        threading.Thread(target=analysis_service.warm_up_models, daemon=True).start()
+    yield
+    job_queue.stop_worker_pool()
+    pdf_text.shutdown()
+    # Jobs run in-process (JOB_WORKERS=0) may still have buffered state
+    flush_job_state()
+    await close_http_client()
 
 app = FastAPI(
     title="ComplAI SMART PREDICT API",
     description="API for AI-driven financial complaint analysis.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 origins = [
@@ -21,13 +51,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+if metrics.ENABLED:
+    @app.middleware("http")
+    async def record_request_duration(request: Request, call_next):
+        started = time.perf_counter()
+        response = await call_next(request)
+        # Label by route template, not the raw path, to keep the series count bounded
+        route = request.scope.get("route")
+        metrics.HTTP_DURATION.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(response.status_code)
+        )
+        return response
+
 # Include API routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(analysis.router, prefix="/api", tags=["Analysis"])
 app.include_router(dashboard.router, prefix="/api", tags=["Dashboard"])
+app.include_router(batch.router, prefix="/api", tags=["Batch"])
 
 @app.get("/", tags=["Root"])
 async def read_root():
-    return {"message": "Welcome to the ComplAI SMART PREDICT API"}
\ No newline at end of file
+    return {"message": "Welcome to the ComplAI SMART PREDICT API"}
+
+@app.get("/ready", tags=["Root"])
+async def readiness():
+    """Readiness probe: 200 once models are loaded where jobs run, 503 until then."""
+    if settings.JOB_WORKERS > 0:
+        workers = job_queue.worker_readiness()
+        ready = any(worker.get("ready") for worker in workers.values())
+        body = {"ready": ready, "mode": "worker_pool", "workers": workers}
+    else:
+        ready = analysis_service.models_ready()
+        body = {"ready": ready, "mode": "in_process", "models": analysis_service.model_status}
+    body["uptime_seconds"] = round(time.time() - STARTED_AT, 1)
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@app.get("/metrics", tags=["Root"])
+async def prometheus_metrics():
+    """Prometheus text exposition for this process and the analysis workers."""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(
+        metrics.render(job_queue.worker_metrics_snapshots()),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -40,4 +40,26 @@ class DashboardCase(BaseModel):
     due: str
     summary: Optional[str] = "Not yet analyzed."
     riskFactors: Optional[List[str]] = []
-    topActions: Optional[List[str]] = [] # This field was missing
\ No newline at end of file
+    topActions: Optional[List[str]] = [] # This field was missing
+
+# --- Batch Schemas ---
+class BatchChild(BaseModel):
+    name: str
+    job_id: str
+
+class BatchSubmissionResponse(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    jobs: List[BatchChild]
+
+class BatchChildStatus(BatchChild):
+    status: str
+
+class BatchProgress(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    counts: Dict[str, int]
+    progress: float
+    items: List[BatchChildStatus]
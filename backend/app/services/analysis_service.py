@@ -1,155 +1,531 @@
-import fitz # PyMuPDF
-import spacy
-import google.generativeai as genai
-from sentence_transformers import SentenceTransformer
+# Heavy libraries (PyMuPDF, spaCy, the embedding backend) are imported on
+# first use, so importing the API stays fast; warm_up_models() pays that cost
+# up front in the lifespan or in each worker process.
 from app.services.supabase_client import supabase
+from app.services.precedent_index import PrecedentIndex
+from app.services.corpus_pack import CorpusPack
+from app.services.prompt_builder import assemble_prompt, build_reask_prompt, REPORT_KEYS
+from app.services.json_stream import TopLevelObjectParser, repair_json
+from app.services.llm_cache import llm_cache
+from app.services.llm_gateway import get_gateway, with_stream_restarts
+from app.services import job_stats
+from app.services import job_events
+from app.services.dedup_index import duplicate_index
+from app.services.metadata_extractor import MetadataExtractor, filter_themes
+from app.services.embedding_backends import create_embedder, model_key
+from app.services import pdf_text
+from app.services.job_writer import writer as job_writer
 from app.core.config import settings
+from app.core.timing import timed, trace, record
+from app.core import metrics
 import json
+import os
+import random
+import threading
+import time
 
 # --- INITIALIZE MODELS AND API ---
 
-_nlp = None
+_extractor = None
 _embedding_model = None
-def get_nlp_model():
-    """Loads the spaCy model once and caches it."""
-    global _nlp
-    if _nlp is None:
-        print("Loading spaCy model for the first time...")
-        _nlp = spacy.load("en_core_web_sm")
-        print("spaCy model loaded.")
-    return _nlp
+_model_lock = threading.Lock()
+_indexes = {}
+_corpus = None  # (CorpusPack, mtime)
+_reload_lock = threading.Lock()
+# Per-model load state for the readiness probe
+model_status = {
+    name: {"status": "not_loaded", "load_seconds": None, "error": None}
+    for name in ("pdf", "spacy", "embedding")
+}
+
+def _load_model(name: str, load):
+    """Runs `load()` once under the model lock, recording status and load time."""
+    status = model_status[name]
+    status.update(status="loading", error=None)
+    started = time.perf_counter()
+    try:
+        model = load()
+    except Exception as e:
+        status.update(status="error", error=str(e))
+        raise
+    status.update(status="ready", load_seconds=round(time.perf_counter() - started, 3))
+    return model
+
+def get_metadata_extractor():
+    """Loads the spaCy model (tokenizer and NER only) and its metadata matchers once and caches them."""
+    global _extractor
+    if _extractor is None:
+        with _model_lock:
+            if _extractor is None:
+                print("Loading spaCy model for the first time...")
+                _extractor = _load_model("spacy", lambda: MetadataExtractor.load(settings.NLP_MODEL_NAME))
+                print("spaCy model loaded.")
+    return _extractor
 
 def get_embedding_model():
-    """Loads the SentenceTransformer model once and caches it."""
+    """Loads the embedding backend (EMBEDDING_BACKEND) once and caches it."""
     global _embedding_model
     if _embedding_model is None:
-        print("Loading SentenceTransformer model for the first time...")
-        _embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("SentenceTransformer model loaded.")
+        with _model_lock:
+            if _embedding_model is None:
+                print(f"Loading {settings.EMBEDDING_BACKEND} embedding model for the first time...")
+                _embedding_model = _load_model("embedding", create_embedder)
+                print("Embedding model loaded.")
     return _embedding_model
 
-def extract_text(file_data: bytes) -> str:
-    """Extracts text from a file-like object (PDF)."""
-    text = ""
-    # PyMuPDF needs a file path or a bytes stream
-    with fitz.open(stream=file_data, filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
+def warm_up_models() -> dict:
+    """
+    Loads every model the pipeline uses and runs one dummy inference through
+    each, so the first real job pays no load or first-call costs. Returns model_status.
+    """
+    started = time.perf_counter()
+    try:
+        _load_model("pdf", lambda: __import__("fitz"))
+        get_metadata_extractor().extract("Warm-up sentence for the complaint analysis pipeline.")
+        get_embedding_model().encode(["Warm-up sentence for the complaint analysis pipeline."])
+        print(f"Models warmed up in {time.perf_counter() - started:.1f}s.")
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+    return model_status
+
+def models_ready() -> bool:
+    return all(status["status"] == "ready" for status in model_status.values())
 
-def run_analysis_pipeline(job_id: str, complaint_file_data: bytes, frl_file_data: bytes):
-    """The main AI analysis pipeline."""
+def _retire(resource):
+    """
+    Closes a replaced index or corpus pack after LOCAL_INDEX_CLOSE_DELAY_SECONDS,
+    when readers that picked it up are done with it.
+    """
+    timer = threading.Timer(settings.LOCAL_INDEX_CLOSE_DELAY_SECONDS, resource.close)
+    timer.daemon = True
+    timer.start()
+
+def get_local_index(index_dir: str):
+    """Opens a local index, reopening it when it has been rebuilt. Returns None if missing."""
+    meta_path = os.path.join(index_dir, "meta.json")
     try:
-        nlp = get_nlp_model()
-        embedding_model = get_embedding_model()
-        genai.configure(api_key=settings.GEMINI_API_KEY)
+        mtime = os.path.getmtime(meta_path)
+    except OSError:
+        removed = _indexes.pop(index_dir, None)
+        if removed is not None:
+            _retire(removed[0])
+        return None
+    cached = _indexes.get(index_dir)
+    if cached is None or cached[1] != mtime:
+        with _reload_lock:
+            previous = _indexes.get(index_dir)
+            if previous is not None and previous[1] == mtime:
+                return previous[0]
+            print(f"Loading local index from '{index_dir}'...")
+            cached = (PrecedentIndex(index_dir), mtime)
+            _indexes[index_dir] = cached
+            if previous is not None:
+                _retire(previous[0])
+        print(f"Local index loaded ({len(cached[0])} rows).")
+        if cached[0].meta.get("model") != model_key():
+            print(f"WARNING: '{index_dir}' was built with {cached[0].meta.get('model')} embeddings but queries use "
+                  f"{model_key()}; re-run ingest_data.py to rebuild it.")
+    return cached[0]
 
+def get_precedent_index():
+    """Whole-decision index built by ingest_data.py."""
+    return get_local_index(settings.PRECEDENT_INDEX_DIR)
 
-        # 1. Update job status to PROCESSING
-        supabase.table('jobs').update({'status': 'PROCESSING'}).eq('job_id', job_id).execute()
+def get_passage_index():
+    """Passage-level index built by ingest_data.py."""
+    return get_local_index(settings.PASSAGE_INDEX_DIR)
 
-        # 2. Extract text from documents
-        complaint_text = extract_text(complaint_file_data)
-        frl_text = extract_text(frl_file_data)
+def get_corpus():
+    """Opens the packed corpus, reopening it when it has been rebuilt. Returns None if missing."""
+    global _corpus
+    try:
+        mtime = os.path.getmtime(settings.CORPUS_PACK_PATH)
+    except OSError:
+        with _reload_lock:
+            if _corpus is not None:
+                _retire(_corpus[0])
+            _corpus = None
+        return None
+    cached = _corpus
+    if cached is None or cached[1] != mtime:
+        with _reload_lock:
+            previous = _corpus
+            if previous is not None and previous[1] == mtime:
+                return previous[0]
+            cached = _corpus = (CorpusPack(settings.CORPUS_PACK_PATH), mtime)
+            if previous is not None:
+                _retire(previous[0])
+        print(f"Corpus pack loaded ({len(cached[0])} documents).")
+    return cached[0]
 
-        supabase.table('jobs').update({
-            'complaint_text': complaint_text,
-            'frl_text': frl_text
-        }).eq('job_id', job_id).execute()
+def precedent_text(case_id: str):
+    """Full decision text for a case_id from the packed corpus, or None."""
+    corpus = get_corpus()
+    return corpus.get(case_id) if corpus is not None else None
 
-        # 3. NLP: Extract keywords/entities for filtering
-        doc = nlp(complaint_text)
-        # Simplified extraction logic
-        product_type = "Personal Loan" # Placeholder
-        key_themes = ["Affordability"] # Placeholder
-        # In a real app, you would have a more robust system for this.
+def lexical_options(query_text) -> dict:
+    """search() arguments that fuse BM25 with the vector ranking, when enabled."""
+    if not settings.HYBRID_RETRIEVAL or not query_text:
+        return {}
+    return {'query_text': query_text, 'candidates': settings.HYBRID_CANDIDATES, 'rrf_k': settings.RRF_K}
 
-        # 4. Generate embedding for the new complaint
-        complaint_embedding = embedding_model.encode(complaint_text).tolist()
+def retrieve_precedents(query_embedding: list, product_type: str, key_themes: list, match_count: int = 5,
+                        query_text: str = None) -> list:
+    """Finds similar precedents in the local index, falling back to the hybrid_search RPC."""
+    index = get_precedent_index()
+    if index is not None:
+        return index.search(query_embedding, k=match_count, product_type=product_type, key_themes=key_themes,
+                            fields=("full_text", "digest"), **lexical_options(query_text))
 
-        # 5. Hybrid Search: Find top 5 similar precedents
-        similar_cases = supabase.rpc('hybrid_search', {
-            'query_embedding': complaint_embedding,
+    with timed('supabase', operation='rpc:hybrid_search'):
+        result = supabase.rpc('hybrid_search', {
+            'query_embedding': query_embedding,
             'p_product_type': product_type,
             'p_key_themes': key_themes,
-            'match_count': 5
+            'match_count': match_count
         }).execute()
-        
-        precedent_context = "\n\n---\n\n".join([
-            f"Precedent Case ID: {case['case_id']}\n\n{case['full_text']}"
-            for case in similar_cases.data
-        ])
-
-        # ... (keep all the code before the master_prompt)
-
-        # 6. Construct Master Prompt for Gemini
-        master_prompt = f"""
-        **Role:** You are an expert Financial Ombudsman Service (FOS) case analyst. Your task is to provide a detailed, structured compliance and risk assessment report.
-
-        **Input Documents:**
-        1.  **Customer Complaint:**
-            ```
-            {complaint_text}
-            ```
-
-        2.  **Firm's Final Response Letter (FRL):**
-            ```
-            {frl_text}
-            ```
-
-        3.  **Relevant Historical Precedents:**
-            ```
-            {precedent_context}
-            ```
-
-        **Task:**
-        Analyze the provided documents and generate a JSON object with the following 8 keys. Do not include any text outside of the JSON object.
-
-        1.  `case_summary`: A concise summary of the customer's complaint as a single string.
-        2.  `frl_compliance_checks`: An array of objects, each with 'item' (e.g., "Clarity", "Timeliness"), 'compliant' (true/false), and a 'reason' string.
-        3.  `historical_precedent_analysis`: **An array of strings.** Each string must be a single bullet point. For each point, you MUST cite the relevant Case ID (e.g., "DRN0060527") that supports your analysis.
-        4.  `key_risk_indicators`: **An array of strings.** Each string must be a single, concise bullet point identifying a key compliance or conduct risk.
-        5.  `predicted_fos_outcome`: **This field is MANDATORY.** You MUST provide a prediction. Generate an object with two keys: a 'outcome' string (e.g., "Likely to be Upheld", "Likely to be Rejected", "50/50 - Unclear") and a 'confidence' string (e.g., "85%", "70%", "50%"). Do NOT return "Not predicted" or "N/A".
-        6.  `financial_impact_assessment`: An object with a 'low_estimate' and 'high_estimate' of the potential financial impact.
-        7.  `recommendations`: A single string with specific, actionable steps the firm should take.
-        8.  `executive_summary`: A high-level, 3-sentence summary as a single string.
-
-        **Output Format:** Respond with only a valid JSON object.
-        """
-        
-# ... (keep all the code after the master_prompt)
-        
-        # 7. Call Generative LLM
-        model = genai.GenerativeModel('models/gemini-2.5-flash-preview-05-20')
-        response = model.generate_content(master_prompt)
-        
-        # --- THIS IS THE FIX ---
-        # Instead of a simple strip, find the start and end of the JSON object
-        raw_text = response.text
+    return result.data
+
+def retrieve_passages(query_embedding: list, product_type: str, key_themes: list,
+                      match_count: int = None, case_count: int = None, query_text: str = None):
+    """
+    Finds the most relevant precedent passages across all cases and groups them
+    by case_id. Returns [{'case_id', 'similarity', 'passages'}] ordered by each
+    case's best passage, or None when there is no local passage index. With
+    `query_text` the vector ranking is fused with BM25 over the passage texts.
+    """
+    index = get_passage_index()
+    if index is None:
+        return None
+    matches = index.search(
+        query_embedding,
+        k=match_count or settings.PASSAGE_MATCH_COUNT,
+        product_type=product_type,
+        key_themes=key_themes,
+        fields=("text",),
+        **lexical_options(query_text)
+    )
+    return group_passages(matches, case_count)
+
+def group_passages(matches: list, case_count: int = None) -> list:
+    """Groups passage matches by case_id, ordered by each case's best passage."""
+    cases = {}
+    for match in matches:
+        case = cases.setdefault(match['case_id'], {'case_id': match['case_id'], 'similarity': match['similarity'], 'passages': []})
+        case['passages'].append(match)
+    grouped = list(cases.values())[:case_count or settings.PRECEDENT_CASE_COUNT]
+    for case in grouped:
+        case['passages'].sort(key=lambda passage: passage['passage_index'])
+    return grouped
+
+def retrieve_precedent_material(complaint_embedding: list, product_type: str, key_themes: list,
+                                complaint_text: str = None) -> list:
+    """
+    Returns the precedents for the prompt as [{'case_id', 'digest', 'passages', 'full_text'}],
+    preferring retrieved passages plus stored digests over full decisions.
+    """
+    grouped = retrieve_passages(complaint_embedding, product_type, key_themes, query_text=complaint_text)
+    if grouped is not None:
+        return material_from_passages(grouped)
+
+    similar_cases = retrieve_precedents(complaint_embedding, product_type, key_themes,
+                                        match_count=settings.PRECEDENT_CASE_COUNT, query_text=complaint_text)
+    return material_from_cases(similar_cases)
+
+def material_from_passages(grouped: list) -> list:
+    precedent_index = get_precedent_index()
+    return [
+        {
+            'case_id': case['case_id'],
+            'digest': precedent_index.get_text_by_id(case['case_id'], 'digest') if precedent_index else None,
+            'passages': [f"[{passage['section']}] {passage['text']}" for passage in case['passages']],
+        }
+        for case in grouped
+    ]
+
+def material_from_cases(similar_cases: list) -> list:
+    return [
+        {'case_id': case['case_id'], 'digest': case.get('digest'),
+         'full_text': case.get('full_text') or (None if case.get('digest') else precedent_text(case['case_id']))}
+        for case in similar_cases
+    ]
+
+def retrieve_precedent_material_many(embeddings: list, filters: list, complaint_texts: list = None) -> list:
+    """
+    retrieve_precedent_material for a batch of complaints: one matrix product
+    per local index instead of one search per complaint. `filters` holds a
+    (product_type, key_themes) pair per embedding. Without local indexes each
+    complaint falls back to its own hybrid_search RPC.
+    """
+    options = {}
+    if settings.HYBRID_RETRIEVAL and complaint_texts:
+        options = {'query_texts': complaint_texts, 'candidates': settings.HYBRID_CANDIDATES, 'rrf_k': settings.RRF_K}
+    complaint_texts = complaint_texts or [None] * len(embeddings)
+    passage_index = get_passage_index()
+    if passage_index is not None:
+        results = passage_index.search_many(embeddings, k=settings.PASSAGE_MATCH_COUNT, filters=filters,
+                                            fields=("text",), **options)
+        return [material_from_passages(group_passages(matches)) for matches in results]
+
+    precedent_index = get_precedent_index()
+    if precedent_index is not None:
+        results = precedent_index.search_many(embeddings, k=settings.PRECEDENT_CASE_COUNT, filters=filters,
+                                              fields=("full_text", "digest"), **options)
+        return [material_from_cases(cases) for cases in results]
+
+    return [
+        retrieve_precedent_material(embedding, *query_filter, complaint_text)
+        for embedding, query_filter, complaint_text in zip(embeddings, filters, complaint_texts)
+    ]
+
+def generate_text(prompt: str, model_name: str = None) -> str:
+    """Calls Gemini through the shared response cache and the LLM gateway; returns the response text."""
+    model_name = model_name or settings.GEMINI_MODEL_NAME
+    return llm_cache.get_or_generate(model_name, prompt, lambda: get_gateway().generate(prompt, model_name))
+
+def generate_text_stream(prompt: str, on_chunk, model_name: str = None) -> str:
+    """
+    Streams a Gemini response, passing each text chunk to `on_chunk` as it
+    arrives. Cached responses are delivered as a single chunk. Returns the full text.
+    """
+    model_name = model_name or settings.GEMINI_MODEL_NAME
+    cached = llm_cache.get(model_name, prompt)
+    if cached is not None:
+        on_chunk(cached)
+        return cached
+
+    parts = []
+    for text in get_gateway().stream(prompt, model_name):
+        parts.append(text)
+        on_chunk(text)
+    text = "".join(parts)
+    llm_cache.set(model_name, prompt, text)
+    return text
+
+def generate_report(job_id: str, master_prompt: str) -> dict:
+    """
+    Generates the report, publishing each top-level key as soon as the model
+    has finished writing it. Keys that are missing or malformed are recovered
+    by repairing the raw response, then by re-asking for just those keys.
+    """
+    sections = {}
+
+    def on_section(key, value):
+        sections[key] = value
+        job_events.publish(job_id, 'report_section', {'key': key, 'value': value})
+        if settings.LLM_PERSIST_PARTIAL_REPORT:
+            # Coalesced by the job writer, so a burst of sections costs one write
+            job_writer.update(job_id, {'report_data': dict(sections)})
+
+    def attempt():
+        sections.clear()
+        parser = TopLevelObjectParser()
+
+        def on_chunk(chunk):
+            for key, value in parser.feed(chunk):
+                on_section(key, value)
+
+        if settings.LLM_STREAMING:
+            return generate_text_stream(master_prompt, on_chunk)
+        raw = generate_text(master_prompt)
+        on_chunk(raw)
+        return raw
+
+    # The gateway retries failed calls itself; only a stream that broke after
+    # its first chunk needs restarting here (attempt() starts from scratch)
+    raw_text = with_stream_restarts(attempt, settings.LLM_STREAM_RESTARTS)
+    report = dict(sections)
+    missing = [key for key in REPORT_KEYS if key not in report]
+    if missing:
         try:
-            # Find the first '{' and the last '}'
-            start_index = raw_text.find('{')
-            end_index = raw_text.rfind('}') + 1
-            
-            # Slice the string to get only the JSON part
-            json_response_text = raw_text[start_index:end_index]
-            
-            # Now, load the cleaned string
-            report_data = json.loads(json_response_text)
-        except (ValueError, json.JSONDecodeError) as e:
-            # Handle cases where the response is completely broken
-            print(f"!!! CRITICAL: Failed to parse JSON from AI response. Error: {e}")
+            repaired = repair_json(raw_text)
+            for key, value in repaired.items():
+                if key not in report:
+                    report[key] = value
+                    on_section(key, value)
+        except ValueError as e:
+            print(f"Could not repair AI response for job {job_id}: {e}")
             print(f"--- RAW AI RESPONSE --- \n{raw_text}\n-----------------------")
-            raise Exception("AI response was not valid JSON.")
-        # --- END OF FIX ---
+            # Don't serve the broken response from the cache again
+            llm_cache.invalidate(settings.GEMINI_MODEL_NAME, master_prompt)
 
-        # 8. Save report and update job status to COMPLETE
-        supabase.table('jobs').update({
+    for _ in range(settings.LLM_REPAIR_ATTEMPTS):
+        missing = [key for key in REPORT_KEYS if key not in report]
+        if not missing:
+            break
+        print(f"Re-asking for {missing} for job {job_id}")
+        reask_prompt = build_reask_prompt(master_prompt, missing)
+        try:
+            answer = repair_json(generate_text(reask_prompt))
+        except ValueError:
+            llm_cache.invalidate(settings.GEMINI_MODEL_NAME, reask_prompt)
+            continue
+        except Exception as e:
+            # Already retried by the gateway; keep the sections we have rather than fail the job
+            print(f"Re-ask failed for job {job_id}: {e}")
+            break
+        for key in missing:
+            if key in answer:
+                report[key] = answer[key]
+                on_section(key, answer[key])
+
+    if not report:
+        raise Exception("AI response was not valid JSON.")
+    return report
+
+def run_stage(stage: str, fn, *args, retries: int = None, **kwargs):
+    """
+    Runs one pipeline stage, retrying failures with exponential backoff and
+    jitter (PIPELINE_STAGE_RETRIES times unless `retries` is given).
+    """
+    retries = settings.PIPELINE_STAGE_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = settings.PIPELINE_RETRY_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+            metrics.STAGE_RETRIES.inc(stage=stage)
+            print(f"Stage '{stage}' failed ({e}); retry {attempt + 1}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+def find_reusable_report(complaint_text: str, frl_text: str):
+    """
+    The report of an earlier completed job for the same (or nearly the same)
+    documents, flagged with `reused_from`, or None when there is nothing to reuse.
+    """
+    if not settings.DEDUP_ENABLED:
+        return None
+    try:
+        with timed('dedup'):
+            match = duplicate_index.find(complaint_text, frl_text, settings.DEDUP_THRESHOLD)
+        if match is None:
+            metrics.DEDUP_LOOKUPS.inc(result='miss')
+            return None
+        with timed('supabase', operation='select:jobs'):
+            rows = supabase.table('jobs').select('status, report_data').eq('job_id', match['job_id']).execute().data
+    except Exception as e:
+        # Reuse is an optimisation; on any failure just run the analysis
+        print(f"Duplicate lookup failed, analysing from scratch: {e}")
+        return None
+    if not rows or rows[0]['status'] != 'COMPLETE' or not rows[0].get('report_data'):
+        # The original was deleted or re-run since it was indexed
+        duplicate_index.remove(match['job_id'])
+        metrics.DEDUP_LOOKUPS.inc(result='stale')
+        return None
+    metrics.DEDUP_LOOKUPS.inc(result='exact' if match['exact'] else 'near')
+    report = {key: value for key, value in rows[0]['report_data'].items() if key not in ('timings', 'reused_from')}
+    report['reused_from'] = match
+    return report
+
+def index_for_reuse(job_id: str, complaint_text: str, frl_text: str):
+    """Fingerprints a completed job so later duplicates can reuse its report. Never fails the job."""
+    if not settings.DEDUP_ENABLED:
+        return
+    try:
+        duplicate_index.add(job_id, complaint_text, frl_text)
+    except Exception as e:
+        print(f"Could not add job {job_id} to the duplicate index: {e}")
+
+def extract_filters(metadata: dict):
+    """
+    (product_type, key_themes) used to filter precedent retrieval for a
+    complaint's extracted metadata; None/[] means no filter on that field.
+    Only specific themes filter (see metadata_extractor.BROAD_THEMES).
+    """
+    return metadata['product_type'], filter_themes(metadata['key_themes'])
+
+def run_analysis_pipeline(job_id: str, complaint_path: str, frl_path: str) -> bool:
+    """The main AI analysis pipeline over the spooled complaint and FRL PDFs. Returns True when the job completed."""
+    started = time.perf_counter()
+    with trace(settings.METRICS_ENABLED) as spans:
+        succeeded = _run_pipeline(job_id, complaint_path, frl_path, spans, started)
+    record('job', time.perf_counter() - started, outcome='complete' if succeeded else 'error')
+    return succeeded
+
+def _run_pipeline(job_id: str, complaint_path: str, frl_path: str, spans, started: float) -> bool:
+    try:
+        extractor = get_metadata_extractor()
+        embedding_model = get_embedding_model()
+
+        # 1. Update job status to PROCESSING (job row writes are coalesced, see job_writer)
+        job_writer.update(job_id, {'status': 'PROCESSING'})
+        job_stats.safe_record_status(job_id, 'PROCESSING')
+        job_events.publish(job_id, 'processing')
+
+        # 2. Extract text from both documents in parallel
+        with timed('extract'):
+            complaint_text, frl_text = pdf_text.extract_pair(complaint_path, frl_path)
+
+        job_writer.update(job_id, {
+            'complaint_text': complaint_text,
+            'frl_text': frl_text
+        })
+        job_events.publish(job_id, 'extracted', {'complaint_chars': len(complaint_text), 'frl_chars': len(frl_text)})
+
+        # 3. Resubmission of documents already analysed: reuse that report instead of calling Gemini again
+        reused_report = find_reusable_report(complaint_text, frl_text)
+        if reused_report is not None:
+            print(f"Job {job_id} reuses the report of job {reused_report['reused_from']['job_id']}")
+            complete_job(job_id, reused_report)
+            return True
+
+        # 4. NLP: product and themes of the complaint, used to filter retrieval
+        with timed('spacy'):
+            complaint_metadata = extractor.extract(complaint_text)
+        product_type, key_themes = extract_filters(complaint_metadata)
+
+        # 5. Generate embedding for the new complaint
+        with timed('embedding'):
+            complaint_embedding = embedding_model.encode(complaint_text).tolist()
+        job_events.publish(job_id, 'embedded')
+
+        # 6. Hybrid Search: vector and BM25 rankings fused with RRF, grouped by case
+        with timed('retrieval'):
+            precedents = run_stage('retrieve', retrieve_precedent_material, complaint_embedding, product_type, key_themes, complaint_text)
+        job_events.publish(job_id, 'precedents_retrieved', {'case_ids': [p['case_id'] for p in precedents]})
+
+        # 7. Construct Master Prompt for Gemini within the token budget
+        with timed('prompt'):
+            master_prompt, prompt_stats = assemble_prompt(complaint_text, frl_text, precedents)
+        metrics.PROMPT_TOKENS.observe(prompt_stats['total'])
+        print(f"Prompt for job {job_id}: {json.dumps(prompt_stats)}")
+
+        # 8. Call Generative LLM, streaming (identical prompts are answered from the cache)
+        job_events.publish(job_id, 'llm_started', {'prompt_tokens': prompt_stats['total']})
+        # Each report section is published (and persisted) as soon as it is complete
+        with timed('llm'):
+            report_data = generate_report(job_id, master_prompt)
+
+        # 9. Save report (with this job's stage timings) and update job status to COMPLETE
+        if spans is not None:
+            report_data['timings'] = {
+                'spans': list(spans),
+                'total_seconds': round(time.perf_counter() - started, 4),
+            }
+        complete_job(job_id, report_data)
+        index_for_reuse(job_id, complaint_text, frl_text)
+        return True
+
+    except Exception as e:
+        fail_job(job_id, e)
+        return False
+
+def complete_job(job_id: str, report_data: dict):
+    """Persists a finished report and marks the job COMPLETE."""
+    with timed('persist'):
+        run_stage('save_report', job_writer.update, job_id, {
             'status': 'COMPLETE',
             'report_data': report_data
-        }).eq('job_id', job_id).execute()
+        }, terminal=True)
+    predicted = report_data.get('predicted_fos_outcome')
+    job_stats.safe_record_status(job_id, 'COMPLETE', predicted.get('outcome') if isinstance(predicted, dict) else predicted)
+    job_events.publish(job_id, 'report_ready', {'report': report_data})
 
-    except Exception as e:
-        print(f"Error in analysis pipeline for job {job_id}: {e}")
-        # Update job status to ERROR
-        supabase.table('jobs').update({'status': 'ERROR', 'error_message': str(e)}).eq('job_id', job_id).execute()
\ No newline at end of file
+def fail_job(job_id: str, error: Exception):
+    print(f"Error in analysis pipeline for job {job_id}: {error}")
+    # Update job status to ERROR
+    job_writer.update(job_id, {'status': 'ERROR', 'error_message': str(error)}, terminal=True)
+    job_stats.safe_record_status(job_id, 'ERROR')
+    job_events.publish(job_id, 'error', {'message': str(error)})
@@ -0,0 +1,314 @@
+"""
+Bulk analysis of complaint/FRL pairs.
+
+A batch is a parent record (kept in the job queue's SQLite database) plus
+one ordinary child job per pair, so every child still has its own row in
+`jobs`, its own /report and its own event stream. The batch is queued and run
+as a single unit so that the expensive stages are shared across children:
+  - metadata is extracted once over all complaints with nlp.pipe,
+  - the complaint embeddings come from one batched encode call,
+  - retrieval is one matrix product per local index for the whole chunk,
+  - LLM calls run with bounded concurrency (BATCH_LLM_CONCURRENCY) on top of
+    the gateway's global limits.
+Children are processed in chunks of BATCH_CHUNK_SIZE to bound memory. A batch
+that is re-run after a worker crash skips children that already completed.
+"""
+import os
+import posixpath
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core import metrics
+from app.core.timing import timed
+from app.services import job_events
+from app.services import job_queue
+from app.services import job_stats
+from app.services import pdf_text
+from app.services.job_writer import writer as job_writer
+
+BATCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id     TEXT PRIMARY KEY,
+    created_at   REAL NOT NULL,
+    total        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_items (
+    batch_id     TEXT NOT NULL,
+    position     INTEGER NOT NULL,
+    name         TEXT NOT NULL,
+    job_id       TEXT NOT NULL,
+    PRIMARY KEY (batch_id, position)
+);
+"""
+
+# "<name>_complaint.pdf", "<name> frl.pdf", "<name>/complaint.pdf", ...
+PAIR_FILE = re.compile(r"^(?P<name>.*?)[\s_.\-]*(?P<role>complaint|frl)$", re.IGNORECASE)
+TERMINAL_STATUSES = ("COMPLETE", "ERROR")
+
+
+def _connect():
+    conn = job_queue._connect()
+    conn.executescript(BATCH_SCHEMA)
+    return conn
+
+
+def spool_paths(batch_id: str, position: int):
+    directory = job_queue.spool_dir(batch_id)
+    return (os.path.join(directory, f"{position}.complaint.pdf"),
+            os.path.join(directory, f"{position}.frl.pdf"))
+
+
+def _copy_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, path: str, budget: int) -> int:
+    """Extracts one archive member to `path` in chunks; returns its size. Raises ValueError past `budget` bytes."""
+    chunk_bytes = settings.UPLOAD_CHUNK_KB * 1024
+    size = 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with archive.open(info) as source, open(path, "wb") as f:
+        for chunk in iter(lambda: source.read(chunk_bytes), b""):
+            size += len(chunk)
+            if size > budget:
+                # The declared sizes can understate what a member really expands to
+                raise ValueError(f"Archive expands to more than {settings.BATCH_MAX_UPLOAD_MB} MB.")
+            f.write(chunk)
+    return size
+
+
+def unpack_zip(zip_path: str, batch_id: str, max_pairs: int = None, max_bytes: int = None) -> list:
+    """
+    Extracts the complaint/FRL pairs of a spooled zip archive to the batch's
+    spool_paths, one member at a time, and returns the pair names in position
+    order. A pair is two PDFs whose names differ only by a trailing
+    'complaint' / 'frl', or a folder holding complaint.pdf and frl.pdf. The
+    pair count and size limits are checked from the archive's directory
+    before anything is extracted, and the size again while extracting.
+    Raises ValueError describing the problem.
+    """
+    max_pairs = max_pairs or settings.BATCH_MAX_PAIRS
+    max_bytes = max_bytes or settings.BATCH_MAX_UPLOAD_MB * 1024 * 1024
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise ValueError("Upload is not a valid zip archive.")
+
+    with archive:
+        entries = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(".pdf")
+            and not info.filename.startswith("__MACOSX/") and not posixpath.basename(info.filename).startswith(".")
+        ]
+        if sum(info.file_size for info in entries) > max_bytes:
+            raise ValueError(f"Archive expands to more than {settings.BATCH_MAX_UPLOAD_MB} MB.")
+
+        # 1. Pair the members by name
+        pairs = {}
+        for info in entries:
+            directory, filename = posixpath.split(info.filename)
+            match = PAIR_FILE.match(filename[:-4])
+            if match is None:
+                raise ValueError(f"Can't tell whether '{info.filename}' is a complaint or an FRL; "
+                                 "end its name with 'complaint' or 'frl'.")
+            name = posixpath.join(directory, match["name"]).strip("/") or "pair"
+            role = match["role"].lower()
+            if role in pairs.setdefault(name, {}):
+                raise ValueError(f"More than one {role} PDF for '{name}'.")
+            pairs[name][role] = info
+
+        incomplete = sorted(name for name, pair in pairs.items() if len(pair) != 2)
+        if incomplete:
+            raise ValueError(f"Missing complaint or FRL for: {', '.join(incomplete[:10])}")
+        if not pairs:
+            raise ValueError("Archive contains no complaint/FRL PDF pairs.")
+        if len(pairs) > max_pairs:
+            raise ValueError(f"Batch has {len(pairs)} pairs; the limit is {max_pairs}.")
+
+        # 2. Extract them to the spool, never holding more than a chunk in memory
+        names = sorted(pairs)
+        size = 0
+        for position, name in enumerate(names):
+            for role, path in zip(("complaint", "frl"), spool_paths(batch_id, position)):
+                size += _copy_member(archive, pairs[name][role], path, max_bytes - size)
+    return names
+
+
+def create_batch(batch_id: str, children: list):
+    """
+    Records a batch whose pairs are already at their spool_paths. `children`
+    holds {'position', 'name', 'job_id'} per pair.
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO batches (batch_id, created_at, total) VALUES (?, ?, ?)",
+                     (batch_id, time.time(), len(children)))
+        conn.executemany(
+            "INSERT INTO batch_items (batch_id, position, name, job_id) VALUES (?, ?, ?, ?)",
+            [(batch_id, child["position"], child["name"], child["job_id"]) for child in children]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def get_batch(batch_id: str):
+    """The batch and its children ({'position', 'name', 'job_id'}), or None if unknown."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT created_at, total FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return None
+        items = conn.execute(
+            "SELECT position, name, job_id FROM batch_items WHERE batch_id = ? ORDER BY position", (batch_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {
+        "batch_id": batch_id,
+        "created_at": row[0],
+        "total": row[1],
+        "items": [{"position": position, "name": name, "job_id": job_id} for position, name, job_id in items],
+    }
+
+
+def batch_progress(batch: dict) -> dict:
+    """Aggregate progress from the locally tracked child statuses."""
+    statuses = job_stats.get_statuses([item["job_id"] for item in batch["items"]])
+    counts = {"PENDING": 0, "PROCESSING": 0, "COMPLETE": 0, "ERROR": 0}
+    items = []
+    for item in batch["items"]:
+        status = statuses.get(item["job_id"], "PENDING")
+        counts[status] = counts.get(status, 0) + 1
+        items.append({"name": item["name"], "job_id": item["job_id"], "status": status})
+
+    finished = counts["COMPLETE"] + counts["ERROR"]
+    if finished == batch["total"]:
+        status = "COMPLETE"
+    elif finished or counts["PROCESSING"]:
+        status = "PROCESSING"
+    else:
+        status = "PENDING"
+    return {
+        "batch_id": batch["batch_id"],
+        "status": status,
+        "total": batch["total"],
+        "counts": counts,
+        "progress": round(finished / batch["total"], 4) if batch["total"] else 1.0,
+        "items": items,
+    }
+
+
+def fail_batch(batch_id: str, message: str):
+    """Marks every unfinished child of a batch as failed."""
+    from app.services import analysis_service
+    batch = get_batch(batch_id)
+    if batch is None:
+        return
+    statuses = job_stats.get_statuses([item["job_id"] for item in batch["items"]])
+    for item in batch["items"]:
+        if statuses.get(item["job_id"]) not in TERMINAL_STATUSES:
+            analysis_service.fail_job(item["job_id"], Exception(message))
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_batch(batch_id: str) -> int:
+    """Runs every unfinished child of a batch. Returns how many completed."""
+    batch = get_batch(batch_id)
+    if batch is None:
+        print(f"Batch {batch_id} not found.")
+        return 0
+    statuses = job_stats.get_statuses([item["job_id"] for item in batch["items"]])
+    pending = [item for item in batch["items"] if statuses.get(item["job_id"]) != "COMPLETE"]
+    print(f"Batch {batch_id}: {len(pending)} of {batch['total']} pairs to analyse.")
+
+    completed = 0
+    for chunk in _chunks(pending, settings.BATCH_CHUNK_SIZE):
+        completed += _run_chunk(batch_id, chunk)
+    print(f"Batch {batch_id} finished: {completed} completed in this run.")
+    return completed
+
+
+def _run_chunk(batch_id: str, chunk: list) -> int:
+    from app.services import analysis_service
+
+    # 1. Mark children PROCESSING, extract their texts and reuse reports of duplicates
+    live, reused = [], 0
+    for item in chunk:
+        job_id = item["job_id"]
+        try:
+            job_writer.update(job_id, {"status": "PROCESSING"})
+            job_stats.safe_record_status(job_id, "PROCESSING")
+            job_events.publish(job_id, "processing", {"batch_id": batch_id})
+            complaint_path, frl_path = spool_paths(batch_id, item["position"])
+            with timed("extract"):
+                complaint_text, frl_text = pdf_text.extract_pair(complaint_path, frl_path)
+            job_writer.update(job_id, {"complaint_text": complaint_text, "frl_text": frl_text})
+            job_events.publish(job_id, "extracted", {"complaint_chars": len(complaint_text), "frl_chars": len(frl_text)})
+            reused_report = analysis_service.find_reusable_report(complaint_text, frl_text)
+            if reused_report is not None:
+                analysis_service.complete_job(job_id, reused_report)
+                reused += 1
+                continue
+            live.append({**item, "complaint_text": complaint_text, "frl_text": frl_text})
+        except Exception as e:
+            analysis_service.fail_job(job_id, e)
+    if not live:
+        return reused
+    texts = [item["complaint_text"] for item in live]
+
+    try:
+        # 2. NLP over every complaint in one pipe
+        with timed("batch_spacy"):
+            metadata = analysis_service.get_metadata_extractor().extract_many(
+                texts, n_process=settings.NLP_N_PROCESS, batch_size=settings.NLP_BATCH_SIZE
+            )
+        filters = [analysis_service.extract_filters(fields) for fields in metadata]
+
+        # 3. One vectorised encode call for the chunk
+        with timed("batch_embedding"):
+            embeddings = analysis_service.get_embedding_model().encode(
+                texts, batch_size=settings.BATCH_EMBED_BATCH_SIZE, show_progress_bar=False
+            ).tolist()
+        for item in live:
+            job_events.publish(item["job_id"], "embedded")
+
+        # 4. Retrieval for the whole chunk
+        with timed("batch_retrieval"):
+            materials = analysis_service.run_stage(
+                "retrieve", analysis_service.retrieve_precedent_material_many, embeddings, filters, texts
+            )
+    except Exception as e:
+        for item in live:
+            analysis_service.fail_job(item["job_id"], e)
+        return reused
+
+    # 5. Prompt, LLM and persistence per child, with bounded LLM concurrency
+    with ThreadPoolExecutor(max_workers=settings.BATCH_LLM_CONCURRENCY) as pool:
+        outcomes = list(pool.map(_finish_child, live, materials))
+    return reused + sum(outcomes)
+
+
+def _finish_child(item: dict, precedents: list) -> bool:
+    from app.services import analysis_service
+    job_id = item["job_id"]
+    try:
+        job_events.publish(job_id, "precedents_retrieved", {"case_ids": [p["case_id"] for p in precedents]})
+        with timed("prompt"):
+            master_prompt, prompt_stats = analysis_service.assemble_prompt(item["complaint_text"], item["frl_text"], precedents)
+        metrics.PROMPT_TOKENS.observe(prompt_stats["total"])
+        job_events.publish(job_id, "llm_started", {"prompt_tokens": prompt_stats["total"]})
+        with timed("llm"):
+            report_data = analysis_service.generate_report(job_id, master_prompt)
+        analysis_service.complete_job(job_id, report_data)
+        analysis_service.index_for_reuse(job_id, item["complaint_text"], item["frl_text"])
+        return True
+    except Exception as e:
+        analysis_service.fail_job(job_id, e)
+        return False
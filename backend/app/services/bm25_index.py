@@ -0,0 +1,164 @@
+"""
+On-disk BM25 inverted index, stored next to a precedent index's vectors.
+
+Files (written by `build_bm25` into the index directory):
+    bm25.json             parameters, document count, average length and the term list
+    bm25_offsets.npy      (T + 1,) int64 start of each term's postings
+    bm25_docs.npy         int32 row numbers, ascending within each term
+    bm25_impacts.npy      float32 precomputed BM25 contribution of each posting
+    bm25_max_impact.npy   (T,) float32 largest impact per term
+
+Impacts already include idf and length normalisation, so a query is a sum of
+posting impacts. Search uses MaxScore-style early termination: query terms are
+processed from the highest max impact down, and once the remaining terms can
+no longer lift an unseen row into the top k, the rest of their postings are
+only looked up for the surviving candidates (binary search) instead of being
+scanned. Long, common terms are the ones skipped, which keeps queries fast on
+large corpora.
+"""
+import json
+import os
+import re
+from collections import Counter
+import numpy as np
+
+K1 = 1.2
+B = 0.75
+META_FILE = "bm25.json"
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or other
+our ours ourselves out over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which while who whom why will
+with would you your yours yourself yourselves also may mr mrs ms
+""".split())
+
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN.findall((text or "").lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def has_bm25(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, META_FILE))
+
+
+def build_bm25(index_dir: str, texts: list, k1: float = K1, b: float = B):
+    """Writes the inverted index for `texts` (one per index row) into `index_dir`."""
+    vocab = {}
+    term_ids, doc_ids, tfs = [], [], []
+    lengths = np.zeros(len(texts), dtype=np.float32)
+    for doc, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[doc] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(doc)
+            tfs.append(tf)
+
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    doc_ids = np.asarray(doc_ids, dtype=np.int32)
+    tfs = np.asarray(tfs, dtype=np.float32)
+    avgdl = float(lengths.mean()) if len(texts) and lengths.mean() > 0 else 1.0
+
+    # 1. Per-posting impacts: idf * saturated, length-normalised tf
+    df = np.bincount(term_ids, minlength=len(vocab)).astype(np.float32)
+    idf = np.log1p((len(texts) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths[doc_ids] / avgdl)
+    impacts = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    # 2. Group postings by term; a stable sort keeps rows ascending within each term
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(df.astype(np.int64))
+    impacts = impacts[order]
+    max_impact = np.maximum.reduceat(impacts, offsets[:-1]) if len(vocab) else np.zeros(0, dtype=np.float32)
+
+    np.save(os.path.join(index_dir, "bm25_offsets.npy"), offsets)
+    np.save(os.path.join(index_dir, "bm25_docs.npy"), doc_ids[order])
+    np.save(os.path.join(index_dir, "bm25_impacts.npy"), impacts)
+    np.save(os.path.join(index_dir, "bm25_max_impact.npy"), max_impact.astype(np.float32))
+    with open(os.path.join(index_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"k1": k1, "b": b, "docs": len(texts), "avgdl": avgdl, "terms": list(vocab)}, f)
+
+
+class BM25Index:
+    """Read-only, memory-mapped view of the files written by `build_bm25`."""
+
+    def __init__(self, index_dir: str, max_query_terms: int = 64):
+        with open(os.path.join(index_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.docs = meta["docs"]
+        self.max_query_terms = max_query_terms
+        self._term_ids = {term: i for i, term in enumerate(meta["terms"])}
+        self.offsets = np.load(os.path.join(index_dir, "bm25_offsets.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(index_dir, "bm25_docs.npy"), mmap_mode="r")
+        self.impacts = np.load(os.path.join(index_dir, "bm25_impacts.npy"), mmap_mode="r")
+        self.max_impact = np.load(os.path.join(index_dir, "bm25_max_impact.npy"), mmap_mode="r")
+
+    def close(self):
+        self.offsets = self.doc_ids = self.impacts = self.max_impact = None
+
+    def _query_terms(self, text: str) -> list:
+        """Known query terms, highest max impact first. Long queries keep their `max_query_terms` strongest terms."""
+        counts = Counter(tokenize(text))
+        terms = [(self._term_ids[term], count) for term, count in counts.items() if term in self._term_ids]
+        terms.sort(key=lambda item: -float(self.max_impact[item[0]]) * item[1])
+        return sorted((term for term, _ in terms[:self.max_query_terms]), key=lambda term: -float(self.max_impact[term]))
+
+    def search(self, text: str, k: int = 50, mask=None, early_termination: bool = True):
+        """
+        Top-k rows by BM25 score for a free-text query, as (rows, scores) arrays
+        in descending score order. Rows outside `mask` are excluded.
+        `early_termination=False` scans every postings list (for comparison).
+        """
+        terms = self._query_terms(text)
+        if not terms or not self.docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        k = min(k, self.docs)
+        remaining = np.cumsum([float(self.max_impact[term]) for term in terms][::-1])[::-1].tolist() + [0.0]
+        scores = np.zeros(self.docs, dtype=np.float32)
+        candidates = None
+
+        for i, term in enumerate(terms):
+            start, end = int(self.offsets[term]), int(self.offsets[term + 1])
+            docs, impacts = self.doc_ids[start:end], self.impacts[start:end]
+            if candidates is None:
+                scores[docs] += impacts
+                # Pruning check costs O(rows); only worth it before a long postings list
+                next_df = int(self.offsets[terms[i + 1] + 1] - self.offsets[terms[i + 1]]) if i + 1 < len(terms) else 0
+                if early_termination and next_df * 8 > self.docs:
+                    candidates = self._candidates(scores, mask, k, remaining[i + 1])
+            elif len(candidates) * 16 > len(docs):
+                # Scanning is cheaper than that many binary searches; extra rows can't reach the top k anyway
+                scores[docs] += impacts
+            else:
+                positions = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                hit = docs[positions] == candidates
+                scores[candidates[hit]] += impacts[positions[hit]]
+            if candidates is not None and len(candidates) > k:
+                # The k-th score only rises and the remaining bound only falls: shrink the candidate set
+                threshold = np.partition(scores[candidates], -k)[-k]
+                candidates = candidates[scores[candidates] >= threshold - remaining[i + 1]]
+
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+        pool = candidates if candidates is not None else np.flatnonzero(scores > 0)
+        if len(pool) > k:
+            pool = pool[np.argpartition(-scores[pool], k - 1)[:k]]
+        pool = pool[np.argsort(-scores[pool], kind="stable")]
+        pool = pool[scores[pool] > 0]
+        return pool, scores[pool]
+
+    @staticmethod
+    def _candidates(scores: np.ndarray, mask, k: int, remaining: float):
+        """Rows that can still reach the top k given `remaining` upper-bound score, or None to keep scanning."""
+        scored = scores if mask is None else np.where(mask, scores, 0.0)
+        if np.count_nonzero(scored) < k:
+            return None
+        threshold = np.partition(scored, -k)[-k]
+        if threshold <= remaining:
+            # An unseen row could still score `remaining` and enter the top k
+            return None
+        return np.flatnonzero(scored >= threshold - remaining)
@@ -0,0 +1,180 @@
+"""
+Packed, compressed knowledge-base corpus.
+
+One file holds every document's text, compressed per document so any one of
+them can be read on its own through mmap:
+
+    header      56 bytes, little-endian (HEADER): magic, format version,
+                codec, document count and the offsets/lengths of the blocks below
+    dictionary  optional zstd dictionary trained on the corpus (small DRNs
+                share a lot of boilerplate, so it improves per-document ratios)
+    documents   one compressed block per document, in build order
+    table       (count,) records of (offset u8, length u4, raw_length u4)
+    names       zlib-compressed JSON list of {name, case_id, sha256} per document
+
+`name` is the source filename, `case_id` what ingest derives from it and
+`sha256` the hash of the source file's bytes (the ingest manifest's hash), so
+ingesting from a pack or from the directory is interchangeable. Lookups by
+name or case_id are dict lookups plus one block decompression.
+
+Build with build_corpus_pack.py; ingest_data.py --pack reads from it.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+
+MAGIC = b"CMPLPACK"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIQQQQQ")
+CODECS = {"zlib": 1, "zstd": 2}
+TABLE_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("raw_length", "<u4")])
+DICTIONARY_BYTES = 112640
+
+
+def default_codec() -> str:
+    try:
+        import zstandard  # noqa: F401
+        return "zstd"
+    except ImportError:
+        return "zlib"
+
+
+def build_pack(path: str, documents, codec: str = None, level: int = None, dictionary: bool = True) -> dict:
+    """
+    Writes a pack from `documents`, an iterable of dicts with 'name',
+    'case_id', 'text' and 'sha256'. Written to a temporary file and moved into
+    place, so readers never see a half-written pack. Returns build statistics.
+    """
+    codec = codec or default_codec()
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec '{codec}' (expected one of {', '.join(CODECS)})")
+    documents = list(documents)
+    raw = [document["text"].encode("utf-8") for document in documents]
+
+    # 1. Compressor (zstd optionally with a dictionary trained on the corpus)
+    dictionary_data = b""
+    if codec == "zstd":
+        import zstandard
+        level = 19 if level is None else level
+        if dictionary and len(raw) >= 10:
+            dictionary_data = zstandard.train_dictionary(DICTIONARY_BYTES, raw).as_bytes()
+        compressor = zstandard.ZstdCompressor(
+            level=level, dict_data=zstandard.ZstdCompressionDict(dictionary_data) if dictionary_data else None
+        )
+        compress = compressor.compress
+    else:
+        level = 9 if level is None else level
+        compress = lambda data: zlib.compress(data, level)
+
+    # 2. Header placeholder, dictionary, document blocks, table, names
+    tmp_path = f"{path}.tmp"
+    table = np.zeros(len(raw), dtype=TABLE_DTYPE)
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        dictionary_offset = f.tell()
+        f.write(dictionary_data)
+        for i, data in enumerate(raw):
+            block = compress(data)
+            table[i] = (f.tell(), len(block), len(data))
+            f.write(block)
+        table_offset = f.tell()
+        f.write(table.tobytes())
+        names_offset = f.tell()
+        names = zlib.compress(json.dumps([
+            {"name": document["name"], "case_id": document["case_id"], "sha256": document["sha256"]}
+            for document in documents
+        ]).encode("utf-8"))
+        f.write(names)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS[codec], len(raw), table_offset,
+                            names_offset, len(names), dictionary_offset, len(dictionary_data)))
+    os.replace(tmp_path, path)
+    return {
+        "documents": len(raw),
+        "codec": codec,
+        "level": level,
+        "raw_bytes": int(table["raw_length"].sum()),
+        "compressed_bytes": int(table["length"].sum()),
+        "dictionary_bytes": len(dictionary_data),
+        "file_bytes": os.path.getsize(path),
+    }
+
+
+class CorpusPack:
+    """Read-only, memory-mapped view of a pack. Safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, codec, count, table_offset, names_offset, names_length,
+         dictionary_offset, dictionary_length) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a corpus pack")
+        if version != VERSION:
+            raise ValueError(f"{path} has pack format version {version}; expected {VERSION}")
+        self.codec = {number: name for name, number in CODECS.items()}[codec]
+        self.table = np.frombuffer(self._mm, dtype=TABLE_DTYPE, count=count, offset=table_offset)
+        self.entries = json.loads(zlib.decompress(self._mm[names_offset:names_offset + names_length]))
+        self._by_name = {entry["name"]: i for i, entry in enumerate(self.entries)}
+        self._by_case_id = {entry["case_id"]: i for i, entry in enumerate(self.entries)}
+        self._dictionary = bytes(self._mm[dictionary_offset:dictionary_offset + dictionary_length])
+        self._local = threading.local()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The table is a view into the map; drop it before closing
+        self.table = None
+        self._mm.close()
+        self._file.close()
+
+    def names(self) -> list:
+        return [entry["name"] for entry in self.entries]
+
+    def entry(self, name: str):
+        """{name, case_id, sha256} of a document, or None."""
+        i = self._by_name.get(name)
+        return None if i is None else self.entries[i]
+
+    def _decompress(self, block: bytes, raw_length: int) -> bytes:
+        if self.codec == "zlib":
+            return zlib.decompress(block)
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            # zstd decompressors are not thread-safe: one per thread
+            import zstandard
+            dictionary = zstandard.ZstdCompressionDict(self._dictionary) if self._dictionary else None
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressor.decompress(block, max_output_size=raw_length)
+
+    def _read(self, i: int) -> str:
+        offset, length, raw_length = self.table[i]
+        offset = int(offset)
+        return self._decompress(self._mm[offset:offset + int(length)], int(raw_length)).decode("utf-8")
+
+    def read(self, name: str) -> str:
+        """Text of the document built from `name`. Raises KeyError when it is not in the pack."""
+        return self._read(self._by_name[name])
+
+    def get(self, case_id: str):
+        """Text of the document for `case_id`, or None."""
+        i = self._by_case_id.get(case_id)
+        return None if i is None else self._read(i)
+
+    def iter_documents(self, names=None):
+        """Yields (name, text) for `names` (default: every document), reading blocks in file order."""
+        rows = range(len(self.entries)) if names is None else sorted(self._by_name[name] for name in names)
+        for i in rows:
+            yield self.entries[i]["name"], self._read(i)
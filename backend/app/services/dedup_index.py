@@ -0,0 +1,217 @@
+"""
+Near-duplicate detection for submitted complaint/FRL pairs.
+
+Every completed analysis is fingerprinted from the texts the pipeline
+extracted: an exact hash of the normalised texts, plus a MinHash signature
+over word shingles of both documents (complaint and FRL shingles are kept
+apart, so both must match). Signatures are split into LSH bands stored in
+SQLite; a lookup only compares the signatures that share at least one band
+bucket with the query, so it stays cheap as the index grows.
+
+The estimated Jaccard similarity of two pairs is the fraction of equal
+MinHash values. With DEDUP_NUM_PERM=128 and DEDUP_BANDS=32 (4 rows per band)
+pairs above ~0.6 similarity are almost always found as candidates; the
+DEDUP_THRESHOLD check then decides whether one is close enough to reuse.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import numpy as np
+from app.core.config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    job_id        TEXT PRIMARY KEY,
+    content_hash  TEXT NOT NULL,
+    signature     BLOB NOT NULL,
+    created_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS signatures_content_hash ON signatures (content_hash);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    band    INTEGER NOT NULL,
+    bucket  INTEGER NOT NULL,
+    job_id  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lsh_buckets_band_bucket ON lsh_buckets (band, bucket);
+"""
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+TOKEN = re.compile(r"[a-z0-9£]+")
+
+
+def normalise(text: str) -> list:
+    """Lower-cased word tokens; ignores punctuation, layout and PDF line breaks."""
+    return TOKEN.findall((text or "").lower())
+
+
+def content_hash(complaint_tokens: list, frl_tokens: list) -> str:
+    return hashlib.sha256((" ".join(complaint_tokens) + "\x00" + " ".join(frl_tokens)).encode("utf-8")).hexdigest()
+
+
+def _shingle_hashes(tokens: list, prefix: str, size: int) -> list:
+    return [
+        int.from_bytes(hashlib.blake2b(f"{prefix}{' '.join(tokens[i:i + size])}".encode("utf-8"), digest_size=4).digest(), "little")
+        for i in range(max(0, len(tokens) - size + 1))
+    ]
+
+
+class MinHasher:
+    """MinHash with `num_perm` universal hash functions (a * x + b mod 2^61-1) seeded deterministically."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, complaint_tokens: list, frl_tokens: list) -> np.ndarray:
+        hashes = _shingle_hashes(complaint_tokens, "c:", self.shingle_size) + _shingle_hashes(frl_tokens, "f:", self.shingle_size)
+        return np.unique(np.array(hashes, dtype=np.uint64))
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        signature = np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        # Chunked so very long documents don't build one huge (shingles x perms) matrix
+        for start in range(0, len(shingles), 2048):
+            chunk = shingles[start:start + 2048, None]
+            values = ((chunk * self.a + self.b) % MERSENNE_PRIME) & MAX_HASH
+            np.minimum(signature, values.min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return float(np.mean(a == b))
+
+
+class DuplicateIndex:
+    def __init__(self, path: str, num_perm: int = 128, bands: int = 32, shingle_size: int = 5, min_shingles: int = 20):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.path = path
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_shingles = min_shingles
+        self.hasher = MinHasher(num_perm, shingle_size)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def fingerprint(self, complaint_text: str, frl_text: str):
+        """(content_hash, signature), or None when the texts are too short to fingerprint reliably."""
+        complaint_tokens, frl_tokens = normalise(complaint_text), normalise(frl_text)
+        shingles = self.hasher.shingles(complaint_tokens, frl_tokens)
+        if len(shingles) < self.min_shingles:
+            # e.g. scanned PDFs with no text layer: every such pair would look identical
+            return None
+        return content_hash(complaint_tokens, frl_tokens), self.hasher.signature(shingles)
+
+    def _buckets(self, signature: np.ndarray) -> list:
+        return [
+            (band, int.from_bytes(hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=7).digest(), "little"))
+            for band in range(self.bands)
+        ]
+
+    def add(self, job_id: str, complaint_text: str, frl_text: str) -> bool:
+        """Fingerprints a completed job's documents. Returns False if they were too short to index."""
+        fingerprint = self.fingerprint(complaint_text, frl_text)
+        if fingerprint is None:
+            return False
+        digest, signature = fingerprint
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM lsh_buckets WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO signatures (job_id, content_hash, signature, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, digest, signature.tobytes(), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO lsh_buckets (band, bucket, job_id) VALUES (?, ?, ?)",
+                [(band, bucket, job_id) for band, bucket in self._buckets(signature)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return True
+
+    def find(self, complaint_text: str, frl_text: str, threshold: float = 0.9):
+        """
+        The most similar indexed job at or above `threshold`, as
+        {'job_id', 'similarity', 'exact'}, or None. Exact matches (same
+        normalised texts) win over near matches.
+        """
+        fingerprint = self.fingerprint(complaint_text, frl_text)
+        if fingerprint is None:
+            return None
+        digest, signature = fingerprint
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT job_id FROM signatures WHERE content_hash = ? ORDER BY created_at DESC LIMIT 1", (digest,)
+            ).fetchone()
+            if row is not None:
+                return {"job_id": row[0], "similarity": 1.0, "exact": True}
+
+            buckets = self._buckets(signature)
+            placeholders = ",".join("(?, ?)" for _ in buckets)
+            candidates = conn.execute(
+                f"SELECT DISTINCT s.job_id, s.signature FROM lsh_buckets b JOIN signatures s ON s.job_id = b.job_id "
+                f"WHERE (b.band, b.bucket) IN (VALUES {placeholders})",
+                [value for pair in buckets for value in pair]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        best = None
+        for job_id, blob in candidates:
+            score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if score >= threshold and (best is None or score > best["similarity"]):
+                best = {"job_id": job_id, "similarity": round(score, 4), "exact": False}
+        return best
+
+    def remove(self, job_id: str):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM lsh_buckets WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM signatures WHERE job_id = ?", (job_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM lsh_buckets")
+            conn.execute("DELETE FROM signatures")
+        finally:
+            conn.close()
+
+    def count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+        finally:
+            conn.close()
+
+
+duplicate_index = DuplicateIndex(
+    settings.DEDUP_INDEX_PATH,
+    num_perm=settings.DEDUP_NUM_PERM,
+    bands=settings.DEDUP_BANDS,
+    shingle_size=settings.DEDUP_SHINGLE_SIZE,
+)
@@ -0,0 +1,81 @@
+"""
+Compact extractive digests of ombudsman decisions.
+
+A digest keeps the parts of a decision the analysis prompt actually needs -
+the outcome, the key reasoning sentences and the redress - so a precedent
+costs a few hundred tokens in the prompt instead of several thousand.
+"""
+import re
+from app.services.passages import split_sections
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z£(])")
+
+# Phrases that mark an ombudsman's own reasoning rather than narrative
+REASONING_CUES = (
+    "i think", "i don't think", "i don’t think", "i'm satisfied", "i’m satisfied",
+    "i'm not satisfied", "i’m not satisfied", "i've concluded", "i’ve concluded",
+    "i'm persuaded", "i’m persuaded", "i agree", "i don't agree", "i don’t agree",
+    "unfair", "unreasonable", "reasonable", "should have", "shouldn't have", "shouldn’t have",
+    "proportionate", "affordab", "creditworth", "on balance", "so i", "it follows",
+)
+# Standard wording that appears in almost every decision and says nothing case-specific
+BOILERPLATE = ("considered all the available evidence", "required to ask", "accept or reject my decision")
+REDRESS_CUES = ("£", "refund", "compensat", "interest", "must pay", "should pay", "remove", "write off", "put things right")
+
+DIGEST_SECTIONS = ("what i", "my findings", "my provisional findings", "merits")
+REDRESS_SECTIONS = ("putting things right", "fair compensation")
+
+
+def split_sentences(text: str) -> list:
+    text = " ".join(text.split())
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def _outcome(sections) -> str:
+    for heading, body in sections:
+        if heading.lower().startswith("my final decision"):
+            for sentence in split_sentences(body):
+                if "uphold" in sentence.lower() or "decision" in sentence.lower():
+                    return sentence
+    return ""
+
+
+def _reasoning(sections, max_sentences: int) -> list:
+    candidates = []
+    for heading, body in sections:
+        if not heading.lower().startswith(DIGEST_SECTIONS):
+            continue
+        for position, sentence in enumerate(split_sentences(body)):
+            lowered = sentence.lower()
+            if any(phrase in lowered for phrase in BOILERPLATE):
+                continue
+            score = sum(cue in lowered for cue in REASONING_CUES)
+            if score and 8 <= len(sentence.split()) <= 60:
+                candidates.append((score, position, sentence))
+    top = sorted(candidates, key=lambda c: (-c[0], c[1]))[:max_sentences]
+    return [sentence for _, _, sentence in sorted(top, key=lambda c: c[1])]
+
+
+def _redress(sections, max_sentences: int) -> list:
+    for heading, body in sections:
+        if heading.lower().startswith(REDRESS_SECTIONS):
+            sentences = [s for s in split_sentences(body) if any(cue in s.lower() for cue in REDRESS_CUES)]
+            if sentences:
+                return sentences[:max_sentences]
+    return []
+
+
+def build_digest(text: str, max_reasoning: int = 5, max_redress: int = 3) -> str:
+    """Returns a short 'Outcome / Key reasoning / Redress' digest of a decision."""
+    sections = split_sections(text)
+    parts = []
+    outcome = _outcome(sections)
+    if outcome:
+        parts.append(f"Outcome: {outcome}")
+    reasoning = _reasoning(sections, max_reasoning)
+    if reasoning:
+        parts.append("Key reasoning:\n" + "\n".join(f"- {sentence}" for sentence in reasoning))
+    redress = _redress(sections, max_redress)
+    if redress:
+        parts.append("Redress:\n" + "\n".join(f"- {sentence}" for sentence in redress))
+    return "\n".join(parts)
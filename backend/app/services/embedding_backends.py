@@ -0,0 +1,190 @@
+"""
+Pluggable sentence-embedding backends for all-MiniLM-L6-v2.
+
+Every backend exposes the SentenceTransformer-style `encode(sentences,
+batch_size=..., show_progress_bar=...)` the pipeline and ingest already call
+(a single string gives one vector, a list gives a matrix), so they are
+interchangeable behind `create_embedder()`:
+
+    torch       SentenceTransformer on PyTorch; the reference model
+    torch-int8  the same model with its Linear layers dynamically quantized to
+                int8 (torch.ao.quantization.quantize_dynamic); no extra deps
+    onnx        SentenceTransformer's ONNX Runtime backend (needs onnxruntime
+                and optimum). EMBEDDING_ONNX_FILE picks the exported graph,
+                e.g. "onnx/model_quint8_avx2.onnx" for the int8-quantized one
+
+EMBEDDING_THREADS sets the intra-op thread count (0 keeps the library
+default); with several worker processes on one machine, threads x workers
+should not exceed the cores.
+
+`BatchingEmbedder` wraps a backend when jobs run in the API process:
+concurrent `encode` calls from different threads are queued and run as one
+batched call (up to EMBEDDING_MAX_BATCH texts, waiting at most
+EMBEDDING_BATCH_WAIT_MS for more), instead of each thread running its own
+small forward pass.
+
+Vectors from different backends are close but not identical, so the local
+indexes record `model_key()` and ingest rebuilds them when it changes.
+
+Check a backend's drift and throughput against the reference with
+benchmarks/embedding_benchmark.py.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from app.core.config import settings
+from app.core import metrics
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+class SentenceTransformerBackend:
+    """A SentenceTransformer model on CPU, optionally with dynamically int8-quantized Linear layers."""
+
+    def __init__(self, model_name: str, threads: int = 0, quantize: bool = False):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            from torch.ao.quantization import quantize_dynamic
+            quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        self._no_grad = torch.inference_mode
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs):
+        with self._no_grad():
+            return self.model.encode(sentences, batch_size=batch_size, show_progress_bar=show_progress_bar, **kwargs)
+
+
+class OnnxBackend:
+    """SentenceTransformer on ONNX Runtime (CPUExecutionProvider) with its own intra-op thread pool."""
+
+    def __init__(self, model_name: str, file_name: str = "onnx/model.onnx", threads: int = 0):
+        import onnxruntime
+        from sentence_transformers import SentenceTransformer
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.model = SentenceTransformer(
+            model_name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider", "session_options": options},
+        )
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs):
+        return self.model.encode(sentences, batch_size=batch_size, show_progress_bar=show_progress_bar, **kwargs)
+
+
+def model_key(name: str = None, model_name: str = None, onnx_file: str = None) -> str:
+    """
+    Identity of the vectors a backend produces, stored in the ingest manifest
+    and index meta so switching backend re-embeds the corpus. The reference
+    torch backend keeps the bare model name.
+    """
+    name = name or settings.EMBEDDING_BACKEND
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    if name == "onnx":
+        return f"{model_name}@onnx:{onnx_file or settings.EMBEDDING_ONNX_FILE}"
+    if name != "torch":
+        return f"{model_name}@{name}"
+    return model_name
+
+
+def create_backend(name: str = None, model_name: str = None, threads: int = None, onnx_file: str = None):
+    name = name or settings.EMBEDDING_BACKEND
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    threads = settings.EMBEDDING_THREADS if threads is None else threads
+    if name == "torch":
+        return SentenceTransformerBackend(model_name, threads)
+    if name == "torch-int8":
+        return SentenceTransformerBackend(model_name, threads, quantize=True)
+    if name == "onnx":
+        return OnnxBackend(model_name, onnx_file or settings.EMBEDDING_ONNX_FILE, threads)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{name}' (expected one of {', '.join(BACKENDS)})")
+
+
+class BatchingEmbedder:
+    """
+    Coalesces concurrent `encode` calls into batched backend calls on one
+    thread. Each call still gets exactly the vectors for its own texts.
+    """
+
+    def __init__(self, backend, max_batch: int = 64, wait_ms: float = 5.0):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.wait_seconds = wait_ms / 1000
+        self._requests = queue.Queue()
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if kwargs or not texts or len(texts) >= self.max_batch:
+            # Already a full batch (or unusual options): no point waiting for others
+            vectors = self.backend.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar, **kwargs)
+        else:
+            future = Future()
+            self._requests.put((texts, future))
+            vectors = future.result()
+        return vectors[0] if single else vectors
+
+    def _collect(self) -> list:
+        """Blocks for one request, then gathers more until max_batch texts or the wait runs out."""
+        requests = [self._carry or self._requests.get()]
+        self._carry = None
+        count = len(requests[0][0])
+        deadline = time.monotonic() + self.wait_seconds
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if count + len(request[0]) > self.max_batch:
+                # Starts the next batch instead
+                self._carry = request
+                break
+            requests.append(request)
+            count += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            metrics.EMBEDDING_BATCH_TEXTS.observe(len(texts))
+            try:
+                vectors = np.asarray(self.backend.encode(texts, batch_size=self.max_batch, show_progress_bar=False))
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request_texts, future in requests:
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
+
+
+def create_embedder(batching: bool = None):
+    """
+    The configured backend, behind a BatchingEmbedder when several threads of
+    this process encode at once: with EMBEDDING_DYNAMIC_BATCHING on and jobs
+    running in-process (JOB_WORKERS = 0). Worker processes run one job at a
+    time, so there they call the backend directly instead of paying the wait
+    and thread hop for batches of one.
+    """
+    backend = create_backend()
+    if batching is None:
+        batching = settings.EMBEDDING_DYNAMIC_BATCHING and settings.JOB_WORKERS == 0
+    if not batching:
+        return backend
+    return BatchingEmbedder(backend, settings.EMBEDDING_MAX_BATCH, settings.EMBEDDING_BATCH_WAIT_MS)
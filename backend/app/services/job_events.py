@@ -0,0 +1,107 @@
+"""
+In-process pub/sub of per-stage job progress events.
+
+The pipeline calls `publish(job_id, stage, data)` as each stage finishes. In
+the API process events go straight to the bus, which keeps a bounded buffer
+per job (so late subscribers and reconnects with Last-Event-ID can catch up)
+and fans them out to the SSE streams of `/api/report/{job_id}/events`.
+Worker processes have no subscribers of their own, so the worker pool installs
+a sink that forwards their events to the API process over a multiprocessing
+queue.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from app.core.config import settings
+
+TERMINAL_STAGES = ("report_ready", "error")
+
+
+class JobEventBus:
+    def __init__(self, buffer_size: int = 50, max_jobs: int = 1000, subscriber_queue_size: int = 100):
+        self.buffer_size = buffer_size
+        self.max_jobs = max_jobs
+        self.subscriber_queue_size = subscriber_queue_size
+        self._buffers = OrderedDict()  # job_id -> deque of events
+        self._next_id = {}
+        self._subscribers = {}  # job_id -> set of (loop, asyncio.Queue)
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict):
+        """Buffers an event and delivers it to every subscriber of its job. Thread-safe."""
+        job_id = event["job_id"]
+        with self._lock:
+            event = {**event, "id": self._next_id.get(job_id, 0) + 1}
+            self._next_id[job_id] = event["id"]
+            buffer = self._buffers.get(job_id)
+            if buffer is None:
+                buffer = self._buffers[job_id] = deque(maxlen=self.buffer_size)
+            self._buffers.move_to_end(job_id)
+            buffer.append(event)
+            while len(self._buffers) > self.max_jobs:
+                evicted, _ = self._buffers.popitem(last=False)
+                self._next_id.pop(evicted, None)
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict):
+        # A slow consumer loses its oldest undelivered events rather than stalling publishers
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def subscribe(self, job_id: str, last_event_id: int = 0):
+        """
+        Must be called from the event loop. Returns (backlog, queue): buffered
+        events newer than `last_event_id` and a queue receiving future ones.
+        """
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            backlog = [event for event in self._buffers.get(job_id, ()) if event["id"] > last_event_id]
+            self._subscribers.setdefault(job_id, set()).add(subscriber)
+        return backlog, queue, subscriber
+
+    def unsubscribe(self, job_id: str, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+
+bus = JobEventBus(
+    buffer_size=settings.JOB_EVENT_BUFFER_SIZE,
+    max_jobs=settings.JOB_EVENT_MAX_JOBS
+)
+
+_sink = bus.publish
+
+
+def set_sink(sink):
+    """Redirects published events, e.g. to a multiprocessing queue in worker processes."""
+    global _sink
+    _sink = sink
+
+
+def publish(job_id: str, stage: str, data: dict = None):
+    """Publishes a pipeline progress event. Never raises into the pipeline."""
+    try:
+        _sink({"job_id": job_id, "stage": stage, "data": data or {}, "ts": time.time()})
+    except Exception as e:
+        print(f"Could not publish '{stage}' event for job {job_id}: {e}")
+
+
+def format_sse(event: dict) -> str:
+    """Serialises an event in text/event-stream framing."""
+    lines = []
+    if event.get("id") is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['stage']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,451 @@
+"""
+Durable analysis job queue and worker pool.
+
+Jobs are recorded in a local SQLite database and their uploaded PDFs are
+spooled to disk, so nothing is lost when the API process restarts. A fixed
+pool of worker processes (each loading the NLP/embedding models once) claims
+jobs one at a time; load spikes wait in the queue instead of running
+unbounded inside the web process.
+
+Queue states: queued -> running -> done | failed
+Entry kinds: "job" (one complaint/FRL pair) or "batch" (see batch_service)
+
+A claim holds a lease of JOB_LEASE_SECONDS that the worker keeps renewing
+while it runs the entry; entries whose lease has run out (their worker, or
+the whole API process and its pool, died) are put back in the queue. Workers
+also exit on their own once the API process that spawned them is gone.
+"""
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from queue import Empty, Full
+from app.core.config import settings
+from app.core import metrics
+from app.core.timing import record
+from app.services import job_stats
+from app.services import job_events
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    job_id        TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    enqueued_at   REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL,
+    worker_pid    INTEGER,
+    last_error    TEXT,
+    kind          TEXT NOT NULL DEFAULT 'job',
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS queue_status_enqueued ON queue (status, enqueued_at);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(settings.JOB_QUEUE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(settings.JOB_QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(queue)")]
+    if "kind" not in columns:
+        # Queue databases created before batches existed
+        conn.execute("ALTER TABLE queue ADD COLUMN kind TEXT NOT NULL DEFAULT 'job'")
+    if "lease_expires_at" not in columns:
+        # ... and before claims had leases
+        conn.execute("ALTER TABLE queue ADD COLUMN lease_expires_at REAL")
+    return conn
+
+
+def spool_dir(job_id: str) -> str:
+    return os.path.join(settings.JOB_SPOOL_DIR, job_id)
+
+
+def payload_paths(job_id: str):
+    """Paths of the spooled complaint and FRL PDFs for a job."""
+    directory = spool_dir(job_id)
+    return os.path.join(directory, "complaint.pdf"), os.path.join(directory, "frl.pdf")
+
+
+def enqueue(job_id: str):
+    """Queues a job whose PDFs the API has already spooled to payload_paths(job_id)."""
+    _queue(job_id, "job")
+
+
+def discard_spool(job_id: str):
+    shutil.rmtree(spool_dir(job_id), ignore_errors=True)
+
+
+def run_in_process(job_id: str):
+    """Runs a spooled job in this process (JOB_WORKERS = 0), then removes its spooled PDFs."""
+    from app.services import analysis_service
+    try:
+        analysis_service.run_analysis_pipeline(job_id, *payload_paths(job_id))
+    finally:
+        discard_spool(job_id)
+
+
+def run_batch_in_process(batch_id: str):
+    """Runs a spooled batch in this process (JOB_WORKERS = 0), then removes its spooled PDFs."""
+    from app.services import batch_service
+    try:
+        batch_service.run_batch(batch_id)
+    except Exception as e:
+        print(f"Batch {batch_id} failed: {e}")
+        try:
+            batch_service.fail_batch(batch_id, str(e))
+        except Exception as fail_error:
+            print(f"Could not mark batch {batch_id} as failed: {fail_error}")
+    finally:
+        discard_spool(batch_id)
+
+
+def enqueue_batch(batch_id: str):
+    """Queues a batch the API has spooled and recorded with batch_service.create_batch."""
+    _queue(batch_id, "batch")
+
+
+def _queue(job_id: str, kind: str):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO queue (job_id, status, enqueued_at, kind) VALUES (?, 'queued', ?, ?)",
+            (job_id, time.time(), kind)
+        )
+    finally:
+        conn.close()
+
+
+def claim_next(conn: sqlite3.Connection, worker_pid: int):
+    """Atomically moves the oldest queued entry to running. Returns (job_id, kind) or None."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT job_id, enqueued_at, kind FROM queue WHERE status = 'queued' ORDER BY enqueued_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE queue SET status = 'running', attempts = attempts + 1, started_at = ?, worker_pid = ?, "
+            "lease_expires_at = ? WHERE job_id = ?",
+            (now, worker_pid, now + settings.JOB_LEASE_SECONDS, row[0])
+        )
+        conn.execute("COMMIT")
+        record("queue_wait", now - row[1])
+        return row[0], row[2]
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def renew_lease(conn: sqlite3.Connection, job_id: str, worker_pid: int) -> bool:
+    """Extends a running claim's lease. False when the entry is no longer this worker's."""
+    cursor = conn.execute(
+        "UPDATE queue SET lease_expires_at = ? WHERE job_id = ? AND worker_pid = ? AND status = 'running'",
+        (time.time() + settings.JOB_LEASE_SECONDS, job_id, worker_pid)
+    )
+    return cursor.rowcount == 1
+
+
+def finish(conn: sqlite3.Connection, job_id: str, succeeded: bool, error: str = None):
+    conn.execute(
+        "UPDATE queue SET status = ?, finished_at = ?, last_error = ? WHERE job_id = ?",
+        ("done" if succeeded else "failed", time.time(), error, job_id)
+    )
+    shutil.rmtree(spool_dir(job_id), ignore_errors=True)
+
+
+def _pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def requeue_orphans(worker_pids=None) -> list:
+    """
+    Puts 'running' entries whose worker is gone back in the queue: without
+    `worker_pids`, every entry whose lease has expired (its worker stopped
+    renewing it, whichever process or host that was); otherwise also those
+    owned by the given (dead) worker pids of this pool. Entries that have used
+    up JOB_MAX_ATTEMPTS are failed instead. Returns the requeued ids.
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT job_id, attempts, worker_pid, kind, lease_expires_at FROM queue WHERE status = 'running'"
+        ).fetchall()
+        now = time.time()
+        dead = set(worker_pids or ())
+        orphans = [
+            (job_id, attempts, kind) for job_id, attempts, pid, kind, lease_expires_at in rows
+            # Claims made before leases existed fall back to the pid check
+            if pid in dead or (lease_expires_at < now if lease_expires_at is not None else not _pid_alive(pid))
+        ]
+        requeued, exhausted = [], []
+        for job_id, attempts, kind in orphans:
+            (exhausted if attempts >= settings.JOB_MAX_ATTEMPTS else requeued).append((job_id, kind))
+        conn.executemany("UPDATE queue SET status = 'queued', worker_pid = NULL, lease_expires_at = NULL WHERE job_id = ?", [(j,) for j, _ in requeued])
+        conn.executemany(
+            "UPDATE queue SET status = 'failed', finished_at = ?, last_error = 'worker died too many times' WHERE job_id = ?",
+            [(time.time(), j) for j, _ in exhausted]
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    for job_id, kind in exhausted:
+        _fail_entry(job_id, kind, "Analysis worker died repeatedly while processing this job.")
+    return [job_id for job_id, _ in requeued]
+
+
+def _fail_entry(job_id: str, kind: str, message: str):
+    if kind == "batch":
+        # Children that finished before the worker died keep their reports
+        from app.services import batch_service
+        try:
+            batch_service.fail_batch(job_id, message)
+        except Exception as e:
+            print(f"Could not mark batch {job_id} as failed: {e}")
+    else:
+        _mark_job_error(job_id, message)
+    shutil.rmtree(spool_dir(job_id), ignore_errors=True)
+
+
+def _mark_job_error(job_id: str, message: str):
+    from app.services.supabase_client import supabase
+    try:
+        supabase.table('jobs').update({'status': 'ERROR', 'error_message': message}).eq('job_id', job_id).execute()
+        job_stats.safe_record_status(job_id, 'ERROR')
+    except Exception as e:
+        print(f"Could not mark job {job_id} as failed: {e}")
+
+
+def queue_stats() -> dict:
+    """Queue depth by state plus the age of the oldest queued job."""
+    conn = _connect()
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM queue GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(enqueued_at) FROM queue WHERE status = 'queued'").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        "queued": counts.get("queued", 0),
+        "running": counts.get("running", 0),
+        "done": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+    }
+
+
+def _forward_to(events_queue):
+    def sink(event):
+        try:
+            events_queue.put_nowait(event)
+        except Full:
+            pass  # progress events are best-effort; the report itself is durable
+    return sink
+
+
+METRICS_PUSH_INTERVAL_SECONDS = 5.0
+PARENT_CHECK_INTERVAL_SECONDS = 1.0
+
+
+def _watch(stop_event, parent_pid: int, pid: int, current: dict):
+    """
+    Worker-side thread: renews the lease of the entry being run, and ends the
+    worker once the API process that spawned it is gone (e.g. SIGKILLed), so
+    it never runs alongside the next pool. Its entry is re-queued when the
+    lease runs out.
+    """
+    conn = _connect()
+    renewed = 0.0
+    while not stop_event.wait(PARENT_CHECK_INTERVAL_SECONDS):
+        if os.getppid() != parent_pid:
+            print(f"Analysis worker {pid}: API process {parent_pid} is gone, exiting.")
+            os._exit(1)
+        job_id = current.get("job_id")
+        if job_id and time.time() - renewed >= settings.JOB_LEASE_SECONDS / 3:
+            try:
+                renew_lease(conn, job_id, pid)
+                renewed = time.time()
+            except sqlite3.Error as e:
+                print(f"Analysis worker {pid} could not renew the lease of {job_id}: {e}")
+
+
+def _worker_main(stop_event, poll_interval: float, events_queue, parent_pid: int):
+    """Worker process entry point: loads the models once, then drains the queue."""
+    from app.services import analysis_service
+    from app.services import batch_service
+    from app.services.job_writer import writer as job_writer
+
+    job_events.set_sink(_forward_to(events_queue))
+    pid = os.getpid()
+    current = {"job_id": None}
+    threading.Thread(target=_watch, args=(stop_event, parent_pid, pid, current), daemon=True).start()
+    analysis_service.warm_up_models()
+    # Events without a job_id are worker status reports for the readiness probe
+    events_queue.put({"job_id": None, "stage": "worker_ready", "data": {
+        "pid": pid, "ready": analysis_service.models_ready(), "models": analysis_service.model_status
+    }})
+    conn = _connect()
+    print(f"Analysis worker {pid} ready.")
+    last_metrics = 0.0
+
+    while not stop_event.is_set():
+        if metrics.ENABLED and time.time() - last_metrics >= METRICS_PUSH_INTERVAL_SECONDS:
+            # The API process serves /metrics, so it needs this worker's registry
+            _forward_to(events_queue)({"job_id": None, "stage": "metrics", "data": {"pid": pid, "snapshot": metrics.snapshot()}})
+            last_metrics = time.time()
+        claimed = claim_next(conn, pid)
+        if claimed is None:
+            stop_event.wait(poll_interval)
+            continue
+        job_id, kind = claimed
+        current["job_id"] = job_id
+        if kind == "batch":
+            try:
+                batch_service.run_batch(job_id)
+                finish(conn, job_id, True)
+            except Exception as e:
+                print(f"Analysis worker {pid} failed batch {job_id}: {e}")
+                finish(conn, job_id, False, str(e))
+                try:
+                    batch_service.fail_batch(job_id, str(e))
+                except Exception as fail_error:
+                    print(f"Could not mark batch {job_id} as failed: {fail_error}")
+            current["job_id"] = None
+            continue
+        try:
+            succeeded = analysis_service.run_analysis_pipeline(job_id, *payload_paths(job_id))
+            finish(conn, job_id, succeeded)
+        except Exception as e:
+            print(f"Analysis worker {pid} failed job {job_id}: {e}")
+            finish(conn, job_id, False, str(e))
+            _mark_job_error(job_id, str(e))
+        current["job_id"] = None
+    job_writer.flush()
+    conn.close()
+
+
+class WorkerPool:
+    """Fixed-size pool of analysis worker processes with a supervisor that replaces dead workers."""
+
+    def __init__(self, num_workers: int, poll_interval: float = 1.0):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._events = self._ctx.Queue(maxsize=10000)
+        self._processes = []
+        self._supervisor = None
+        self._forwarder = None
+        self.worker_status = {}  # pid -> readiness reported by the worker
+        self.worker_metrics = {}  # pid -> latest metrics snapshot
+        self._retired_metrics = {}  # totals of workers that have exited, so counters never go backwards
+
+    def _spawn(self):
+        process = self._ctx.Process(target=_worker_main, args=(self._stop, self.poll_interval, self._events, os.getpid()), daemon=True)
+        process.start()
+        self.worker_status[process.pid] = {"ready": False, "status": "starting", "started_at": time.time()}
+        return process
+
+    def start(self):
+        requeued = requeue_orphans()
+        if requeued:
+            print(f"Re-queued {len(requeued)} orphaned jobs.")
+        self._processes = [self._spawn() for _ in range(self.num_workers)]
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+        self._forwarder = threading.Thread(target=self._forward_events, daemon=True)
+        self._forwarder.start()
+        print(f"Started {self.num_workers} analysis workers.")
+
+    def _supervise(self):
+        while not self._stop.wait(5):
+            dead = [p for p in self._processes if not p.is_alive()]
+            if not dead:
+                # Claims of workers elsewhere (another API process on this queue) that stopped renewing
+                requeued = requeue_orphans()
+                if requeued:
+                    print(f"Re-queued {len(requeued)} jobs whose lease expired.")
+                continue
+            requeued = requeue_orphans([p.pid for p in dead])
+            for process in dead:
+                self.worker_status.pop(process.pid, None)
+                metrics.merge(self._retired_metrics, self.worker_metrics.pop(process.pid, {}))
+            print(f"{len(dead)} analysis workers died; re-queued {len(requeued)} jobs and restarting them.")
+            self._processes = [p for p in self._processes if p.is_alive()] + [self._spawn() for _ in dead]
+
+    def _forward_events(self):
+        """Relays worker progress events onto the API process's event bus."""
+        while not self._stop.is_set():
+            try:
+                event = self._events.get(timeout=1)
+            except Empty:
+                continue
+            if event.get("job_id") is None and event["stage"] == "metrics":
+                self.worker_metrics[event["data"]["pid"]] = event["data"]["snapshot"]
+            elif event.get("job_id") is None:
+                self._record_worker_status(event["data"])
+            else:
+                job_events.bus.publish(event)
+
+    def _record_worker_status(self, data: dict):
+        status = self.worker_status.setdefault(data["pid"], {"started_at": time.time()})
+        status.update(
+            ready=data["ready"],
+            status="ready" if data["ready"] else "error",
+            models=data["models"],
+            ready_after_seconds=round(time.time() - status["started_at"], 3)
+        )
+
+    def metrics_snapshots(self) -> list:
+        return [self._retired_metrics] + list(self.worker_metrics.values())
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+
+_pool = None
+
+
+def start_worker_pool():
+    global _pool
+    if settings.JOB_WORKERS > 0 and _pool is None:
+        _pool = WorkerPool(settings.JOB_WORKERS, settings.JOB_POLL_INTERVAL_SECONDS)
+        _pool.start()
+
+
+def worker_readiness() -> dict:
+    """Readiness of each live worker process, keyed by pid ({} without a pool)."""
+    return {str(pid): status for pid, status in _pool.worker_status.items()} if _pool is not None else {}
+
+
+def worker_metrics_snapshots() -> list:
+    """Latest metrics snapshots from the worker processes ([] without a pool)."""
+    return _pool.metrics_snapshots() if _pool is not None else []
+
+
+def stop_worker_pool():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
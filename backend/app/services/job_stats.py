@@ -0,0 +1,166 @@
+"""
+Incrementally maintained dashboard aggregates.
+
+Every job status change is recorded here as it happens, and the counters
+(jobs per status, completed jobs per predicted outcome) are adjusted in the
+same SQLite transaction. The dashboard reads them in O(1) instead of running
+count scans over the jobs table. `reconcile_stats.py` rebuilds everything from
+Supabase if the counters ever drift (or on first deploy).
+
+The store is a local SQLite file (JOB_STATS_PATH), so the counters are per
+host: each API host only sees the status changes of the jobs it ran. With
+several API hosts they drift apart, so there set DASHBOARD_USE_COUNTERS =
+false and the dashboard runs the count queries instead
+(JobRepository.dashboard_counts, which apply the same definitions).
+"""
+import os
+import sqlite3
+import time
+from app.core.config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_state (
+    job_id   TEXT PRIMARY KEY,
+    status   TEXT NOT NULL,
+    outcome  TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name   TEXT PRIMARY KEY,
+    value  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT
+);
+"""
+
+OPEN_STATUSES = ("PENDING", "PROCESSING")
+
+
+def outcome_bucket(outcome) -> str:
+    """Classifies a predicted_fos_outcome string as upheld / rejected / unclear."""
+    lowered = (outcome or "").lower()
+    if "not upheld" in lowered or "rejected" in lowered:
+        return "rejected"
+    if "upheld" in lowered:
+        return "upheld"
+    return "unclear"
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(settings.JOB_STATS_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(settings.JOB_STATS_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _counter_names(status, outcome) -> list:
+    if status is None:
+        return []
+    names = [f"status:{status}"]
+    if status == "COMPLETE" and outcome is not None:
+        names.append(f"outcome:{outcome}")
+    return names
+
+
+def _apply(conn, names, delta: int):
+    for name in names:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, delta)
+        )
+
+
+def record_status(job_id: str, status: str, predicted_outcome: str = None):
+    """Records a job's new status (and outcome once COMPLETE), moving it between counters."""
+    outcome = outcome_bucket(predicted_outcome) if status == "COMPLETE" else None
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        previous = conn.execute("SELECT status, outcome FROM job_state WHERE job_id = ?", (job_id,)).fetchone()
+        if previous != (status, outcome):
+            _apply(conn, _counter_names(*(previous or (None, None))), -1)
+            _apply(conn, _counter_names(status, outcome), +1)
+            conn.execute(
+                "INSERT OR REPLACE INTO job_state (job_id, status, outcome) VALUES (?, ?, ?)",
+                (job_id, status, outcome)
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def safe_record_status(job_id: str, status: str, predicted_outcome: str = None):
+    """record_status for the request/pipeline path: stats must never fail a job."""
+    try:
+        record_status(job_id, status, predicted_outcome)
+    except Exception as e:
+        print(f"Could not update job stats for {job_id}: {e}")
+
+
+def get_statuses(job_ids: list) -> dict:
+    """Current status of each given job that the stats store knows about."""
+    statuses = {}
+    conn = _connect()
+    try:
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            statuses.update(conn.execute(
+                f"SELECT job_id, status FROM job_state WHERE job_id IN ({placeholders})", chunk
+            ).fetchall())
+    finally:
+        conn.close()
+    return statuses
+
+
+def get_counters():
+    """All counters as a dict, or None if the stats store has never been reconciled."""
+    conn = _connect()
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'reconciled_at'").fetchone() is None:
+            return None
+        return dict(conn.execute("SELECT name, value FROM counters").fetchall())
+    finally:
+        conn.close()
+
+
+def dashboard_counts(counters: dict) -> dict:
+    """Maps raw counters to the figures the dashboard shows."""
+    return {
+        "open": sum(counters.get(f"status:{status}", 0) for status in OPEN_STATUSES),
+        "at_risk": counters.get("outcome:upheld", 0),
+        "completed": counters.get("status:COMPLETE", 0),
+    }
+
+
+def rebuild(jobs) -> int:
+    """
+    Replaces all state and counters from an iterable of
+    (job_id, status, predicted_outcome) tuples. Returns the number of jobs.
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM job_state")
+        conn.execute("DELETE FROM counters")
+        count = 0
+        for job_id, status, predicted_outcome in jobs:
+            outcome = outcome_bucket(predicted_outcome) if status == "COMPLETE" else None
+            conn.execute("INSERT OR REPLACE INTO job_state (job_id, status, outcome) VALUES (?, ?, ?)", (job_id, status, outcome))
+            _apply(conn, _counter_names(status, outcome), +1)
+            count += 1
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('reconciled_at', ?)", (str(time.time()),))
+        conn.execute("COMMIT")
+        return count
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
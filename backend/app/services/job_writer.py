@@ -0,0 +1,149 @@
+"""
+Write-behind, coalescing writer for job row updates.
+
+The pipeline records several state changes per job (PROCESSING, extracted
+texts, partial report sections, COMPLETE/ERROR). Instead of one Supabase round
+trip each, updates are merged into a single pending patch per job and flushed
+in the background every JOB_STATE_FLUSH_INTERVAL_SECONDS, or as soon as
+JOB_STATE_BATCH_SIZE jobs have pending changes. A flush sends one PATCH per
+job (JOB_STATE_FLUSH_CONCURRENCY at a time); it only updates rows that exist,
+so a job deleted in the meantime is not brought back.
+
+JOB_STATE_DURABILITY controls what a crash can lose:
+  "always"   - every update is written through immediately (no coalescing)
+  "terminal" - COMPLETE/ERROR are written through, intermediate states may lag
+  "interval" - everything may lag by up to one flush interval
+Intermediate states are safe to lose: a job whose worker dies is re-run.
+"""
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core.timing import timed
+from app.services.supabase_client import supabase
+
+DURABILITY_MODES = ("always", "terminal", "interval")
+
+
+class JobStateWriter:
+    def __init__(self, flush_interval: float = 0.5, batch_size: int = 50, durability: str = "terminal",
+                 concurrency: int = 8):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}, got '{durability}'")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.durability = durability
+        self._pending = {}  # job_id -> merged patch
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="job-writer")
+        self.updates = 0
+        self.requests = 0
+
+    def update(self, job_id: str, values: dict, terminal: bool = False):
+        """
+        Queues a patch for a job's row. Terminal updates (under "always" and
+        "terminal" durability) are flushed before returning, and raise if the
+        write fails so the caller can retry.
+        """
+        with self._lock:
+            self._pending.setdefault(job_id, {}).update(values)
+            self.updates += 1
+            pending = len(self._pending)
+
+        if self.durability == "always" or (terminal and self.durability == "terminal"):
+            self.flush([job_id])
+            return
+        self._ensure_thread()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Job state flush failed, will retry: {e}")
+
+    def flush(self, job_ids=None):
+        """Writes pending patches (all, or only those of `job_ids`). Failed patches are kept for the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                keys = list(self._pending) if job_ids is None else [j for j in job_ids if j in self._pending]
+                batch = {job_id: self._pending.pop(job_id) for job_id in keys}
+            if not batch:
+                return
+
+            results = self._write_all(batch)
+            failed = {job_id: error for job_id, error in results.items() if error is not None}
+            self.requests += len(batch)
+            if failed:
+                with self._lock:
+                    for job_id in failed:
+                        # Newer updates that arrived meanwhile win over the failed ones
+                        self._pending[job_id] = {**batch[job_id], **self._pending.get(job_id, {})}
+                raise next(iter(failed.values()))
+
+    def _write_all(self, batch: dict) -> dict:
+        """Writes every patch, concurrently when there are several. Returns {job_id: error or None}."""
+        if len(batch) == 1:
+            return {job_id: self._write(job_id, patch) for job_id, patch in batch.items()}
+        futures = {}
+        for job_id, patch in batch.items():
+            try:
+                futures[job_id] = self._executor.submit(self._write, job_id, patch)
+            except RuntimeError:
+                # The interpreter is shutting down (flush_on_exit): write the rest in this thread
+                futures[job_id] = None
+        return {
+            job_id: future.result() if future is not None else self._write(job_id, batch[job_id])
+            for job_id, future in futures.items()
+        }
+
+    @staticmethod
+    def _write(job_id: str, patch: dict):
+        """PATCHes one job's row; returns the error instead of raising so one failure doesn't hide the others."""
+        try:
+            with timed('supabase', operation='update:jobs'):
+                supabase.table('jobs').update(patch).eq('job_id', job_id).execute()
+        except Exception as e:
+            return e
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "durability": self.durability,
+                "pending_jobs": len(self._pending),
+                "updates": self.updates,
+                "requests": self.requests,
+            }
+
+
+writer = JobStateWriter(
+    flush_interval=settings.JOB_STATE_FLUSH_INTERVAL_SECONDS,
+    batch_size=settings.JOB_STATE_BATCH_SIZE,
+    durability=settings.JOB_STATE_DURABILITY,
+    concurrency=settings.JOB_STATE_FLUSH_CONCURRENCY
+)
+
+
+def flush_on_exit():
+    try:
+        writer.flush()
+    except Exception as e:
+        print(f"Could not flush pending job state on exit: {e}")
+
+
+atexit.register(flush_on_exit)
@@ -0,0 +1,148 @@
+"""
+Incremental parsing of the streamed LLM report.
+
+`TopLevelObjectParser` is fed the response text chunk by chunk and hands back
+each top-level key of the JSON object as soon as its value is complete, so the
+pipeline can publish `case_summary` while the model is still writing
+`recommendations`. Anything before the opening brace (e.g. a ```json fence) is
+skipped. `repair_json` is the fallback for responses that are not valid JSON
+as a whole: it strips fences, drops trailing commas and closes whatever the
+model left open.
+"""
+import json
+import re
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+class TopLevelObjectParser:
+    def __init__(self):
+        self.result = {}
+        self.malformed = []  # keys whose value could not be decoded
+        self.complete = False
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key = None
+        self._buffer = []
+
+    def feed(self, chunk: str) -> list:
+        """Consumes the next chunk. Returns the (key, value) pairs completed by it."""
+        completed = []
+        for char in chunk:
+            if self.complete:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._buffer.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+                self._buffer.append(char)
+                continue
+
+            if self._expect_key:
+                if char == ":":
+                    self._key = self._decode("".join(self._buffer))
+                    self._buffer = []
+                    self._expect_key = False
+                elif char == "}":
+                    self.complete = True
+                elif char != ",":
+                    self._buffer.append(char)
+                continue
+
+            if char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._finish_value(completed)
+                    self.complete = True
+                    continue
+                self._depth -= 1
+            elif char == "," and self._depth == 1:
+                self._finish_value(completed)
+                continue
+            self._buffer.append(char)
+        return completed
+
+    @staticmethod
+    def _decode(text: str):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
+
+    def _finish_value(self, completed: list):
+        text = "".join(self._buffer).strip()
+        self._buffer = []
+        self._expect_key = True
+        if not isinstance(self._key, str):
+            return
+        try:
+            value = json.loads(_TRAILING_COMMA.sub(r"\1", text))
+        except ValueError:
+            self.malformed.append(self._key)
+            return
+        self.result[self._key] = value
+        completed.append((self._key, value))
+
+
+def _close_open_structures(text: str) -> str:
+    """Appends whatever quotes and brackets are needed to close a truncated document."""
+    stack = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    closing = '"' if in_string else ""
+    closing += "".join(reversed(stack))
+    return text.rstrip().rstrip(",") + closing if not in_string else text + closing
+
+
+def repair_json(text: str) -> dict:
+    """Best-effort recovery of a JSON object from an LLM response. Raises ValueError if it can't."""
+    text = _FENCE.sub("", text.strip())
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("no JSON object in response")
+    end = text.rfind("}") + 1
+
+    candidates = []
+    if end > start:
+        candidates.append(text[start:end])
+    candidates.append(_close_open_structures(text[start:]))
+    for candidate in candidates:
+        for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+            try:
+                value = json.loads(attempt)
+            except ValueError:
+                continue
+            if isinstance(value, dict):
+                return value
+    raise ValueError("response could not be repaired into a JSON object")
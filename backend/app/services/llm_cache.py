@@ -0,0 +1,129 @@
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed by (model name, SHA-256 of the prompt), so the same prompt
+sent to the same model is answered from memory instead of calling Gemini
+again. The in-memory tier is an LRU bounded by entry count with a TTL; an
+optional on-disk tier (one JSON file per key) survives restarts and is shared
+between worker processes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from app.core.config import settings
+from app.core import metrics
+
+
+class LLMResponseCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 86400, disk_dir: str = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self._entries = OrderedDict()  # key -> (stored_at, text)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model_name: str, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model_name}\x00{prompt_hash}".encode("utf-8")).hexdigest()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key: str, stored_at: float, text: str):
+        self._entries[key] = (stored_at, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, model_name: str, prompt: str):
+        """Returns the cached response text, or None on a miss."""
+        key = self.key(model_name, prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.LLM_CACHE_LOOKUPS.inc(result="hit")
+                return entry[1]
+            self._entries.pop(key, None)
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+                if not self._expired(stored["stored_at"]):
+                    with self._lock:
+                        self._remember(key, stored["stored_at"], stored["text"])
+                        self.hits += 1
+                        self.disk_hits += 1
+                    metrics.LLM_CACHE_LOOKUPS.inc(result="disk_hit")
+                    return stored["text"]
+                os.remove(self._disk_path(key))
+            except (OSError, ValueError, KeyError):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        metrics.LLM_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def set(self, model_name: str, prompt: str, text: str):
+        key = self.key(model_name, prompt)
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, text)
+        if self.disk_dir:
+            tmp_path = f"{self._disk_path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": model_name, "stored_at": stored_at, "text": text}, f)
+            os.replace(tmp_path, self._disk_path(key))
+
+    def invalidate(self, model_name: str, prompt: str):
+        """Drops an entry, e.g. when a cached response turned out to be unusable."""
+        key = self.key(model_name, prompt)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def get_or_generate(self, model_name: str, prompt: str, generate) -> str:
+        """Returns the cached response, or calls `generate()` and caches its text."""
+        text = self.get(model_name, prompt)
+        if text is None:
+            text = generate()
+            self.set(model_name, prompt, text)
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+llm_cache = LLMResponseCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    disk_dir=settings.LLM_CACHE_DIR
+)
@@ -0,0 +1,362 @@
+"""
+Single gateway for every LLM call.
+
+All Gemini traffic from the pipeline and the explain endpoints goes through
+`get_gateway()`, which:
+  - caps concurrent calls (LLM_MAX_IN_FLIGHT),
+  - paces requests and prompt tokens with token buckets sized to the quota
+    (LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE),
+  - retries rate-limit, timeout and 5xx errors with exponential backoff and jitter,
+  - optionally hedges: if a call has not answered after LLM_HEDGE_AFTER_SECONDS
+    a second identical call is raced against it and the first answer wins,
+  - records latency and token counts per call (see `stats()`).
+
+Limits apply per process; with JOB_WORKERS worker processes, size the quota
+settings to your project quota divided by the number of processes.
+LLM_BACKEND=fake swaps Gemini for `FakeBackend`, a local stand-in with
+configurable latency, for tests and benchmarks.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from app.core.config import settings
+from app.core import metrics, timing
+from app.services.prompt_builder import estimate_tokens, REPORT_KEYS
+
+# google.api_core exception class names worth retrying
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "GatewayTimeout", "BadGateway", "Aborted",
+}
+
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class StreamInterrupted(Exception):
+    """A stream failed with a retryable error after text had been yielded; only the caller can restart it."""
+
+
+def with_stream_restarts(attempt, restarts: int):
+    """
+    Runs `attempt()` and runs it again, up to `restarts` more times, when it
+    raises StreamInterrupted. `attempt` must reset whatever it built from the
+    chunks of the broken stream. Other errors were already retried by the
+    gateway and are raised as they are.
+    """
+    for restart in range(restarts + 1):
+        try:
+            return attempt()
+        except StreamInterrupted as e:
+            if restart == restarts:
+                raise
+            metrics.STAGE_RETRIES.inc(stage="llm_stream")
+            print(f"{e}; restarting the stream ({restart + 1}/{restarts})")
+
+
+class GeminiBackend:
+    """google.generativeai, configured once with one GenerativeModel per model name."""
+
+    def __init__(self, api_key: str):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._models = {}
+
+    def _model(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = self._genai.GenerativeModel(model_name)
+        return model
+
+    @staticmethod
+    def _usage(response) -> tuple:
+        usage = getattr(response, "usage_metadata", None)
+        return (getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0)
+
+    def generate(self, model_name: str, prompt: str, timeout: float):
+        """Returns (text, prompt_tokens, output_tokens)."""
+        response = self._model(model_name).generate_content(prompt, request_options={"timeout": timeout})
+        return (response.text, *self._usage(response))
+
+    def stream(self, model_name: str, prompt: str, timeout: float, usage: dict):
+        """Yields text chunks; fills `usage` from the final chunk's metadata."""
+        response = self._model(model_name).generate_content(prompt, stream=True, request_options={"timeout": timeout})
+        for chunk in response:
+            usage["prompt_tokens"], usage["output_tokens"] = self._usage(chunk)
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # chunk without text parts (e.g. only finish/safety metadata)
+            yield text
+
+
+class FakeBackend:
+    """Local stand-in for Gemini: answers every prompt with a canned report after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, failure_rate: float = 0.0, chunk_count: int = 8,
+                 interruptions: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.chunk_count = chunk_count
+        # The first `interruptions` streams drop the connection after their first chunk
+        self.interruptions = interruptions
+        self._lock = threading.Lock()
+
+    def _sleep(self, fraction: float = 1.0):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)) * fraction)
+
+    def _maybe_fail(self):
+        if random.random() < self.failure_rate:
+            raise TimeoutError("fake backend timed out")
+
+    @staticmethod
+    def response_text() -> str:
+        report = {key: f"Fake {key.replace('_', ' ')}." for key in REPORT_KEYS}
+        report["frl_compliance_checks"] = [{"item": "Clarity", "compliant": True, "reason": "Fake reason."}]
+        report["historical_precedent_analysis"] = ["Fake analysis citing DRN0000000."]
+        report["key_risk_indicators"] = ["Fake risk."]
+        report["predicted_fos_outcome"] = {"outcome": "50/50 - Unclear", "confidence": "50%"}
+        report["financial_impact_assessment"] = {"low_estimate": "£0", "high_estimate": "£0"}
+        report["outcome_rationale"] = ["Fake reason one.", "Fake reason two.", "Fake reason three."]
+        report["confidence_rationale"] = ["Fake factor one.", "Fake factor two.", "Fake factor three."]
+        return json.dumps(report)
+
+    def generate(self, model_name: str, prompt: str, timeout: float):
+        self._sleep()
+        self._maybe_fail()
+        text = self.response_text()
+        return text, estimate_tokens(prompt), estimate_tokens(text)
+
+    def stream(self, model_name: str, prompt: str, timeout: float, usage: dict):
+        self._maybe_fail()
+        text = self.response_text()
+        step = max(1, len(text) // self.chunk_count)
+        with self._lock:
+            interrupt = self.interruptions > 0
+            if interrupt:
+                self.interruptions -= 1
+        for start in range(0, len(text), step):
+            if interrupt and start:
+                raise ConnectionError("fake backend dropped the stream")
+            self._sleep(1 / self.chunk_count)
+            yield text[start:start + step]
+        usage["prompt_tokens"], usage["output_tokens"] = estimate_tokens(prompt), estimate_tokens(text)
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` tokens per minute up to `capacity`; `acquire` blocks until enough are available."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Takes `amount` tokens (capped at capacity). Returns the seconds spent waiting."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class LLMGateway:
+    def __init__(self, backend, max_in_flight: int = 4, requests_per_minute: float = 60,
+                 tokens_per_minute: float = 1_000_000, max_retries: int = 4, backoff_seconds: float = 1.0,
+                 hedge_after_seconds: float = 0.0, timeout_seconds: float = 120.0, history_size: int = 1000):
+        self.backend = backend
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+        self.timeout_seconds = timeout_seconds
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight * 2, thread_name_prefix="llm-hedge")
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=history_size)  # recent per-call records
+        self.counters = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                         "rate_limit_wait_seconds": 0.0, "prompt_tokens": 0, "output_tokens": 0}
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def _record(self, model_name: str, kind: str, started: float, prompt_tokens: int, output_tokens: int, ok: bool):
+        latency = time.monotonic() - started
+        timing.record("llm_call", latency, kind=kind, ok=str(ok).lower())
+        metrics.LLM_TOKENS.inc(prompt_tokens, direction="prompt")
+        metrics.LLM_TOKENS.inc(output_tokens, direction="output")
+        with self._lock:
+            self._calls.append({
+                "model": model_name, "kind": kind, "ok": ok,
+                "latency": round(latency, 4),
+                "prompt_tokens": prompt_tokens, "output_tokens": output_tokens,
+            })
+            self.counters["calls"] += 1
+            self.counters["failures"] += 0 if ok else 1
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["output_tokens"] += output_tokens
+
+    def _admit(self, prompt: str):
+        waited = self._requests.acquire() + self._tokens.acquire(estimate_tokens(prompt))
+        if waited:
+            self._count(rate_limit_wait_seconds=waited)
+
+    def _attempt(self, model_name: str, prompt: str, admitted: threading.Event = None) -> str:
+        with self._slots:
+            self._admit(prompt)
+            if admitted is not None:
+                admitted.set()
+            started = time.monotonic()
+            try:
+                text, prompt_tokens, output_tokens = self.backend.generate(model_name, prompt, self.timeout_seconds)
+            except Exception:
+                self._record(model_name, "generate", started, 0, 0, False)
+                raise
+            self._record(model_name, "generate", started, prompt_tokens, output_tokens, True)
+            return text
+
+    def _hedged(self, model_name: str, prompt: str) -> str:
+        if not self.hedge_after_seconds:
+            return self._attempt(model_name, prompt)
+        admitted = threading.Event()
+        primary = self._executor.submit(self._attempt, model_name, prompt, admitted)
+        # The hedge clock starts once the primary holds a slot and has passed the
+        # rate limits; queueing for them is not a slow answer, and a hedge would
+        # only queue behind it
+        while not admitted.wait(0.05):
+            if primary.done():
+                return primary.result()
+        done, _ = wait([primary], timeout=self.hedge_after_seconds)
+        if done:
+            return primary.result()
+
+        self._count(hedges=1)
+        hedge = self._executor.submit(self._attempt, model_name, prompt)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count(hedge_wins=1)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _backoff(self, attempt: int, error: Exception):
+        delay = self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+        print(f"LLM call failed ({type(error).__name__}: {error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        self._count(retries=1)
+        time.sleep(delay)
+
+    def generate(self, prompt: str, model_name: str = None) -> str:
+        """One completion, with limits, retries and (optionally) hedging. Returns the text."""
+        model_name = model_name or settings.GEMINI_MODEL_NAME
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._hedged(model_name, prompt)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self._backoff(attempt, e)
+
+    def stream(self, prompt: str, model_name: str = None):
+        """
+        Yields the completion in chunks. Failures before the first chunk are
+        retried here; once text has been yielded a retryable failure raises
+        StreamInterrupted and the caller has to restart (with_stream_restarts).
+        """
+        model_name = model_name or settings.GEMINI_MODEL_NAME
+        for attempt in range(self.max_retries + 1):
+            yielded = False
+            usage = {"prompt_tokens": 0, "output_tokens": 0}
+            with self._slots:
+                self._admit(prompt)
+                started = time.monotonic()
+                try:
+                    for chunk in self.backend.stream(model_name, prompt, self.timeout_seconds, usage):
+                        yielded = True
+                        yield chunk
+                except Exception as e:
+                    self._record(model_name, "stream", started, usage["prompt_tokens"], usage["output_tokens"], False)
+                    if yielded and is_retryable(e):
+                        raise StreamInterrupted(f"LLM stream broke after its first chunk ({type(e).__name__}: {e})") from e
+                    if yielded or attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+                else:
+                    self._record(model_name, "stream", started, usage["prompt_tokens"], usage["output_tokens"], True)
+                    return
+            self._backoff(attempt, error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(call["latency"] for call in self._calls if call["ok"])
+            summary = dict(self.counters)
+            summary["rate_limit_wait_seconds"] = round(summary["rate_limit_wait_seconds"], 3)
+            summary["recent_calls"] = len(self._calls)
+        for name, q in (("latency_p50", 0.5), ("latency_p95", 0.95), ("latency_p99", 0.99)):
+            summary[name] = latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+        return summary
+
+    def recent_calls(self, limit: int = 50) -> list:
+        with self._lock:
+            return list(self._calls)[-limit:]
+
+
+def create_backend(name: str = None):
+    name = name or settings.LLM_BACKEND
+    if name == "fake":
+        return FakeBackend(latency=settings.LLM_FAKE_LATENCY_SECONDS)
+    if name == "gemini":
+        return GeminiBackend(settings.GEMINI_API_KEY)
+    raise ValueError(f"Unknown LLM_BACKEND '{name}' (expected 'gemini' or 'fake')")
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway, created on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    create_backend(),
+                    max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+                    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+                    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    backoff_seconds=settings.LLM_RETRY_BACKOFF_SECONDS,
+                    hedge_after_seconds=settings.LLM_HEDGE_AFTER_SECONDS,
+                    timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+                )
+    return _gateway
+
+
+def set_gateway(gateway: LLMGateway):
+    """Replaces the process-wide gateway (e.g. with one over FakeBackend)."""
+    global _gateway
+    _gateway = gateway
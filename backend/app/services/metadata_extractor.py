@@ -0,0 +1,225 @@
+"""
+Rule-based metadata extraction for complaints and ombudsman decisions.
+
+Only the spaCy tokenizer runs over whole documents: product types, themes and
+remedies come from PhraseMatchers (case-insensitive), and the firm, outcome
+and amounts from regexes over the text. The statistical NER component is the
+only model component loaded (tagger, parser, lemmatizer etc. are excluded),
+and it only runs over the opening of documents whose firm no regex found.
+
+`extract_many` batches documents through `nlp.pipe` (optionally with several
+processes); `extract` is the single-document form used by the live pipeline.
+
+Extracted fields:
+    firm_name             e.g. "Creation Consumer Finance Ltd", or None
+    product_type          canonical product (PRODUCTS), or None
+    key_themes            up to MAX_THEMES canonical themes, most mentioned first
+                          (filter_themes drops the BROAD_THEMES for retrieval)
+    fos_outcome           "Upheld" / "Partially Upheld" / "Not Upheld", or None
+    compensation_awarded  sum of the amounts a decision directs the firm to pay
+    redress_amount        sum of the amounts it directs the firm to refund
+    remedial_action       remedies the decision directs (REMEDIES)
+"""
+import re
+from collections import Counter
+
+MAX_THEMES = 3
+FIRM_NER_CHARS = 3000
+EXCLUDED_COMPONENTS = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+
+PRODUCTS = {
+    "Credit Card": ["credit card", "store card", "card account", "running account credit", "running-account credit"],
+    "Point of Sale Finance": ["fixed sum loan", "point of sale", "retail finance", "interest free credit",
+                              "interest-free credit", "buy now pay later", "instalment credit"],
+    "Personal Loan": ["personal loan", "unsecured loan", "loan agreement"],
+    "Car Finance": ["hire purchase", "car finance", "conditional sale", "personal contract purchase"],
+    "Mortgage": ["mortgage", "remortgage", "mortgage account"],
+    "Current Account": ["current account", "overdraft"],
+    "Payment Protection Insurance": ["payment protection insurance", "ppi"],
+}
+
+THEMES = {
+    "Affordability": ["affordability", "affordable", "unaffordable", "creditworthiness", "irresponsible lending",
+                      "irresponsibly lent", "affordability checks"],
+    "Credit Limit": ["credit limit", "limit increase", "limit decrease", "limit reduction"],
+    "Arrears and Collections": ["arrears", "missed payments", "missed payment", "debt collection", "debt collector",
+                                "collections agency"],
+    "Default": ["default notice", "defaulted"],
+    "Credit File": ["credit file", "credit reference agencies", "credit reference agency", "credit report",
+                    "credit record"],
+    "Section 75 and Misrepresentation": ["section 75", "misrepresentation", "misrepresented", "breach of contract",
+                                         "faulty goods"],
+    "Interest and Charges": ["interest rate", "interest rates", "interest charges", "late payment fee",
+                             "late payment fees", "late payment charges", "late fees", "overdraft charges",
+                             "overdraft fees", "default charges", "default fees", "bank charges", "arrangement fee",
+                             "annual fee", "over limit fee", "over limit fees", "returned payment fee"],
+    "Customer Service": ["customer service", "poor service", "distress and inconvenience", "complaint handling"],
+    "Fraud": ["fraud", "fraudulent", "scam", "unauthorised transactions"],
+    "Financial Difficulty": ["financial difficulty", "financial difficulties", "financial hardship", "payment plan",
+                             "breathing space", "forbearance", "struggling financially"],
+}
+
+# Extracted and stored, but too common to filter retrieval on: about a fifth
+# of decisions award for "distress and inconvenience"
+BROAD_THEMES = {"Customer Service"}
+
+AMOUNT = r"£\s?(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{2}))?"
+FIRM_SUFFIX = r"(?:Ltd|Limited|PLC|plc|LLP)"
+FIRM_NAME = rf"(?:[A-Z][\w&'\-]*\.?\s+(?:(?:and|of|&)\s+)?){{1,6}}?{FIRM_SUFFIX}\b"
+# "Mr L complains that Creation Consumer Finance Ltd decreased ..." / "my complaint about X Bank PLC"
+FIRM_COMPLAINT = re.compile(rf"complain(?:s|ed|t|ing)?\s+(?:that|about|against)\s+(?P<firm>{FIRM_NAME})")
+FIRM_ANY = re.compile(rf"(?<![\w&'\-])(?P<firm>{FIRM_NAME})")
+ORG_STOPLIST = {"financial ombudsman service", "the financial ombudsman service", "ombudsman", "fca",
+                "financial conduct authority", "fos"}
+
+FINAL_DECISION = re.compile(r"my final decision", re.IGNORECASE)
+PUTTING_RIGHT = re.compile(r"^\s*(?:putting things right|what \w+ should do to put things right)\s*$", re.IGNORECASE | re.MULTILINE)
+NOT_UPHELD = re.compile(r"\b(?:do not|don['’]t|didn['’]t|did not|won['’]t|will not|can['’]t|cannot|am not)\s+(?:\w+\s+)?"
+                        r"uphold(?:ing)?\b|\bnot\s+(?:be\s+)?upheld\b"
+                        r"|(?:\bnot|n['’]t)\b[^.]{0,80}\bto (?:do (?:anything|any more)|take any (?:further |more )?(?:steps|action))\b", re.IGNORECASE)
+PARTLY_UPHELD = re.compile(r"\buphold\b[^.]{0,40}\bin part\b|\bpart(?:ly|ially)\s+uphold|\bpart(?:ly|ially)\s+upheld",
+                           re.IGNORECASE)
+UPHELD = re.compile(r"\buphold(?:ing)?\b|\bupheld\b", re.IGNORECASE)
+# Decisions that only give directions ("Creation ... should pay Mr H £300") uphold the complaint
+DIRECTION = re.compile(r"\b(?:should|must|needs? to|has to|have to|to)\s+(?:\w+\s+){0,2}?"
+                       r"(?:pay|refund|reduce|remove|rework|write off|reimburse|amend|put things right)\b", re.IGNORECASE)
+PAY_AMOUNT = re.compile(rf"\bpay\s+(?:(?:Mr|Mrs|Miss|Ms|Dr)\s+[A-Z]\s+)?(?:(?:a total of|an additional|a further|the|an|a)\s+)?{AMOUNT}"
+                        rf"|{AMOUNT}\s+(?:in\s+)?(?:compensation|for\s+(?:the\s+)?(?:distress|trouble|inconvenience))")
+REFUND_AMOUNT = re.compile(rf"\brefund\w*\s+[^£.]{{0,80}}?{AMOUNT}", re.IGNORECASE)
+REMEDIES = (
+    ("Apology", re.compile(r"\bapologi[sz]e", re.IGNORECASE)),
+    ("Compensation", PAY_AMOUNT),
+    ("Refund", re.compile(r"\brefund", re.IGNORECASE)),
+    ("Interest and Charges Removed", re.compile(r"\b(?:remove|rework|refund|waive)\w*\b[^.]{0,60}\b(?:interest|charges|fees)\b",
+                                                re.IGNORECASE)),
+    ("Credit File Amendment", re.compile(r"\b(?:remove|amend|update|correct)\w*\b[^.]{0,60}\bcredit (?:file|record|report)",
+                                         re.IGNORECASE)),
+    ("Debt Written Off", re.compile(r"\bwrite[s\-]?\s?off\b|\bwritten off\b", re.IGNORECASE)),
+    ("Payment Plan", re.compile(r"\b(?:re)?payment plan\b", re.IGNORECASE)),
+)
+
+
+def filter_themes(themes) -> list:
+    """The themes specific enough to use as a hard retrieval filter."""
+    return [theme for theme in themes or [] if theme not in BROAD_THEMES]
+
+
+def _clean(name: str) -> str:
+    name = re.sub(r"\s+", " ", name).strip(" .,")
+    return name[4:] if name.startswith("The ") else name
+
+
+def _amount(match) -> float:
+    groups = [group for group in match.groups() if group is not None]
+    pounds, pence = groups[0], groups[1] if len(groups) > 1 else None
+    return float(pounds.replace(",", "")) + (int(pence) / 100 if pence else 0.0)
+
+
+def decision_section(text: str) -> str:
+    """The text from the last 'My final decision' heading on, or the closing part of the document."""
+    matches = list(FINAL_DECISION.finditer(text))
+    return text[matches[-1].start():] if matches else text[-2000:]
+
+
+def redress_section(text: str) -> str:
+    """The 'Putting things right' section and the final decision, where the directed remedies are set out."""
+    matches = list(PUTTING_RIGHT.finditer(text))
+    return text[matches[-1].start():] if matches else decision_section(text)
+
+
+def extract_outcome(text: str):
+    section = decision_section(text)
+    if PARTLY_UPHELD.search(section):
+        return "Partially Upheld"
+    negatives = [match.span() for match in NOT_UPHELD.finditer(section)]
+    upheld = any(not any(start <= match.start() < end for start, end in negatives) for match in UPHELD.finditer(section))
+    if upheld and negatives:
+        # e.g. "I uphold the complaint about the limit increase but don't uphold ..."
+        return "Partially Upheld"
+    if negatives:
+        return "Not Upheld"
+    return "Upheld" if upheld or DIRECTION.search(section) else None
+
+
+def extract_amounts(section: str):
+    """(compensation_awarded, redress_amount) directed in a redress section; None when it directs none."""
+    # Distinct amounts: the final decision usually repeats what 'Putting things right' set out
+    compensation = {_amount(match) for match in PAY_AMOUNT.finditer(section)}
+    redress = {_amount(match) for match in REFUND_AMOUNT.finditer(section)}
+    return (round(sum(compensation), 2) if compensation else None,
+            round(sum(redress), 2) if redress else None)
+
+
+def extract_firm_by_rules(text: str):
+    """The firm named in the complaint statement, else the most mentioned legal entity in the opening."""
+    match = FIRM_COMPLAINT.search(text)
+    if match:
+        return _clean(match["firm"])
+    names = Counter(_clean(m["firm"]) for m in FIRM_ANY.finditer(text[:FIRM_NER_CHARS * 2]))
+    return names.most_common(1)[0][0] if names else None
+
+
+class MetadataExtractor:
+    def __init__(self, nlp):
+        from spacy.matcher import PhraseMatcher
+        self.nlp = nlp
+        self.product_matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        for product, phrases in PRODUCTS.items():
+            self.product_matcher.add(product, list(nlp.tokenizer.pipe(phrases)))
+        self.theme_matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        for theme, phrases in THEMES.items():
+            self.theme_matcher.add(theme, list(nlp.tokenizer.pipe(phrases)))
+        self._has_ner = "ner" in nlp.pipe_names
+
+    @classmethod
+    def load(cls, model_name: str = "en_core_web_sm"):
+        """Loads the spaCy model with only the tokenizer and NER."""
+        import spacy
+        return cls(spacy.load(model_name, exclude=EXCLUDED_COMPONENTS))
+
+    def _counts(self, matcher, doc) -> Counter:
+        return Counter(self.nlp.vocab.strings[match_id] for match_id, _, _ in matcher(doc))
+
+    def _from_doc(self, doc) -> dict:
+        text = doc.text
+        products = self._counts(self.product_matcher, doc)
+        themes = self._counts(self.theme_matcher, doc)
+        outcome = extract_outcome(text)
+        section = redress_section(text)
+        compensation, redress = extract_amounts(section) if outcome in ("Upheld", "Partially Upheld") else (None, None)
+        remedies = [name for name, pattern in REMEDIES if pattern.search(section)] \
+            if outcome in ("Upheld", "Partially Upheld") else []
+        return {
+            "firm_name": extract_firm_by_rules(text),
+            "product_type": products.most_common(1)[0][0] if products else None,
+            "key_themes": [theme for theme, _ in themes.most_common(MAX_THEMES)],
+            "fos_outcome": outcome,
+            "compensation_awarded": compensation,
+            "redress_amount": redress,
+            "remedial_action": remedies,
+        }
+
+    def _firms_by_ner(self, texts: list, n_process: int, batch_size: int) -> list:
+        """Most mentioned organisation in the opening of each text (the regexes found none)."""
+        firms = []
+        snippets = (text[:FIRM_NER_CHARS] for text in texts)
+        for doc in self.nlp.pipe(snippets, n_process=n_process, batch_size=batch_size):
+            orgs = Counter(_clean(ent.text) for ent in doc.ents
+                           if ent.label_ == "ORG" and _clean(ent.text).lower() not in ORG_STOPLIST)
+            firms.append(orgs.most_common(1)[0][0] if orgs else None)
+        return firms
+
+    def extract_many(self, texts, n_process: int = 1, batch_size: int = 32) -> list:
+        """Metadata for each text, tokenizing them in batches with `nlp.pipe` (NER disabled)."""
+        texts = [text or "" for text in texts]
+        docs = self.nlp.pipe(texts, disable=["ner"], n_process=n_process, batch_size=batch_size)
+        results = [self._from_doc(doc) for doc in docs]
+
+        missing = [i for i, result in enumerate(results) if result["firm_name"] is None and texts[i]]
+        if missing and self._has_ner:
+            for i, firm in zip(missing, self._firms_by_ner([texts[i] for i in missing], n_process, batch_size)):
+                results[i]["firm_name"] = firm
+        return results
+
+    def extract(self, text: str) -> dict:
+        return self.extract_many([text])[0]
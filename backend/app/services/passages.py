@@ -0,0 +1,64 @@
+"""
+Splits ombudsman decisions into overlapping passages for passage-level retrieval.
+
+Decisions are first cut at their section headings ("What happened",
+"What I've decided - and why", "My final decision", ...) and each section is
+then windowed into passages of at most `max_words` words, overlapping by
+`overlap_words` so that reasoning spanning a boundary appears whole in one passage.
+"""
+import re
+
+SECTION_HEADING = re.compile(
+    r"(the complaint(?: and what happened)?"
+    r"|what happened\??"
+    r"|background"
+    r"|what i(?:['’]ve| have) decided(?:\s*[-–—]\s*and why)?"
+    r"|my (?:provisional )?findings(?: on (?:jurisdiction|merits))?"
+    r"|merits"
+    r"|fair compensation"
+    r"|putting things right"
+    r"|responses? to (?:my )?provisional decision"
+    r"|my (?:provisional|final) decision)",
+    re.IGNORECASE,
+)
+DEFAULT_SECTION = "Preamble"
+
+
+def split_sections(text: str) -> list:
+    """Returns [(heading, body), ...] in document order."""
+    sections = []
+    heading, lines = DEFAULT_SECTION, []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and SECTION_HEADING.fullmatch(stripped):
+            if any(l.strip() for l in lines):
+                sections.append((heading, "\n".join(lines).strip()))
+            heading, lines = stripped.rstrip("?"), []
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append((heading, "\n".join(lines).strip()))
+    return sections
+
+
+def split_into_passages(text: str, max_words: int = 180, overlap_words: int = 40) -> list:
+    """
+    Returns a list of {'passage_index', 'section', 'text'} dicts covering the
+    whole document. Passages never cross a section boundary.
+    """
+    step = max(1, max_words - overlap_words)
+    passages = []
+    for section, body in split_sections(text):
+        words = body.split()
+        start = 0
+        while start < len(words):
+            window = words[start:start + max_words]
+            passages.append({
+                "passage_index": len(passages),
+                "section": section,
+                "text": " ".join(window),
+            })
+            if start + max_words >= len(words):
+                break
+            start += step
+    return passages
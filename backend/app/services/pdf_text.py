@@ -0,0 +1,71 @@
+"""
+Text extraction from spooled PDFs.
+
+PDFs are opened by path, so MuPDF reads pages from the file on demand instead
+of the whole document being held as a Python bytes object, and page texts are
+joined once at the end. `extract_pair` extracts the complaint and the FRL at
+the same time in a small process pool (EXTRACT_PROCESSES; 0 extracts in the
+calling thread), so a multi-hundred-page FRL neither blocks the complaint nor
+keeps its parse state in the worker's own memory. The pool uses the spawn
+start method, since the calling processes run background threads.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.core.config import settings
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def extract_text(path: str) -> str:
+    """Extracts the text of a PDF file."""
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return "".join(page.get_text() for page in doc)
+
+
+def get_pool():
+    """The process-wide extraction pool, created on first use; None when EXTRACT_PROCESSES is 0."""
+    global _pool
+    if settings.EXTRACT_PROCESSES <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=settings.EXTRACT_PROCESSES,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def extract_many(paths: list) -> list:
+    """Texts of many PDFs, extracted in parallel in the pool (in order)."""
+    pool = get_pool()
+    if pool is None or len(paths) < 2:
+        return [extract_text(path) for path in paths]
+    try:
+        return list(pool.map(extract_text, paths))
+    except BrokenProcessPool:
+        # A pool process died (e.g. killed for memory): start a fresh pool next time, extract here now
+        print("PDF extraction pool broke; extracting in-process.")
+        _reset_pool()
+        return [extract_text(path) for path in paths]
+
+
+def extract_pair(complaint_path: str, frl_path: str) -> tuple:
+    """(complaint_text, frl_text), extracted in parallel."""
+    complaint_text, frl_text = extract_many([complaint_path, frl_path])
+    return complaint_text, frl_text
+
+
+def shutdown():
+    _reset_pool()
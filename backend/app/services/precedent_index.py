@@ -0,0 +1,339 @@
+"""
+Local, memory-mapped precedent index.
+
+An index directory holds:
+    vectors.npy          (N, D) float32 matrix, or int8 when quantized
+    scales.npy           (N,) float32 per-row scales (int8 indexes only)
+    meta.json            dimension, dtype, model name and per-row metadata
+    <field>.bin          UTF-8 blob with every row's value for a text field
+    <field>.offsets.npy  (N + 1,) int64 byte offsets into <field>.bin
+    filters.npz          packed row bitmaps per product type and key theme
+    bm25*                optional BM25 inverted index over one text field (see bm25_index)
+
+Vectors are L2-normalised at build time, so a dot product is a cosine score.
+Indexes with a BM25 sidecar also answer hybrid queries: the vector and BM25
+rankings are merged with reciprocal rank fusion.
+"""
+import json
+import mmap
+import os
+import shutil
+import numpy as np
+from app.services.bm25_index import BM25Index, build_bm25
+
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+META_FILE = "meta.json"
+FILTERS_FILE = "filters.npz"
+
+
+def _normalise(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _filter_key(kind: str, value: str) -> str:
+    return f"{kind}={value.strip().lower()}"
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> dict:
+    """RRF: each ranking adds 1 / (k + rank) to a row's score. Returns {row: fused score}."""
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def build_index(index_dir: str, rows: list, embeddings, model_name: str,
+                text_fields=("full_text",), quantize: bool = False, lexical_field: str = None):
+    """
+    Writes a new index to `index_dir`, replacing any existing one atomically.
+
+    `rows` is a list of dicts with 'id', 'case_id', 'product_type', 'key_themes'
+    and one entry per name in `text_fields`; any other keys are kept as row
+    metadata. `embeddings` is aligned with `rows`. With `lexical_field` (one of
+    `text_fields`) a BM25 index over that field is built alongside.
+    """
+    if rows:
+        matrix = _normalise(np.asarray(embeddings, dtype=np.float32).reshape(len(rows), -1))
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+        quantize = False
+    tmp_dir = f"{index_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # 1. Vectors (optionally int8 with symmetric per-row scales)
+    if quantize:
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        np.save(os.path.join(tmp_dir, VECTORS_FILE), quantized)
+        np.save(os.path.join(tmp_dir, SCALES_FILE), scales.astype(np.float32))
+    else:
+        np.save(os.path.join(tmp_dir, VECTORS_FILE), matrix)
+
+    # 2. Text blobs with offset sidecars
+    for field in text_fields:
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        with open(os.path.join(tmp_dir, f"{field}.bin"), "wb") as blob:
+            for i, row in enumerate(rows):
+                encoded = (row.get(field) or "").encode("utf-8")
+                blob.write(encoded)
+                offsets[i + 1] = offsets[i] + len(encoded)
+        np.save(os.path.join(tmp_dir, f"{field}.offsets.npy"), offsets)
+
+    # 3. Prefilter bitmaps
+    bitmaps = {}
+    for i, row in enumerate(rows):
+        keys = [_filter_key("product_type", row.get("product_type") or "")]
+        keys += [_filter_key("key_theme", theme) for theme in row.get("key_themes") or []]
+        for key in keys:
+            bitmaps.setdefault(key, np.zeros(len(rows), dtype=bool))[i] = True
+    np.savez(os.path.join(tmp_dir, FILTERS_FILE), **{k: np.packbits(v) for k, v in bitmaps.items()})
+
+    # 4. Lexical (BM25) postings
+    if lexical_field:
+        build_bm25(tmp_dir, [row.get(lexical_field) or "" for row in rows])
+
+    # 5. Metadata
+    meta = {
+        "model": model_name,
+        "dim": int(matrix.shape[1]) if len(rows) else 0,
+        "dtype": "int8" if quantize else "float32",
+        "text_fields": list(text_fields),
+        "lexical_field": lexical_field,
+        "filter_keys": sorted(bitmaps),
+        "rows": [
+            {key: value for key, value in row.items() if key not in text_fields and key != "embedding"}
+            for row in rows
+        ],
+    }
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    # 6. Swap the finished index into place
+    old_dir = f"{index_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class PrecedentIndex:
+    """Read-only view over an index directory; vectors, offsets and text blobs are memory-mapped."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self._row_by_id = {row["id"]: i for i, row in enumerate(self.rows)}
+        self.vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+        self.scales = None
+        if self.meta["dtype"] == "int8":
+            self.scales = np.load(os.path.join(index_dir, SCALES_FILE), mmap_mode="r")
+        self._offsets = {
+            field: np.load(os.path.join(index_dir, f"{field}.offsets.npy"), mmap_mode="r")
+            for field in self.meta["text_fields"]
+        }
+        self._blobs = {field: self._map_blob(field) for field in self.meta["text_fields"]}
+        with np.load(os.path.join(index_dir, FILTERS_FILE)) as filters:
+            self._filters = {key: filters[key] for key in filters.files}
+        self.lexical = BM25Index(index_dir) if self.meta.get("lexical_field") else None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Vectors and offsets are released with their last view; the text blobs are closed here
+        for blob in self._blobs.values():
+            if isinstance(blob, mmap.mmap):
+                blob.close()
+        self._blobs = {}
+        self._offsets = {}
+        self.vectors = self.scales = None
+        if self.lexical is not None:
+            self.lexical.close()
+
+    def _map_blob(self, field: str):
+        with open(os.path.join(self.index_dir, f"{field}.bin"), "rb") as blob:
+            if os.fstat(blob.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_text(self, row: int, field: str = "full_text") -> str:
+        """Returns a row's text field; "" for fields this index was built without."""
+        offsets = self._offsets.get(field)
+        if offsets is None:
+            return ""
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        return self._blobs[field][start:end].decode("utf-8")
+
+    def get_text_by_id(self, row_id: str, field: str = "full_text"):
+        """O(1) lookup of a text field by row id. Returns None for unknown ids."""
+        row = self._row_by_id.get(row_id)
+        return None if row is None else self.get_text(row, field)
+
+    def _bitmap(self, key: str):
+        packed = self._filters.get(key)
+        if packed is None:
+            return np.zeros(len(self.rows), dtype=bool)
+        return np.unpackbits(packed, count=len(self.rows)).astype(bool)
+
+    def prefilter(self, product_type=None, key_themes=None):
+        """Returns a boolean row mask, or None when no filter applies."""
+        mask = None
+        if product_type:
+            mask = self._bitmap(_filter_key("product_type", product_type))
+        if key_themes:
+            themes = np.zeros(len(self.rows), dtype=bool)
+            for theme in key_themes:
+                themes |= self._bitmap(_filter_key("key_theme", theme))
+            mask = themes if mask is None else mask & themes
+        return mask
+
+    def scores(self, query) -> np.ndarray:
+        """Cosine similarity of a single query vector against every row."""
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        if self.scales is None:
+            return self.vectors @ query
+        return (self.vectors @ query) * self.scales
+
+    def scores_many(self, queries) -> np.ndarray:
+        """Cosine similarities of several query vectors against every row, in one matrix product."""
+        queries = _normalise(np.asarray(queries, dtype=np.float32).reshape(len(queries), -1))
+        scores = queries @ np.asarray(self.vectors).T
+        if self.scales is not None:
+            scores *= np.asarray(self.scales)[None, :]
+        return scores
+
+    def _top_k(self, scores: np.ndarray, mask, k: int, fields) -> list:
+        if mask is not None and mask.any():
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, len(self.rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            if not np.isfinite(scores[row]):
+                break
+            result = {**self.rows[row], "similarity": float(scores[row])}
+            for field in fields:
+                result[field] = self.get_text(int(row), field)
+            results.append(result)
+        return results
+
+    def _fused_top_k(self, scores: np.ndarray, query_text: str, mask, k: int, fields,
+                     candidates: int, rrf_k: int) -> list:
+        """Top k of the vector and BM25 rankings (each `candidates` deep) merged with RRF."""
+        if mask is not None and not mask.any():
+            mask = None
+        masked = scores if mask is None else np.where(mask, scores, -np.inf)
+        depth = min(max(candidates, k), len(self.rows))
+        vector_rows = np.argpartition(-masked, depth - 1)[:depth]
+        vector_rows = vector_rows[np.argsort(-masked[vector_rows])]
+        vector_rows = vector_rows[np.isfinite(masked[vector_rows])]
+        lexical_rows, bm25_scores = self.lexical.search(query_text, depth, mask)
+
+        fused = reciprocal_rank_fusion([vector_rows.tolist(), lexical_rows.tolist()], rrf_k)
+        bm25 = dict(zip(lexical_rows.tolist(), bm25_scores.tolist()))
+        results = []
+        for row in sorted(fused, key=lambda r: -fused[r])[:k]:
+            result = {**self.rows[row], "similarity": float(scores[row]), "bm25": bm25.get(row, 0.0), "rrf_score": fused[row]}
+            for field in fields:
+                result[field] = self.get_text(row, field)
+            results.append(result)
+        return results
+
+    def _rank(self, scores: np.ndarray, query_text, mask, k: int, fields, candidates: int, rrf_k: int) -> list:
+        if query_text and self.lexical is not None:
+            return self._fused_top_k(scores, query_text, mask, k, fields, candidates, rrf_k)
+        return self._top_k(scores, mask, k, fields)
+
+    def search(self, query, k: int = 5, product_type=None, key_themes=None,
+               fields=("full_text",), query_text: str = None, candidates: int = 50, rrf_k: int = 60) -> list:
+        """
+        Top-k cosine search. Rows outside the product/theme prefilter are
+        excluded; if the prefilter matches nothing the whole index is searched.
+        With `query_text` (and a BM25 sidecar) the top `candidates` of the
+        vector and BM25 rankings are fused with RRF instead.
+        """
+        if not self.rows:
+            return []
+        return self._rank(self.scores(query), query_text, self.prefilter(product_type, key_themes),
+                          k, fields, candidates, rrf_k)
+
+    def search_many(self, queries, k: int = 5, filters=None, fields=("full_text",),
+                    query_texts=None, candidates: int = 50, rrf_k: int = 60) -> list:
+        """
+        `search` for a batch of queries: scores are computed with a single
+        matrix product. `filters` holds one (product_type, key_themes) pair per
+        query and `query_texts` one text per query. Returns one result list per query.
+        """
+        if not self.rows or not len(queries):
+            return [[] for _ in queries]
+        filters = filters or [(None, None)] * len(queries)
+        query_texts = query_texts or [None] * len(queries)
+        scores = self.scores_many(queries)
+        return [
+            self._rank(scores[i], query_texts[i], self.prefilter(product_type, key_themes), k, fields, candidates, rrf_k)
+            for i, (product_type, key_themes) in enumerate(filters)
+        ]
+
+
+def read_index_meta(index_dir: str):
+    """Returns an index's meta.json contents, or None when there is no index."""
+    try:
+        with open(os.path.join(index_dir, META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_index_rows(index_dir: str, text_fields=("full_text",)):
+    """
+    Reads an existing index back into (rows, embeddings), dequantizing int8
+    vectors. Returns ([], []) when there is no index at `index_dir`.
+    """
+    if not os.path.exists(os.path.join(index_dir, META_FILE)):
+        return [], []
+    index = PrecedentIndex(index_dir)
+    vectors = np.asarray(index.vectors, dtype=np.float32)
+    if index.scales is not None:
+        vectors = vectors * np.asarray(index.scales)[:, None]
+    rows = []
+    for i, row in enumerate(index.rows):
+        rows.append({**row, **{field: index.get_text(i, field) for field in text_fields}})
+    return rows, vectors
+
+
+def update_index(index_dir: str, rows: list, embeddings, remove_case_ids, model_name: str,
+                 text_fields=("full_text",), quantize: bool = False, lexical_field: str = None):
+    """
+    Rebuilds the index at `index_dir` keeping existing rows, except those whose
+    case_id is in `remove_case_ids` or is being replaced by one of `rows`.
+    An existing index built with a different model is discarded.
+    """
+    meta = read_index_meta(index_dir)
+    existing_rows, existing_vectors = [], []
+    if meta is not None and meta.get("model") == model_name:
+        existing_rows, existing_vectors = load_index_rows(index_dir, text_fields)
+
+    dropped = set(remove_case_ids) | {row["case_id"] for row in rows}
+    keep = [i for i, row in enumerate(existing_rows) if row["case_id"] not in dropped]
+    merged_rows = [existing_rows[i] for i in keep] + list(rows)
+    merged_vectors = [existing_vectors[i] for i in keep] + [np.asarray(e, dtype=np.float32) for e in embeddings]
+    build_index(index_dir, merged_rows, merged_vectors, model_name, text_fields, quantize, lexical_field)
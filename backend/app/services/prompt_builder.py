@@ -0,0 +1,171 @@
+"""
+Token-budgeted assembly of the master analysis prompt.
+
+The budget (settings.PROMPT_TOKEN_BUDGET) is split across the complaint, the
+FRL and the precedents by configurable shares. Any share a section does not
+need is handed to the sections that still need more, so short complaints leave
+room for more precedent material and vice versa.
+"""
+from app.core.config import settings
+
+# Rough chars-per-token ratio for English prose with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "\n[... truncated ...]"
+
+MASTER_PROMPT_TEMPLATE = """
+        **Role:** You are an expert Financial Ombudsman Service (FOS) case analyst. Your task is to provide a detailed, structured compliance and risk assessment report.
+
+        **Input Documents:**
+        1.  **Customer Complaint:**
+            ```
+            {complaint_text}
+            ```
+
+        2.  **Firm's Final Response Letter (FRL):**
+            ```
+            {frl_text}
+            ```
+
+        3.  **Relevant Historical Precedents:**
+            ```
+            {precedent_context}
+            ```
+
+        **Task:**
+        Analyze the provided documents and generate a JSON object with the following 10 keys. Do not include any text outside of the JSON object.
+
+        1.  `case_summary`: A concise summary of the customer's complaint as a single string.
+        2.  `frl_compliance_checks`: An array of objects, each with 'item' (e.g., "Clarity", "Timeliness"), 'compliant' (true/false), and a 'reason' string.
+        3.  `historical_precedent_analysis`: **An array of strings.** Each string must be a single bullet point. For each point, you MUST cite the relevant Case ID (e.g., "DRN0060527") that supports your analysis.
+        4.  `key_risk_indicators`: **An array of strings.** Each string must be a single, concise bullet point identifying a key compliance or conduct risk.
+        5.  `predicted_fos_outcome`: **This field is MANDATORY.** You MUST provide a prediction. Generate an object with two keys: a 'outcome' string (e.g., "Likely to be Upheld", "Likely to be Rejected", "50/50 - Unclear") and a 'confidence' string (e.g., "85%", "70%", "50%"). Do NOT return "Not predicted" or "N/A".
+        6.  `financial_impact_assessment`: An object with a 'low_estimate' and 'high_estimate' of the potential financial impact.
+        7.  `recommendations`: A single string with specific, actionable steps the firm should take.
+        8.  `executive_summary`: A high-level, 3-sentence summary as a single string.
+        9.  `outcome_rationale`: **An array of exactly three strings.** Each string is one concise bullet point giving a primary reason for the 'predicted_fos_outcome'. Focus on the most critical factors.
+        10. `confidence_rationale`: **An array of exactly three strings.** Each string is one concise bullet point explaining why you assigned the 'confidence' score. Focus on factors of certainty or uncertainty (e.g., "Confidence is high because of a clear precedent match," or "Confidence is moderate due to conflicting evidence.").
+
+        **Output Format:** Respond with only a valid JSON object.
+        """
+
+# Top-level keys the master prompt asks for, in the order it asks for them
+REPORT_KEYS = (
+    "case_summary",
+    "frl_compliance_checks",
+    "historical_precedent_analysis",
+    "key_risk_indicators",
+    "predicted_fos_outcome",
+    "financial_impact_assessment",
+    "recommendations",
+    "executive_summary",
+    "outcome_rationale",
+    "confidence_rationale",
+)
+
+REASK_SUFFIX = """
+
+        **Correction:** A previous answer to this task was malformed or incomplete. Respond with only a valid JSON object containing exactly these keys: {missing_keys}. Follow the definitions given above for each key.
+        """
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keeps the start of `text` so that it fits in roughly `max_tokens`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER))
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars] + TRUNCATION_MARKER
+
+
+def allocate_budget(needs: dict, shares: dict, available: int) -> dict:
+    """
+    Water-fills `available` tokens across sections: each gets up to its share,
+    then unused tokens are redistributed to sections that still need more.
+    """
+    allocation = {name: min(needs[name], int(available * shares[name])) for name in needs}
+    for _ in range(len(needs)):
+        leftover = available - sum(allocation.values())
+        hungry = [name for name in needs if needs[name] > allocation[name]]
+        if leftover <= 0 or not hungry:
+            break
+        total_share = sum(shares[name] for name in hungry) or len(hungry)
+        for name in hungry:
+            extra = int(leftover * (shares[name] or 1) / total_share)
+            allocation[name] = min(needs[name], allocation[name] + extra)
+    return allocation
+
+
+def render_precedent(precedent: dict) -> str:
+    """Full rendering of one precedent: digest first, then retrieved passages (or the decision text)."""
+    parts = [f"Precedent Case ID: {precedent['case_id']}"]
+    if precedent.get('digest'):
+        parts.append(f"Digest:\n{precedent['digest']}")
+    if precedent.get('passages'):
+        parts.append("Relevant passages:\n" + "\n\n".join(precedent['passages']))
+    elif precedent.get('full_text') and not precedent.get('digest'):
+        parts.append(precedent['full_text'])
+    return "\n\n".join(parts)
+
+
+def render_precedents(precedents: list, max_tokens: int) -> str:
+    """Renders precedents in relevance order, sharing `max_tokens` between them."""
+    blocks = []
+    remaining = max_tokens
+    for position, precedent in enumerate(precedents):
+        allotment = remaining // (len(precedents) - position)
+        block = truncate_to_tokens(render_precedent(precedent), allotment)
+        remaining -= estimate_tokens(block)
+        blocks.append(block)
+    return "\n\n---\n\n".join(blocks)
+
+
+def assemble_prompt(complaint_text: str, frl_text: str, precedents: list, token_budget: int = None):
+    """
+    Builds the master prompt within the token budget.
+    Returns (prompt, stats) where stats records the estimated tokens per section.
+    """
+    token_budget = token_budget or settings.PROMPT_TOKEN_BUDGET
+    overhead = estimate_tokens(MASTER_PROMPT_TEMPLATE.format(complaint_text="", frl_text="", precedent_context=""))
+    available = max(0, token_budget - overhead)
+
+    needs = {
+        'complaint': estimate_tokens(complaint_text),
+        'frl': estimate_tokens(frl_text),
+        'precedents': sum(estimate_tokens(render_precedent(p)) for p in precedents),
+    }
+    shares = {
+        'complaint': settings.PROMPT_COMPLAINT_SHARE,
+        'frl': settings.PROMPT_FRL_SHARE,
+        'precedents': max(0.0, 1.0 - settings.PROMPT_COMPLAINT_SHARE - settings.PROMPT_FRL_SHARE),
+    }
+    allocation = allocate_budget(needs, shares, available)
+
+    complaint_part = truncate_to_tokens(complaint_text, allocation['complaint'])
+    frl_part = truncate_to_tokens(frl_text, allocation['frl'])
+    precedent_part = render_precedents(precedents, allocation['precedents']) if precedents else ""
+    prompt = MASTER_PROMPT_TEMPLATE.format(
+        complaint_text=complaint_part,
+        frl_text=frl_part,
+        precedent_context=precedent_part,
+    )
+
+    stats = {
+        'budget': token_budget,
+        'total': estimate_tokens(prompt),
+        'overhead': overhead,
+        'complaint': estimate_tokens(complaint_part),
+        'frl': estimate_tokens(frl_part),
+        'precedents': estimate_tokens(precedent_part),
+        'precedent_count': len(precedents),
+        'truncated': [name for name in needs if needs[name] > allocation[name]],
+    }
+    return prompt, stats
+
+
+def build_reask_prompt(master_prompt: str, missing_keys: list) -> str:
+    """The master prompt narrowed to the keys a previous response failed to deliver."""
+    return master_prompt + REASK_SUFFIX.format(missing_keys=", ".join(f"`{key}`" for key in missing_keys))
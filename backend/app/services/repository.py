@@ -0,0 +1,213 @@
+"""
+Non-blocking data access for the async API routes.
+
+The synchronous supabase client blocks the event loop for every round trip,
+so routes declared `async def` talk to Supabase's REST (PostgREST) and auth
+(GoTrue) endpoints directly through one pooled, keep-alive httpx.AsyncClient.
+Repositories take the client in their constructor, so they can be pointed at a
+local stand-in server by passing a client with a different base_url.
+"""
+import asyncio
+import httpx
+from app.core.config import settings
+from app.core.timing import timed
+
+
+# Completed jobs predicted "upheld", counted as job_stats.outcome_bucket does:
+# the outcome mentions upheld but is not "not upheld" or "rejected"
+OUTCOME_PATH = "report_data->predicted_fos_outcome->>outcome"
+AT_RISK_OUTCOME = (f"({OUTCOME_PATH}.ilike.*upheld*,{OUTCOME_PATH}.not.ilike.*not upheld*,"
+                   f"{OUTCOME_PATH}.not.ilike.*rejected*)")
+
+
+class RepositoryError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+class SupabaseREST:
+    """Thin async wrapper over PostgREST and GoTrue."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response):
+        if response.status_code >= 400:
+            try:
+                body = response.json()
+                message = body.get("message") or body.get("msg") or body.get("error_description") or str(body)
+            except ValueError:
+                message = response.text
+            raise RepositoryError(response.status_code, message)
+
+    async def select(self, table: str, columns: str = "*", filters: dict = None,
+                     order: str = None, limit: int = None, single: bool = False):
+        """
+        `filters` maps a column (or JSON path) to a PostgREST operator expression,
+        e.g. {'status': 'eq.COMPLETE'}. With `single` returns one row or None.
+        """
+        params = {"select": columns, **(filters or {})}
+        if order:
+            params["order"] = order
+        if limit is not None:
+            params["limit"] = str(limit)
+        headers = {"Accept": "application/vnd.pgrst.object+json"} if single else {}
+        with timed("supabase", operation=f"select:{table}"):
+            response = await self.client.get(f"/rest/v1/{table}", params=params, headers=headers)
+        if single and response.status_code == 406:
+            return None
+        self._raise_for_status(response)
+        return response.json()
+
+    async def count(self, table: str, filters: dict = None) -> int:
+        """Exact row count without transferring any rows."""
+        with timed("supabase", operation=f"count:{table}"):
+            response = await self.client.head(
+                f"/rest/v1/{table}",
+                params={"select": "job_id", **(filters or {})},
+                headers={"Prefer": "count=exact", "Range-Unit": "items", "Range": "0-0"}
+            )
+        self._raise_for_status(response)
+        content_range = response.headers.get("content-range", "*/0")
+        total = content_range.rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else 0
+
+    async def insert(self, table: str, row):
+        """Inserts one row (a dict) or several in a single request (a list of dicts)."""
+        with timed("supabase", operation=f"insert:{table}"):
+            response = await self.client.post(f"/rest/v1/{table}", json=row, headers={"Prefer": "return=minimal"})
+        self._raise_for_status(response)
+
+    async def update(self, table: str, values: dict, filters: dict):
+        with timed("supabase", operation=f"update:{table}"):
+            response = await self.client.patch(
+                f"/rest/v1/{table}", params=filters, json=values, headers={"Prefer": "return=minimal"}
+            )
+        self._raise_for_status(response)
+
+    async def auth_post(self, path: str, payload: dict, params: dict = None) -> dict:
+        with timed("supabase", operation=f"auth:{path}"):
+            response = await self.client.post(f"/auth/v1/{path}", json=payload, params=params)
+        self._raise_for_status(response)
+        return response.json()
+
+
+class JobRepository:
+    def __init__(self, rest: SupabaseREST):
+        self.rest = rest
+
+    async def create(self, job_id: str):
+        await self.rest.insert("jobs", {"job_id": job_id, "status": "PENDING"})
+
+    async def create_many(self, job_ids: list):
+        if job_ids:
+            await self.rest.insert("jobs", [{"job_id": job_id, "status": "PENDING"} for job_id in job_ids])
+
+    async def get(self, job_id: str, columns: str = "*"):
+        return await self.rest.select("jobs", columns, {"job_id": f"eq.{job_id}"}, single=True)
+
+    async def get_many(self, job_ids: list, columns: str = "*", chunk_size: int = 100) -> list:
+        """Rows for many jobs, fetched in chunks to keep the `in.(...)` filter short."""
+        chunks = [job_ids[start:start + chunk_size] for start in range(0, len(job_ids), chunk_size)]
+        pages = await asyncio.gather(*(
+            self.rest.select("jobs", columns, {"job_id": f"in.({','.join(chunk)})"}) for chunk in chunks
+        ))
+        return [row for page in pages for row in page]
+
+    async def update(self, job_id: str, values: dict):
+        await self.rest.update("jobs", values, {"job_id": f"eq.{job_id}"})
+
+    async def update_many(self, job_ids: list, values: dict, chunk_size: int = 100):
+        """Applies the same patch to many jobs, in chunks to keep the `in.(...)` filter short."""
+        chunks = [job_ids[start:start + chunk_size] for start in range(0, len(job_ids), chunk_size)]
+        await asyncio.gather(*(
+            self.rest.update("jobs", values, {"job_id": f"in.({','.join(chunk)})"}) for chunk in chunks
+        ))
+
+    async def list_recent(self, limit: int = 10, columns: str = "*", before: tuple = None):
+        """
+        Newest-first page of jobs using keyset pagination on (created_at, job_id).
+        `before` is the (created_at, job_id) of the last row of the previous page.
+        """
+        filters = {}
+        if before is not None:
+            created_at, job_id = before
+            filters["or"] = f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",job_id.lt.{job_id}))'
+        return await self.rest.select("jobs", columns, filters, order="created_at.desc,job_id.desc", limit=limit)
+
+    async def dashboard_counts(self) -> dict:
+        """
+        Runs the three dashboard count queries concurrently; the same figures
+        as job_stats.dashboard_counts over the maintained counters.
+        """
+        open_count, at_risk, completed = await asyncio.gather(
+            self.rest.count("jobs", {"status": "in.(PENDING,PROCESSING)"}),
+            self.rest.count("jobs", {"status": "eq.COMPLETE", "and": AT_RISK_OUTCOME}),
+            self.rest.count("jobs", {"status": "eq.COMPLETE"}),
+        )
+        return {"open": open_count, "at_risk": at_risk, "completed": completed}
+
+
+class PrecedentRepository:
+    def __init__(self, rest: SupabaseREST):
+        self.rest = rest
+
+    async def get_many(self, case_ids: list, columns: str = "case_id, full_text"):
+        if not case_ids:
+            return []
+        return await self.rest.select("precedents", columns, {"case_id": f"in.({','.join(case_ids)})"})
+
+
+class AuthRepository:
+    def __init__(self, rest: SupabaseREST):
+        self.rest = rest
+
+    async def sign_up(self, email: str, password: str) -> dict:
+        return await self.rest.auth_post("signup", {"email": email, "password": password})
+
+    async def sign_in_with_password(self, email: str, password: str) -> dict:
+        return await self.rest.auth_post("token", {"email": email, "password": password}, params={"grant_type": "password"})
+
+
+_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared keep-alive client; created on first use inside the event loop."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=settings.SUPABASE_URL,
+            headers={
+                "apikey": settings.SUPABASE_SERVICE_KEY,
+                "Authorization": f"Bearer {settings.SUPABASE_SERVICE_KEY}",
+            },
+            timeout=httpx.Timeout(settings.SUPABASE_TIMEOUT_SECONDS, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPABASE_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_job_repository() -> JobRepository:
+    return JobRepository(SupabaseREST(get_http_client()))
+
+
+def get_precedent_repository() -> PrecedentRepository:
+    return PrecedentRepository(SupabaseREST(get_http_client()))
+
+
+def get_auth_repository() -> AuthRepository:
+    return AuthRepository(SupabaseREST(get_http_client()))
@@ -0,0 +1,42 @@
+"""
+Streams uploaded files to disk.
+
+`spool_upload` copies an UploadFile to a path in UPLOAD_CHUNK_KB chunks, so
+a large PDF is never held in memory whole, and stops as soon as the file
+exceeds its size limit.
+"""
+import os
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def _write_chunks(upload_file, path: str, max_bytes: int, chunk_bytes: int, name: str) -> int:
+    """Copies the upload's (already spooled) file object to `path`. Runs in a worker thread."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    upload_file.seek(0)
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            for chunk in iter(lambda: upload_file.read(chunk_bytes), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{name} is larger than {max_bytes // (1024 * 1024)} MB.")
+                f.write(chunk)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return size
+
+
+async def spool_upload(upload, path: str, max_bytes: int = None) -> int:
+    """Writes an UploadFile to `path` in chunks. Returns its size; raises UploadTooLarge past `max_bytes`."""
+    max_bytes = max_bytes or settings.UPLOAD_MAX_MB * 1024 * 1024
+    name = upload.filename or "File"
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(f"{name} is larger than {max_bytes // (1024 * 1024)} MB.")
+    return await run_in_threadpool(_write_chunks, upload.file, path, max_bytes, settings.UPLOAD_CHUNK_KB * 1024, name)
@@ -0,0 +1,119 @@
+"""
+Latency benchmark for the BM25 sidecar index used by hybrid retrieval.
+
+Builds a BM25 index over `--rows` passages taken from the knowledge_base/*.txt
+DRN corpus (split as at ingest time; the corpus is cycled with ~10% of words
+dropped per copy to reach large row counts) in a throwaway directory, then
+times complaint-sized queries (`--query-words` word windows from held-out
+decisions) with early termination against an exhaustive scan of every
+postings list, and reports how often both return the same top-k scores
+(rows with tied scores at the cut-off may differ).
+
+Run from the backend directory:
+    python -m benchmarks.bm25_benchmark --rows 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(BACKEND_DIR, "knowledge_base")
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+from app.services.bm25_index import BM25Index, build_bm25
+from app.services.passages import split_into_passages
+from benchmarks.pipeline_benchmark import summarize
+
+
+def load_rows(filenames: list, rows: int, seed: int) -> list:
+    rng = random.Random(seed)
+    passages = []
+    for filename in filenames:
+        with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8") as f:
+            passages.extend(passage["text"] for passage in split_into_passages(f.read()))
+    texts = list(passages[:rows])
+    while len(texts) < rows:
+        words = passages[len(texts) % len(passages)].split()
+        texts.append(" ".join(word for word in words if rng.random() > 0.1))
+    return texts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="BM25 index build and query latency benchmark.")
+    parser.add_argument("--rows", type=int, default=100000, help="Indexed passages.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries to time.")
+    parser.add_argument("--query-words", type=int, default=400, help="Words per query (a complaint-sized text).")
+    parser.add_argument("--k", type=int, default=50, help="Results per query (HYBRID_CANDIDATES).")
+    parser.add_argument("--held-out", type=int, default=50, help="Corpus documents kept out of the index for queries.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Optional result JSON path.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    filenames = sorted(f for f in os.listdir(CORPUS_DIR) if f.endswith(".txt"))
+    random.Random(args.seed).shuffle(filenames)
+    held_out, indexed = filenames[:args.held_out], filenames[args.held_out:]
+    workspace = tempfile.mkdtemp(prefix="complai-bm25-")
+    try:
+        print(f"Loading {args.rows} passages...")
+        texts = load_rows(indexed, args.rows, args.seed)
+
+        started = time.perf_counter()
+        build_bm25(workspace, texts)
+        build_seconds = time.perf_counter() - started
+        size_mb = sum(os.path.getsize(os.path.join(workspace, f)) for f in os.listdir(workspace)) / 1e6
+        print(f"Built in {build_seconds:.1f}s ({size_mb:.1f} MB on disk).")
+
+        started = time.perf_counter()
+        index = BM25Index(workspace)
+        load_seconds = time.perf_counter() - started
+
+        rng = random.Random(args.seed)
+        queries = []
+        for filename in (held_out * (args.queries // len(held_out) + 1))[:args.queries]:
+            with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8") as f:
+                words = f.read().split()
+            start = rng.randint(0, max(0, len(words) - args.query_words))
+            queries.append(" ".join(words[start:start + args.query_words]))
+
+        pruned, exhaustive, same = [], [], 0
+        for query in queries:
+            started = time.perf_counter()
+            _, scores = index.search(query, args.k)
+            pruned.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            _, reference = index.search(query, args.k, early_termination=False)
+            exhaustive.append(time.perf_counter() - started)
+            same += len(scores) == len(reference) and bool(np.allclose(scores, reference, rtol=1e-4))
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    wall = sum(pruned)
+    results = {
+        "config": vars(args),
+        "build_seconds": round(build_seconds, 3),
+        "load_seconds": round(load_seconds, 4),
+        "index_mb": round(size_mb, 2),
+        "early_termination": summarize(pruned, wall),
+        "exhaustive": summarize(exhaustive, sum(exhaustive)),
+        "identical_top_k": round(same / len(queries), 4),
+    }
+    for name in ("early_termination", "exhaustive"):
+        stats = results[name]
+        print(f"{name:<18} p50 {stats['p50'] * 1000:7.2f} ms  p95 {stats['p95'] * 1000:7.2f} ms  p99 {stats['p99'] * 1000:7.2f} ms")
+    print(f"Identical top {args.k}: {results['identical_top_k']:.1%} of queries")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
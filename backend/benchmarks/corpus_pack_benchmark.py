@@ -0,0 +1,115 @@
+"""
+I/O benchmark for the packed knowledge-base corpus.
+
+Packs the knowledge_base/*.txt DRN corpus into a throwaway file (for each
+`--codecs` entry) and compares, with a cold-ish page cache only as far as the
+OS allows:
+  - directory: list the directory, hash and read every file (what ingest did),
+  - pack: open the pack, take the stored hashes and iterate every document,
+  - random fetch latency by case_id (`--fetches` lookups),
+plus the on-disk size against the raw corpus.
+
+Run from the backend directory:
+    python -m benchmarks.corpus_pack_benchmark --codecs zstd zlib
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(BACKEND_DIR, "knowledge_base")
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services.corpus_pack import CorpusPack, build_pack
+from benchmarks.pipeline_benchmark import summarize
+
+
+def read_directory() -> dict:
+    """{filename: (sha256, text)} the way ingest reads the directory."""
+    documents = {}
+    for filename in sorted(f for f in os.listdir(CORPUS_DIR) if f.endswith(".txt")):
+        with open(os.path.join(CORPUS_DIR, filename), "rb") as f:
+            data = f.read()
+        documents[filename] = (hashlib.sha256(data).hexdigest(), data.decode("utf-8", errors="replace"))
+    return documents
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Packed corpus size and read throughput benchmark.")
+    parser.add_argument("--codecs", nargs="+", default=["zlib"], help="Codecs to build (zstd needs zstandard).")
+    parser.add_argument("--fetches", type=int, default=2000, help="Random fetches by case_id.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Optional result JSON path.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    source = read_directory()
+    directory_seconds = time.perf_counter() - started
+    raw_bytes = sum(os.path.getsize(os.path.join(CORPUS_DIR, name)) for name in source)
+    documents = [
+        {"name": name, "case_id": os.path.splitext(name)[0], "text": text, "sha256": sha256}
+        for name, (sha256, text) in source.items()
+    ]
+    results = {
+        "config": vars(args),
+        "documents": len(documents),
+        "raw_mb": round(raw_bytes / 1e6, 2),
+        "directory_read_seconds": round(directory_seconds, 4),
+        "codecs": {},
+    }
+    print(f"Directory: {len(documents)} files, {raw_bytes / 1e6:.1f} MB, read + hashed in {directory_seconds:.3f}s")
+
+    workspace = tempfile.mkdtemp(prefix="complai-pack-")
+    try:
+        for codec in args.codecs:
+            path = os.path.join(workspace, f"corpus.{codec}.pack")
+            started = time.perf_counter()
+            stats = build_pack(path, documents, codec=codec)
+            build_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with CorpusPack(path) as pack:
+                hashes = {entry["name"]: entry["sha256"] for entry in pack.entries}
+                texts = dict(pack.iter_documents())
+                iterate_seconds = time.perf_counter() - started
+                assert all(texts[name] == text and hashes[name] == sha256 for name, (sha256, text) in source.items())
+
+                rng = random.Random(args.seed)
+                case_ids = [document["case_id"] for document in documents]
+                fetches = []
+                for case_id in (rng.choice(case_ids) for _ in range(args.fetches)):
+                    started = time.perf_counter()
+                    pack.get(case_id)
+                    fetches.append(time.perf_counter() - started)
+
+            results["codecs"][codec] = {
+                "file_mb": round(stats["file_bytes"] / 1e6, 2),
+                "ratio": round(raw_bytes / stats["file_bytes"], 2),
+                "build_seconds": round(build_seconds, 3),
+                "iterate_seconds": round(iterate_seconds, 4),
+                "fetch": summarize(fetches, sum(fetches)),
+            }
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    for codec, result in results["codecs"].items():
+        fetch = result["fetch"]
+        print(f"{codec:<5} {result['file_mb']:6.1f} MB ({result['ratio']:.1f}x)  built in {result['build_seconds']:.1f}s  "
+              f"open + iterate {result['iterate_seconds']:.3f}s  fetch p50 {fetch['p50'] * 1e6:.0f} us "
+              f"p95 {fetch['p95'] * 1e6:.0f} us")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Parity and throughput benchmark for the embedding backends.
+
+Embeds `--docs` passages of the knowledge_base/*.txt DRN corpus (split as at
+ingest time) with the reference backend (torch) and each `--backends`
+candidate, and reports for every candidate:
+  - parity: cosine similarity between its vector and the reference vector for
+    the same text (mean / p1 / min), and the overlap of the top-10 nearest
+    passages for `--queries` of them against the reference neighbours,
+  - throughput: passages/sec for batched encoding (`--batch-size`),
+  - dynamic batching: texts/sec for `--clients` threads each encoding one
+    passage at a time, called directly and through BatchingEmbedder.
+
+Exits with status 1 when a candidate's minimum cosine falls below
+`--min-cosine`, so it can be used as a parity check before switching
+EMBEDDING_BACKEND.
+
+Run from the backend directory:
+    python -m benchmarks.embedding_benchmark --backends torch-int8 onnx --threads 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(BACKEND_DIR, "knowledge_base")
+sys.path.insert(0, BACKEND_DIR)
+# The settings object needs these to import; no external service is called
+for name in ("SUPABASE_URL", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(name, "unused")
+
+import numpy as np
+from app.services.embedding_backends import BatchingEmbedder, create_backend
+from app.services.passages import split_into_passages
+
+
+def load_passages(docs: int) -> list:
+    passages = []
+    for filename in sorted(f for f in os.listdir(CORPUS_DIR) if f.endswith(".txt")):
+        with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8", errors="replace") as f:
+            passages.extend(passage["text"] for passage in split_into_passages(f.read()))
+        if len(passages) >= docs:
+            break
+    return passages[:docs]
+
+
+def normalised(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def neighbours(vectors: np.ndarray, queries: int, k: int = 10) -> np.ndarray:
+    scores = vectors[:queries] @ vectors.T
+    scores[np.arange(queries), np.arange(queries)] = -np.inf
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def encode_timed(backend, texts: list, batch_size: int):
+    backend.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    started = time.perf_counter()
+    vectors = backend.encode(texts, batch_size=batch_size, show_progress_bar=False)
+    return normalised(vectors), time.perf_counter() - started
+
+
+def concurrent_rate(embedder, texts: list, clients: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(embedder.encode, texts))
+    return len(texts) / (time.perf_counter() - started)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embedding backend parity and throughput benchmark.")
+    parser.add_argument("--backends", nargs="+", default=["torch-int8"], help="Candidate backends (torch-int8, onnx).")
+    parser.add_argument("--reference", default="torch", help="Reference backend.")
+    parser.add_argument("--onnx-file", default=None, help="ONNX graph for the onnx backend (default EMBEDDING_ONNX_FILE).")
+    parser.add_argument("--docs", type=int, default=2000, help="Passages to embed.")
+    parser.add_argument("--queries", type=int, default=200, help="Passages used as nearest-neighbour queries.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = library default).")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent single-text callers.")
+    parser.add_argument("--concurrent-texts", type=int, default=256, help="Texts encoded by the concurrent callers.")
+    parser.add_argument("--max-batch", type=int, default=64, help="BatchingEmbedder max batch.")
+    parser.add_argument("--wait-ms", type=float, default=5.0, help="BatchingEmbedder wait.")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Parity threshold on the minimum cosine.")
+    parser.add_argument("--output", default=None, help="Optional result JSON path.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    texts = load_passages(args.docs)
+    queries = min(args.queries, len(texts))
+    print(f"Embedding {len(texts)} passages (batch size {args.batch_size}, threads {args.threads or 'default'}).")
+    results = {"config": vars(args), "passages": len(texts), "backends": {}}
+    failed = []
+
+    reference_vectors, reference_neighbours = None, None
+    for name in [args.reference] + [b for b in args.backends if b != args.reference]:
+        backend = create_backend(name, threads=args.threads, onnx_file=args.onnx_file)
+        vectors, seconds = encode_timed(backend, texts, args.batch_size)
+        sample = texts[:args.concurrent_texts]
+        direct = concurrent_rate(backend, sample, args.clients)
+        batched = concurrent_rate(BatchingEmbedder(backend, args.max_batch, args.wait_ms), sample, args.clients)
+        result = {
+            "passages_per_sec": round(len(texts) / seconds, 1),
+            "concurrent_direct_per_sec": round(direct, 1),
+            "concurrent_batched_per_sec": round(batched, 1),
+        }
+        if reference_vectors is None:
+            reference_vectors, reference_neighbours = vectors, neighbours(vectors, queries)
+        else:
+            cosines = np.sum(vectors * reference_vectors, axis=1)
+            overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(neighbours(vectors, queries), reference_neighbours)]
+            result.update(
+                cosine_mean=round(float(cosines.mean()), 5),
+                cosine_p1=round(float(np.percentile(cosines, 1)), 5),
+                cosine_min=round(float(cosines.min()), 5),
+                top10_overlap=round(float(np.mean(overlap)), 4),
+            )
+            if result["cosine_min"] < args.min_cosine:
+                failed.append(name)
+        results["backends"][name] = result
+
+    for name, result in results["backends"].items():
+        line = (f"{name:<11} {result['passages_per_sec']:8.1f} passages/sec  concurrent "
+                f"{result['concurrent_direct_per_sec']:7.1f} direct / {result['concurrent_batched_per_sec']:7.1f} batched")
+        if "cosine_mean" in result:
+            line += (f"  cosine mean {result['cosine_mean']:.4f} min {result['cosine_min']:.4f}"
+                     f"  top-10 overlap {result['top10_overlap']:.1%}")
+        print(line)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        print(f"Parity check failed (min cosine < {args.min_cosine}): {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
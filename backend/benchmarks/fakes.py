@@ -0,0 +1,118 @@
+"""
+Local stand-ins for the external services, used by the benchmarks.
+
+`FakeSupabase` implements the slice of the supabase-py query builder the
+pipeline and the ingester use (table().select/insert/upsert/update/delete with
+eq/in_ filters, and rpc), keeps rows in memory and sleeps `latency` seconds per
+request to model the network round trip. Gemini is replaced with the LLM
+gateway's own FakeBackend.
+"""
+import threading
+import time
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data) if isinstance(data, list) else None
+
+    def __iter__(self):
+        # supabase-py responses unpack as (data, count)
+        return iter((("data", self.data), ("count", self.count)))
+
+
+class FakeQuery:
+    def __init__(self, client, table: str):
+        self.client = client
+        self.table = table
+        self.operation = "select"
+        self.payload = None
+        self.filters = []
+        self.key = "job_id" if table == "jobs" else "case_id"
+
+    def select(self, columns: str = "*"):
+        self.operation = "select"
+        return self
+
+    def insert(self, rows):
+        self.operation, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = None):
+        self.operation, self.payload = "upsert", rows
+        self.key = on_conflict or self.key
+        return self
+
+    def update(self, values: dict):
+        self.operation, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append((column, lambda v, value=value: v == value))
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self.filters.append((column, lambda v: v in values))
+        return self
+
+    def _matches(self, row: dict) -> bool:
+        return all(test(row.get(column)) for column, test in self.filters)
+
+    def execute(self):
+        return self.client._execute(self)
+
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.tables = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict):
+        client = self
+
+        class _RPC:
+            def execute(self):
+                client._count(f"rpc:{name}")
+                time.sleep(client.latency)
+                return FakeResponse([])
+
+        return _RPC()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _execute(self, query: FakeQuery) -> FakeResponse:
+        self._count(f"{query.operation}:{query.table}")
+        time.sleep(self.latency)
+        with self._lock:
+            rows = self.tables.setdefault(query.table, {})
+            if query.operation in ("insert", "upsert"):
+                payload = query.payload if isinstance(query.payload, list) else [query.payload]
+                for row in payload:
+                    rows[row[query.key]] = {**rows.get(row[query.key], {}), **row}
+                return FakeResponse(payload)
+            matched = [key for key, row in rows.items() if query._matches(row)]
+            if query.operation == "update":
+                for key in matched:
+                    rows[key].update(query.payload)
+            elif query.operation == "delete":
+                for key in matched:
+                    rows.pop(key)
+                return FakeResponse([])
+            return FakeResponse([dict(rows[key]) for key in matched])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"latency": self.latency, "calls": dict(sorted(self.calls.items())),
+                    "total_calls": sum(self.calls.values())}
@@ -0,0 +1,94 @@
+"""
+Throughput benchmark for metadata extraction at ingest time.
+
+Compares, over the knowledge_base/*.txt DRN corpus:
+  - per_document: the previous approach, the full en_core_web_sm pipeline
+    (tagger, parser, NER, ...) called once per document,
+  - extract_many: MetadataExtractor.extract_many (tokenizer-only nlp.pipe plus
+    phrase matchers and rules, NER only as a firm fallback) for each
+    `--n-process` value.
+Reports docs/sec for each, and how many documents got each field filled.
+
+Run from the backend directory:
+    python -m benchmarks.metadata_benchmark --docs 500 --n-process 1 2 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(BACKEND_DIR, "knowledge_base")
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services.metadata_extractor import MetadataExtractor
+
+
+def load_texts(docs: int) -> list:
+    filenames = sorted(f for f in os.listdir(CORPUS_DIR) if f.endswith(".txt"))[:docs]
+    texts = []
+    for filename in filenames:
+        with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8", errors="replace") as f:
+            texts.append(f.read())
+    return texts
+
+
+def coverage(results: list) -> dict:
+    filled = Counter()
+    for result in results:
+        for field, value in result.items():
+            filled[field] += value not in (None, [])
+    return {field: round(count / len(results), 3) for field, count in filled.items()}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Metadata extraction throughput benchmark.")
+    parser.add_argument("--docs", type=int, default=500, help="Corpus documents to process.")
+    parser.add_argument("--n-process", type=int, nargs="+", default=[1, 2], help="nlp.pipe process counts to time.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Texts per nlp.pipe batch.")
+    parser.add_argument("--model", default="en_core_web_sm")
+    parser.add_argument("--skip-baseline", action="store_true", help="Don't time the per-document full pipeline.")
+    parser.add_argument("--output", default=None, help="Optional result JSON path.")
+    return parser.parse_args()
+
+
+def main():
+    import spacy
+
+    args = parse_args()
+    texts = load_texts(args.docs)
+    print(f"Loaded {len(texts)} documents ({sum(len(t) for t in texts) / 1e6:.1f}M chars).")
+    results = {"config": vars(args), "docs": len(texts), "runs": {}}
+
+    if not args.skip_baseline:
+        nlp = spacy.load(args.model)
+        started = time.perf_counter()
+        for text in texts:
+            nlp(text)
+        seconds = time.perf_counter() - started
+        results["runs"]["per_document"] = {"seconds": round(seconds, 3), "docs_per_sec": round(len(texts) / seconds, 2)}
+
+    extractor = MetadataExtractor.load(args.model)
+    extractor.extract("Warm-up sentence.")
+    for n_process in args.n_process:
+        started = time.perf_counter()
+        extracted = extractor.extract_many(texts, n_process=n_process, batch_size=args.batch_size)
+        seconds = time.perf_counter() - started
+        results["runs"][f"extract_many_n{n_process}"] = {
+            "seconds": round(seconds, 3),
+            "docs_per_sec": round(len(texts) / seconds, 2),
+        }
+    results["coverage"] = coverage(extracted)
+
+    for name, run in results["runs"].items():
+        print(f"{name:<18} {run['seconds']:8.2f}s  {run['docs_per_sec']:10.1f} docs/sec")
+    print("Fields filled: " + ", ".join(f"{field} {share:.0%}" for field, share in results["coverage"].items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+End-to-end benchmark of ingestion and the analysis pipeline.
+
+Runs the real code (ingest_data.process_and_ingest and
+analysis_service.run_analysis_pipeline) on the bundled knowledge_base/*.txt
+DRN corpus, with Supabase and Gemini replaced by local fakes whose latency is
+configurable. Everything is written to a throwaway workspace directory, so the
+real indexes, manifest and queue are untouched.
+
+  1. Ingest `--docs` decisions in batch mode and time each stage.
+  2. Turn `--queries` held-out decisions into complaint/FRL PDF pairs.
+  3. Run every pair through the pipeline at each `--concurrency` level
+     (threads, as when jobs run in-process) and collect per-stage latency:
+     extract, spacy, embedding, retrieval, prompt, llm, persist.
+
+Results (p50/p95/p99, mean and throughput per stage and level) are saved as
+JSON. `--baseline` compares p95s against an earlier result file and exits
+non-zero when any stage regressed by more than `--tolerance`.
+
+Run from the backend directory:
+    python -m benchmarks.pipeline_benchmark --docs 200 --queries 20 --concurrency 1 4 8
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(BACKEND_DIR, "knowledge_base")
+PIPELINE_STAGES = ("extract", "spacy", "embedding", "retrieval", "prompt", "llm", "persist")
+
+# The settings object needs these to import; the fakes replace the real services
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark.benchmark.benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+# Every concurrency level re-runs the same pairs, which would otherwise be served as duplicates
+os.environ.setdefault("DEDUP_ENABLED", "false")
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: list, wall_seconds: float) -> dict:
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 5) if values else None,
+        "p50": round(percentile(values, 0.50), 5) if values else None,
+        "p95": round(percentile(values, 0.95), 5) if values else None,
+        "p99": round(percentile(values, 0.99), 5) if values else None,
+        "throughput_per_sec": round(len(values) / wall_seconds, 3) if wall_seconds > 0 else None,
+    }
+
+
+class StageRecorder:
+    """Timing listener that collects durations per stage."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: str, seconds: float, labels: dict):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+
+def text_to_pdf(text: str, path: str, lines_per_page: int = 60):
+    import fitz  # PyMuPDF
+    lines = []
+    for paragraph in text.splitlines():
+        lines.extend(textwrap.wrap(paragraph, 95) or [""])
+    doc = fitz.open()
+    for start in range(0, max(1, len(lines)), lines_per_page):
+        page = doc.new_page()
+        page.insert_text((40, 50), "\n".join(lines[start:start + lines_per_page]), fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def make_query_pair(text: str, workspace: str, name: str):
+    """Splits a held-out decision into a 'complaint' (first part) and an 'FRL' (rest), as PDF paths."""
+    words = text.split()
+    cut = int(len(words) * 0.45)
+    pair = []
+    for suffix, part in (("complaint", words[:cut]), ("frl", words[cut:])):
+        path = os.path.join(workspace, f"{name}.{suffix}.pdf")
+        text_to_pdf(" ".join(part), path)
+        pair.append(path)
+    return tuple(pair)
+
+
+def prepare_workspace(workspace: str, docs: int, queries: int, seed: int):
+    """Links `docs` corpus files into workspace/knowledge_base and returns the held-out query files."""
+    filenames = sorted(f for f in os.listdir(CORPUS_DIR) if f.endswith(".txt"))
+    random.Random(seed).shuffle(filenames)
+    if docs + queries > len(filenames):
+        raise SystemExit(f"Corpus has {len(filenames)} documents; asked for {docs} + {queries}.")
+    knowledge_base = os.path.join(workspace, "knowledge_base")
+    os.makedirs(knowledge_base)
+    for filename in filenames[:docs]:
+        os.symlink(os.path.join(CORPUS_DIR, filename), os.path.join(knowledge_base, filename))
+    return filenames[docs:docs + queries]
+
+
+def install_fakes(db_latency: float, llm_latency: float, llm_jitter: float, max_in_flight: int, keep_llm_cache: bool):
+    from benchmarks.fakes import FakeSupabase
+    from app.services import analysis_service
+    from app.services import job_writer as job_writer_module
+    from app.services.llm_cache import LLMResponseCache
+    from app.services.llm_gateway import LLMGateway, FakeBackend, set_gateway
+    import ingest_data
+
+    fake_db = FakeSupabase(latency=db_latency)
+    for module in (analysis_service, job_writer_module, ingest_data):
+        module.supabase = fake_db
+    set_gateway(LLMGateway(
+        FakeBackend(latency=llm_latency, jitter=llm_jitter),
+        max_in_flight=max_in_flight, requests_per_minute=1e9, tokens_per_minute=1e12,
+    ))
+    if not keep_llm_cache:
+        # Every level re-runs the same prompts; a zero-size cache keeps them all misses
+        analysis_service.llm_cache = LLMResponseCache(max_entries=0, ttl_seconds=0)
+    return fake_db
+
+
+def run_ingest(recorder: StageRecorder, docs: int, workers: int) -> dict:
+    import ingest_data
+    recorder.reset()
+    started = time.perf_counter()
+    ingest_data.process_and_ingest(batch=True, full=True, workers=workers)
+    wall = time.perf_counter() - started
+    stages = {
+        stage.replace("ingest_", ""): {"seconds": round(sum(samples), 4),
+                                       "docs_per_sec": round(docs / sum(samples), 2) if sum(samples) else None}
+        for stage, samples in recorder.samples.items() if stage.startswith("ingest_")
+    }
+    return {"docs": docs, "wall_seconds": round(wall, 3), "docs_per_sec": round(docs / wall, 2), "stages": stages}
+
+
+def run_level(recorder: StageRecorder, fake_db, pairs: list, concurrency: int) -> dict:
+    from app.services import analysis_service
+    recorder.reset()
+    job_ids = [f"bench-c{concurrency}-{i}" for i in range(len(pairs))]
+    for job_id in job_ids:
+        fake_db.table("jobs").insert({"job_id": job_id, "status": "PENDING"}).execute()
+
+    job_seconds = []
+
+    def run(job_id, pair):
+        started = time.perf_counter()
+        ok = analysis_service.run_analysis_pipeline(job_id, *pair)
+        job_seconds.append(time.perf_counter() - started)
+        return ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(run, job_ids, pairs))
+    wall = time.perf_counter() - started
+
+    return {
+        "jobs": len(pairs),
+        "errors": outcomes.count(False),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_sec": round(len(pairs) / wall, 3),
+        "job": summarize(job_seconds, wall),
+        "stages": {stage: summarize(recorder.samples.get(stage, []), wall) for stage in PIPELINE_STAGES},
+    }
+
+
+def compare(results: dict, baseline_path: str, tolerance: float) -> list:
+    """Returns the (level, stage, baseline p95, current p95) entries that regressed."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for level, current in results["pipeline"].items():
+        previous = baseline.get("pipeline", {}).get(level)
+        if not previous:
+            continue
+        for stage, summary in current["stages"].items():
+            before = previous["stages"].get(stage, {}).get("p95")
+            now = summary.get("p95")
+            if before and now and now > before * (1 + tolerance):
+                regressions.append((level, stage, before, now))
+    return regressions
+
+
+def print_level(concurrency: int, level: dict):
+    print(f"\nConcurrency {concurrency}: {level['jobs']} jobs in {level['wall_seconds']:.2f}s "
+          f"({level['jobs_per_sec']:.2f} jobs/s, {level['errors']} errors)")
+    print(f"  {'stage':<10} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}")
+    for stage, summary in level["stages"].items():
+        if summary["count"]:
+            print(f"  {stage:<10} {summary['p50']:9.4f} {summary['p95']:9.4f} {summary['p99']:9.4f} {summary['mean']:9.4f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end ingest and pipeline benchmark with local fakes.")
+    parser.add_argument("--docs", type=int, default=200, help="Corpus documents to ingest.")
+    parser.add_argument("--queries", type=int, default=20, help="Held-out documents run through the pipeline per level.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="Concurrent jobs per level.")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="Seconds per fake Supabase request.")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Seconds per fake Gemini response.")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="+/- seconds of random LLM latency.")
+    parser.add_argument("--llm-max-in-flight", type=int, default=8, help="Gateway concurrency cap for the fake LLM.")
+    parser.add_argument("--keep-llm-cache", action="store_true", help="Let repeated prompts hit the response cache.")
+    parser.add_argument("--ingest-workers", type=int, default=os.cpu_count() or 1, help="Extraction processes for ingest.")
+    parser.add_argument("--skip-ingest", action="store_true", help="Don't report ingest timings (the index is still built).")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for choosing documents.")
+    parser.add_argument("--output", default=None, help="Result JSON path (default benchmarks/results/pipeline-<time>.json).")
+    parser.add_argument("--baseline", default=None, help="Earlier result JSON to compare p95s against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown vs the baseline (0.2 = 20%%).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workspace = tempfile.mkdtemp(prefix="complai-bench-")
+    sys.path.insert(0, BACKEND_DIR)
+
+    try:
+        query_files = prepare_workspace(workspace, args.docs, args.queries, args.seed)
+        # Import (and read .env) from the backend directory first
+        from app.core import timing
+        from app.services import analysis_service
+        # Relative paths in settings (indexes, queue, stats) and ingest_data now resolve inside the workspace
+        os.chdir(workspace)
+        fake_db = install_fakes(args.db_latency, args.llm_latency, args.llm_jitter,
+                                args.llm_max_in_flight, args.keep_llm_cache)
+        recorder = StageRecorder()
+        timing.add_listener(recorder)
+
+        results = {
+            "config": vars(args),
+            "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpus": os.cpu_count()},
+            "timestamp": time.time(),
+        }
+
+        started = time.perf_counter()
+        analysis_service.warm_up_models()
+        results["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+
+        print(f"Ingesting {args.docs} documents...")
+        ingest = run_ingest(recorder, args.docs, args.ingest_workers)
+        if not args.skip_ingest:
+            results["ingest"] = ingest
+
+        print(f"Building {len(query_files)} complaint/FRL PDF pairs...")
+        pairs = []
+        for filename in query_files:
+            with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8") as f:
+                pairs.append(make_query_pair(f.read(), workspace, filename))
+
+        results["pipeline"] = {}
+        for concurrency in args.concurrency:
+            level = run_level(recorder, fake_db, pairs, concurrency)
+            results["pipeline"][str(concurrency)] = level
+            print_level(concurrency, level)
+
+        from app.services.llm_gateway import get_gateway
+        results["supabase"] = fake_db.stats()
+        results["llm"] = get_gateway().stats()
+    finally:
+        os.chdir(BACKEND_DIR)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for level, stage, before, now in regressions:
+            print(f"REGRESSION concurrency={level} {stage}: p95 {before:.4f}s -> {now:.4f}s")
+        if regressions:
+            sys.exit(1)
+        print(f"No p95 regressions beyond {args.tolerance:.0%} against {baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Cold-start benchmark for the API and the analysis models.
+
+Each measurement runs in a fresh interpreter so nothing is already imported or
+loaded:
+  - import_app:      `import app.main` (what every deploy/reload pays before serving)
+  - import_<lib>:    each heavy library on its own
+  - warm_up:         analysis_service.warm_up_models(), with per-model load times
+  - first_encode:    latency of the first and second embedding call after loading
+
+Run from the backend directory:
+    python -m benchmarks.startup_benchmark --runs 5 --output benchmarks/results/startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_LIBRARIES = {
+    "fitz": "fitz",
+    "spacy": "spacy",
+    "sentence_transformers": "sentence_transformers",
+    "google_generativeai": "google.generativeai",
+}
+
+IMPORT_APP = """
+import json, time
+started = time.perf_counter()
+import app.main
+print(json.dumps({"seconds": time.perf_counter() - started}))
+"""
+
+IMPORT_LIBRARY = """
+import json, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started}}))
+"""
+
+WARM_UP = """
+import json, time
+from app.services import analysis_service
+started = time.perf_counter()
+status = analysis_service.warm_up_models()
+print(json.dumps({"seconds": time.perf_counter() - started,
+                  "models": {name: s["load_seconds"] for name, s in status.items()}}))
+"""
+
+FIRST_ENCODE = """
+import json, time
+from app.services import analysis_service
+model = analysis_service.get_embedding_model()
+text = "The firm failed to carry out proportionate affordability checks before lending."
+timings = []
+for _ in range(2):
+    started = time.perf_counter()
+    model.encode(text)
+    timings.append(time.perf_counter() - started)
+print(json.dumps({"first": timings[0], "second": timings[1]}))
+"""
+
+
+def run_snippet(code: str) -> dict:
+    """Runs `code` in a fresh interpreter from the backend directory and parses its last output line."""
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "snippet failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(values: list) -> dict:
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def measure(name: str, code: str, runs: int, fields=("seconds",)) -> dict:
+    samples = {field: [] for field in fields}
+    models = {}
+    for _ in range(runs):
+        try:
+            result = run_snippet(code)
+        except RuntimeError as e:
+            print(f"  {name}: failed ({e})")
+            return {"error": str(e)}
+        for field in fields:
+            samples[field].append(result[field])
+        for model, seconds in result.get("models", {}).items():
+            if seconds is not None:
+                models.setdefault(model, []).append(seconds)
+    summary = {field: summarize(values) for field, values in samples.items()}
+    if models:
+        summary["models"] = {model: summarize(values) for model, values in models.items()}
+    print(f"  {name}: " + ", ".join(f"{field} median {summary[field]['median']:.3f}s" for field in fields))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import time and model cold-start costs.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh-interpreter runs per measurement.")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path.")
+    parser.add_argument("--skip-models", action="store_true", help="Only measure imports.")
+    args = parser.parse_args()
+
+    print(f"Startup benchmark ({args.runs} runs each)")
+    results = {"runs": args.runs, "python": sys.version.split()[0], "timestamp": time.time()}
+    results["import_app"] = measure("import app.main", IMPORT_APP, args.runs)
+    for name, module in HEAVY_LIBRARIES.items():
+        results[f"import_{name}"] = measure(f"import {module}", IMPORT_LIBRARY.format(module=module), args.runs)
+    if not args.skip_models:
+        results["warm_up"] = measure("warm_up_models", WARM_UP, args.runs)
+        results["first_encode"] = measure("first encode", FIRST_ENCODE, args.runs, fields=("first", "second"))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
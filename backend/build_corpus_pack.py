@@ -0,0 +1,61 @@
+import os
+import time
+import hashlib
+import argparse
+from app.services.corpus_pack import build_pack, default_codec, CorpusPack, CODECS
+from app.services.pdf_text import extract_text
+from app.core.config import settings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+def read_documents(source_dir):
+    """Yields {name, case_id, text, sha256} for every supported file in `source_dir` (case_id as in ingest_data)."""
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            continue
+        path = os.path.join(source_dir, filename)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if filename.lower().endswith(".pdf"):
+            text = extract_text(path)
+        else:
+            text = data.decode('utf-8')
+        yield {
+            'name': filename,
+            'case_id': os.path.splitext(filename)[0],
+            'text': text,
+            'sha256': hashlib.sha256(data).hexdigest()
+        }
+
+def verify(path, documents):
+    """Reads every document back by name and by case_id and compares it with its source text."""
+    with CorpusPack(path) as pack:
+        for document in documents:
+            if pack.read(document['name']) != document['text'] or pack.get(document['case_id']) != document['text']:
+                raise SystemExit(f"Verification failed for {document['name']}")
+    print(f"Verified {len(documents)} documents.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pack the knowledge base into one compressed, randomly accessible file.")
+    parser.add_argument("--source", default="knowledge_base", help="Directory of .txt/.pdf decisions.")
+    parser.add_argument("--output", default=settings.CORPUS_PACK_PATH, help="Pack file to write.")
+    parser.add_argument("--codec", choices=sorted(CODECS), default=default_codec(), help="Per-document compression.")
+    parser.add_argument("--level", type=int, default=None, help="Compression level (zstd 19 / zlib 9 by default).")
+    parser.add_argument("--no-dictionary", action="store_true", help="Don't train a shared zstd dictionary.")
+    parser.add_argument("--verify", action="store_true", help="Read every document back after building.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    started = time.perf_counter()
+    documents = list(read_documents(args.source))
+    stats = build_pack(args.output, documents, codec=args.codec, level=args.level, dictionary=not args.no_dictionary)
+    print(f"Packed {stats['documents']} documents from '{args.source}' into '{args.output}' "
+          f"in {time.perf_counter() - started:.1f}s: {stats['raw_bytes'] / 1e6:.1f} MB of text -> "
+          f"{stats['file_bytes'] / 1e6:.1f} MB ({stats['codec']} level {stats['level']}, "
+          f"{stats['dictionary_bytes'] // 1024} KB dictionary).")
+    if args.verify:
+        verify(args.output, documents)
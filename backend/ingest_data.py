@@ -1,108 +1,462 @@
 import os
-import fitz  # PyMuPDF
-import spacy
-from sentence_transformers import SentenceTransformer
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from app.services.supabase_client import supabase
+from app.services.precedent_index import build_index, read_index_meta, update_index
+from app.services.bm25_index import has_bm25
+from app.services.passages import split_into_passages
+from app.services.digest import build_digest
+from app.services.metadata_extractor import MetadataExtractor
+from app.services.embedding_backends import create_backend, model_key
+from app.services.corpus_pack import CorpusPack
+from app.services.pdf_text import extract_text
+from app.core.config import settings
+from app.core import timing
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # --- CONFIGURATION ---
 KNOWLEDGE_BASE_DIR = "knowledge_base"
-MODEL_NAME = 'all-MiniLM-L6-v2'
+MODEL_NAME = settings.EMBEDDING_MODEL_NAME
+# Recorded in the manifest and index meta; changes with EMBEDDING_BACKEND / EMBEDDING_ONNX_FILE
+MODEL_KEY = model_key()
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+MANIFEST_PATH = "ingest_manifest.json"
+# Bump whenever extraction/metadata logic changes so every file is re-ingested
+EXTRACTION_VERSION = 6
+
+# Batch mode defaults (overridable from the command line)
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_EMBED_BATCH_SIZE = 64
+DEFAULT_UPSERT_BATCH_SIZE = 100
 
 # --- INITIALIZE MODELS ---
-print("Loading NLP and embedding models...")
-nlp = spacy.load("en_core_web_sm")
-model = SentenceTransformer(MODEL_NAME)
-print("Models loaded successfully.")
-
-def extract_text_from_pdf(file_path):
-    """Extracts text from a PDF file."""
-    doc = fitz.open(file_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+# Models are loaded lazily so that extraction worker processes, which only
+# read and split files, load neither spaCy nor the embedding model.
+_extractor = None
+_model = None
+# Packed corpus documents are read from instead of KNOWLEDGE_BASE_DIR (--pack)
+_corpus = None
+
+def use_pack(path):
+    """Reads documents from the corpus pack at `path` (None: from KNOWLEDGE_BASE_DIR)."""
+    global _corpus
+    _corpus = CorpusPack(path) if path else None
+
+def get_extractor():
+    """Loads the spaCy-based metadata extractor once per process."""
+    global _extractor
+    if _extractor is None:
+        print("Loading NLP model...")
+        _extractor = MetadataExtractor.load(settings.NLP_MODEL_NAME)
+    return _extractor
+
+def get_model():
+    """Loads the embedding backend (EMBEDDING_BACKEND) once per process; ingest batches its own encode calls."""
+    global _model
+    if _model is None:
+        print("Loading embedding model...")
+        _model = create_backend(model_name=MODEL_NAME)
+    return _model
 
 def extract_metadata_from_text(text, filename):
+    """Extracts a decision's metadata (see app/services/metadata_extractor.py); the case_id is the filename."""
+    return {'case_id': os.path.splitext(filename)[0], **get_extractor().extract(text)}
+
+def extract_metadata_many(texts, filenames, n_process=1):
+    """extract_metadata_from_text for many documents, tokenized in batches with nlp.pipe."""
+    metadata = get_extractor().extract_many(texts, n_process=n_process, batch_size=settings.NLP_BATCH_SIZE)
+    return [{'case_id': os.path.splitext(filename)[0], **fields} for filename, fields in zip(filenames, metadata)]
+
+def build_embedding_text(metadata):
+    """We embed a concatenated string of key info for better retrieval."""
+    return (f"Case: {metadata['case_id']}. Product: {metadata['product_type'] or 'Unknown'}. "
+            f"Themes: {', '.join(metadata['key_themes'])}. Outcome: {metadata['fos_outcome'] or 'Unknown'}")
+
+def read_document(file_path):
+    """Reads a knowledge base file and returns its text, or "" if unsupported/empty."""
+    if file_path.lower().endswith(".pdf"):
+        # Same extraction as /api/analyze, so precedents and complaints match
+        return extract_text(file_path)
+    elif file_path.lower().endswith(".txt"):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    return ""
+
+def read_source(filename):
+    """Text of a knowledge base document, from the corpus pack when one is in use."""
+    if _corpus is not None:
+        return _corpus.read(filename)
+    return read_document(os.path.join(KNOWLEDGE_BASE_DIR, filename))
+
+def list_documents():
+    """Returns the supported filenames in the knowledge base directory (or corpus pack)."""
+    names = _corpus.names() if _corpus is not None else os.listdir(KNOWLEDGE_BASE_DIR)
+    return sorted(filename for filename in names if filename.lower().endswith(SUPPORTED_EXTENSIONS))
+
+def source_hash(filename):
+    """Content hash of a document's source file; packs store it, so nothing is read."""
+    if _corpus is not None:
+        return _corpus.entry(filename)['sha256']
+    return file_hash(os.path.join(KNOWLEDGE_BASE_DIR, filename))
+
+def file_hash(file_path):
+    """SHA-256 of a file's bytes, used to detect changed documents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest():
+    """Loads the ingest manifest ({filename: {hash, model, extraction_version, case_id}})."""
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    """Writes the manifest atomically so an interrupted run never leaves it half-written."""
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def plan_ingest(full=False):
+    """
+    Compares the knowledge base with the manifest and the local indexes.
+    Returns (to_process, unchanged, deleted, hashes) where `deleted` maps removed
+    filenames to their case_id and `hashes` holds the current hash of every file.
+    """
+    manifest = load_manifest()
+    indexed_case_ids = None
+    for index_dir in (settings.PRECEDENT_INDEX_DIR, settings.PASSAGE_INDEX_DIR):
+        index_meta = read_index_meta(index_dir) or {'rows': []}
+        case_ids = {row['case_id'] for row in index_meta['rows']}
+        indexed_case_ids = case_ids if indexed_case_ids is None else indexed_case_ids & case_ids
+
+    filenames = list_documents()
+    hashes = {filename: source_hash(filename) for filename in filenames}
+    to_process, unchanged = [], []
+    for filename in filenames:
+        entry = manifest.get(filename)
+        if (not full
+                and entry
+                and entry['hash'] == hashes[filename]
+                and entry['model'] == MODEL_KEY
+                and entry['extraction_version'] == EXTRACTION_VERSION
+                and entry['case_id'] in indexed_case_ids):
+            unchanged.append(filename)
+        else:
+            to_process.append(filename)
+
+    deleted = {filename: entry['case_id'] for filename, entry in manifest.items() if filename not in hashes}
+    return to_process, unchanged, deleted, hashes
+
+def write_passages(case_ids, passage_rows, batch_size=DEFAULT_UPSERT_BATCH_SIZE):
     """
-    Extracts metadata using spaCy and rule-based logic.
-    
-    NOTE: This is a simplified placeholder. A real implementation would require
-    sophisticated regex, keyword matching, and potentially a trained NER model
-    to reliably extract these fields from unstructured text.
+    Replaces the stored passages of the given cases in the 'precedent_passages'
+    table (created by supabase/migrations/20261018000000_precedent_passages.sql).
     """
-    doc = nlp(text)
-    
-    # Example placeholder logic
-    product_type = "Personal Loan" # Default, find in text
-    key_themes = ["Affordability", "Customer Service"] # Extract from common phrases
-    fos_outcome = "Upheld" if "upheld" in text.lower() else "Not Upheld"
-    
-    # Dummy values for demonstration
-    metadata = {
-        'case_id': os.path.splitext(filename)[0],
-        'firm_name': 'Example Bank PLC',
-        'product_type': product_type,
-        'key_themes': key_themes,
-        'fos_outcome': fos_outcome,
-        'compensation_awarded': 500.00,
-        'redress_amount': 250.00,
-        'remedial_action': ['Apology', 'System Update']
+    supabase.table('precedent_passages').delete().in_('case_id', case_ids).execute()
+    for chunk in _chunks(passage_rows, batch_size):
+        supabase.table('precedent_passages').insert(chunk).execute()
+
+def passage_row(case_id, passage, embedding):
+    return {
+        'case_id': case_id,
+        'passage_index': passage['passage_index'],
+        'section': passage['section'],
+        'text': passage['text'],
+        'embedding': embedding
     }
-    return metadata
 
-def process_and_ingest():
+def process_files(filenames):
     """
-    Processes all documents in the knowledge base directory, generates embeddings,
-    and inserts them into the Supabase 'precedents' table.
+    Processes the given documents one at a time: generates document and passage
+    embeddings and upserts them into the Supabase 'precedents' and
+    'precedent_passages' tables.
+    Returns a list of {'filename', 'record', 'embedding', 'passages'} for the files ingested.
     """
-    print(f"Starting ingestion from '{KNOWLEDGE_BASE_DIR}' directory...")
-    files_processed = 0
-    for filename in os.listdir(KNOWLEDGE_BASE_DIR):
-        file_path = os.path.join(KNOWLEDGE_BASE_DIR, filename)
-        text = ""
-        
+    model = get_model()
+    ingested = []
+    for filename in filenames:
         try:
-            if filename.lower().endswith(".pdf"):
-                text = extract_text_from_pdf(file_path)
-            elif filename.lower().endswith(".txt"):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-            else:
-                continue # Skip unsupported files
+            text = read_source(filename)
 
             if not text:
                 print(f"Warning: Could not extract text from {filename}. Skipping.")
                 continue
 
-            # 1. Extract Metadata
+            # 1. Extract Metadata and passages
             metadata = extract_metadata_from_text(text, filename)
-            
-            # 2. Generate Embedding
-            # We embed a concatenated string of key info for better retrieval
-            embedding_text = f"Case: {metadata['case_id']}. Product: {metadata['product_type']}. Themes: {', '.join(metadata['key_themes'])}. Outcome: {metadata['fos_outcome']}"
-            embedding = model.encode(embedding_text).tolist()
+            passages = split_into_passages(text, settings.PASSAGE_MAX_WORDS, settings.PASSAGE_OVERLAP_WORDS)
+
+            # 2. Generate Embeddings
+            embedding = model.encode(build_embedding_text(metadata)).tolist()
+            passage_embeddings = model.encode([passage['text'] for passage in passages]).tolist()
 
             # 3. Prepare data for Supabase
             data_to_insert = {
                 **metadata,
                 'full_text': text,
+                'digest': build_digest(text),
                 'embedding': embedding
             }
+            passage_rows = [
+                passage_row(metadata['case_id'], passage, passage_embedding)
+                for passage, passage_embedding in zip(passages, passage_embeddings)
+            ]
 
             # 4. Insert into Supabase
             # Using upsert to avoid duplicate case_id entries if script is run multiple times
             data, count = supabase.table('precedents').upsert(data_to_insert, on_conflict='case_id').execute()
+            write_passages([metadata['case_id']], passage_rows)
 
-            print(f"Successfully processed and ingested: {filename}")
-            files_processed += 1
+            ingested.append({
+                'filename': filename,
+                'record': {**metadata, 'full_text': text, 'digest': data_to_insert['digest']},
+                'embedding': embedding,
+                'passages': passage_rows
+            })
+            print(f"Successfully processed and ingested: {filename} ({len(passages)} passages)")
 
         except Exception as e:
             print(f"Error processing file {filename}: {e}")
-            
-    print(f"\nIngestion complete. Total files processed: {files_processed}")
+
+    return ingested
+
+def _prepare(filename, text):
+    if not text:
+        return filename, None, None, "no text extracted"
+    record = {'full_text': text, 'digest': build_digest(text)}
+    passages = split_into_passages(text, settings.PASSAGE_MAX_WORDS, settings.PASSAGE_OVERLAP_WORDS)
+    return filename, record, passages, None
+
+def _extract_worker(filename):
+    """Process-pool task: reads one file and splits it into passages (metadata is extracted afterwards in batches)."""
+    try:
+        return _prepare(filename, read_document(os.path.join(KNOWLEDGE_BASE_DIR, filename)))
+    except Exception as e:
+        return filename, None, None, str(e)
+
+def _split_worker(item):
+    """Process-pool task for packed corpora: the text was already read sequentially from the pack."""
+    filename, text = item
+    try:
+        return _prepare(filename, text)
+    except Exception as e:
+        return filename, None, None, str(e)
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def process_files_batched(filenames,
+                          workers=DEFAULT_WORKERS,
+                          embed_batch_size=DEFAULT_EMBED_BATCH_SIZE,
+                          upsert_batch_size=DEFAULT_UPSERT_BATCH_SIZE):
+    """
+    Batch mode of process_files: files are read and extracted in a process
+    pool, metadata is extracted with one batched nlp.pipe pass over all texts
+    (`workers` processes), embeddings are computed in batches and rows are
+    written with chunked multi-row upserts. Prints a per-stage throughput summary at the end.
+    """
+    print(f"Batch mode: workers={workers}, embed_batch_size={embed_batch_size}, upsert_batch_size={upsert_batch_size}")
+    timings = {}
+
+    # 1. Read and extract in parallel
+    start = time.perf_counter()
+    extracted = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if _corpus is not None:
+            results = pool.map(_split_worker, _corpus.iter_documents(filenames), chunksize=8)
+        else:
+            results = pool.map(_extract_worker, filenames, chunksize=8)
+        for filename, record, passages, error in results:
+            if error:
+                print(f"Error processing file {filename}: {error}")
+            else:
+                extracted.append((filename, record, passages))
+    timings['extract'] = time.perf_counter() - start
+
+    # 2. Metadata for every document in one batched pass
+    start = time.perf_counter()
+    if extracted:
+        metadata = extract_metadata_many(
+            [record['full_text'] for _, record, _ in extracted],
+            [filename for filename, _, _ in extracted],
+            n_process=workers
+        )
+        extracted = [(filename, {**fields, **record}, passages)
+                     for (filename, record, passages), fields in zip(extracted, metadata)]
+    timings['metadata'] = time.perf_counter() - start
+
+    # 3. Embed documents and passages in batches
+    start = time.perf_counter()
+    items = []
+    if extracted:
+        model = get_model()
+        embeddings = model.encode(
+            [build_embedding_text(record) for _, record, _ in extracted],
+            batch_size=embed_batch_size,
+            show_progress_bar=False
+        ).tolist()
+        passage_embeddings = iter(model.encode(
+            [passage['text'] for _, _, passages in extracted for passage in passages],
+            batch_size=embed_batch_size,
+            show_progress_bar=False
+        ).tolist())
+        for (filename, record, passages), embedding in zip(extracted, embeddings):
+            items.append({
+                'filename': filename,
+                'record': record,
+                'embedding': embedding,
+                'passages': [passage_row(record['case_id'], passage, next(passage_embeddings)) for passage in passages]
+            })
+    timings['embed'] = time.perf_counter() - start
+
+    # 4. Multi-row upserts; only successfully written files count as ingested
+    start = time.perf_counter()
+    ingested = []
+    for chunk in _chunks(items, upsert_batch_size):
+        rows = [{**item['record'], 'embedding': item['embedding']} for item in chunk]
+        try:
+            supabase.table('precedents').upsert(rows, on_conflict='case_id').execute()
+            write_passages(
+                [row['case_id'] for row in rows],
+                [passage for item in chunk for passage in item['passages']],
+                upsert_batch_size
+            )
+            ingested.extend(chunk)
+        except Exception as e:
+            print(f"Error upserting batch of {len(rows)} rows starting at {rows[0]['case_id']}: {e}")
+    timings['upsert'] = time.perf_counter() - start
+
+    print_throughput_summary(timings, len(extracted))
+    for stage, seconds in timings.items():
+        timing.record(f"ingest_{stage}", seconds, docs=len(extracted))
+    return ingested
+
+def print_throughput_summary(timings, doc_count):
+    """Prints seconds and docs/sec for each ingestion stage."""
+    print("\nThroughput summary:")
+    for stage, seconds in timings.items():
+        rate = doc_count / seconds if seconds > 0 else float('inf')
+        print(f"  {stage:<8} {seconds:8.2f}s  {rate:10.1f} docs/sec")
+    total = sum(timings.values())
+    print(f"  {'total':<8} {total:8.2f}s  {(doc_count / total if total > 0 else 0):10.1f} docs/sec")
+
+def process_and_ingest(batch=False, full=False, dry_run=False,
+                       workers=DEFAULT_WORKERS,
+                       embed_batch_size=DEFAULT_EMBED_BATCH_SIZE,
+                       upsert_batch_size=DEFAULT_UPSERT_BATCH_SIZE,
+                       pack=None):
+    """
+    Incrementally ingests the knowledge base directory (or the corpus pack at `pack`): only new or changed files
+    (per the content-hash manifest) are processed, precedents whose source file
+    was deleted are removed, and the local precedent index is updated in place.
+    `full` re-ingests every file and rebuilds the index; `dry_run` only reports
+    what would change.
+    """
+    use_pack(pack)
+    print(f"Starting ingestion from '{pack or KNOWLEDGE_BASE_DIR}'...")
+    to_process, unchanged, deleted, hashes = plan_ingest(full)
+    print(f"Manifest diff: {len(to_process)} new/changed, {len(unchanged)} unchanged, {len(deleted)} deleted.")
+    if dry_run:
+        for filename in to_process:
+            print(f"  + {filename}")
+        for filename in deleted:
+            print(f"  - {filename}")
+        return
+
+    # 1. Ingest new and changed files
+    if batch:
+        ingested = process_files_batched(to_process, workers, embed_batch_size, upsert_batch_size)
+    else:
+        ingested = process_files(to_process)
+
+    # 2. Remove precedents whose source file is gone
+    deleted_case_ids = sorted(set(deleted.values()))
+    for chunk in _chunks(deleted_case_ids, upsert_batch_size):
+        supabase.table('precedent_passages').delete().in_('case_id', chunk).execute()
+        supabase.table('precedents').delete().in_('case_id', chunk).execute()
+        print(f"Removed {len(chunk)} deleted precedents.")
+
+    # 3. Update the local precedent and passage indexes (indexes built before
+    # the BM25 sidecar existed are rebuilt from their own rows to gain one)
+    missing_lexical = [
+        index_dir for index_dir in (settings.PRECEDENT_INDEX_DIR, settings.PASSAGE_INDEX_DIR)
+        if read_index_meta(index_dir) is not None and not has_bm25(index_dir)
+    ]
+    if not ingested and not deleted_case_ids and not missing_lexical:
+        print("\nNothing to ingest; precedent indexes are up to date.")
+        return
+    index_rows = [{**item['record'], 'id': item['record']['case_id']} for item in ingested]
+    index_embeddings = [item['embedding'] for item in ingested]
+    passage_rows = [
+        {
+            'id': f"{passage['case_id']}#{passage['passage_index']}",
+            'product_type': item['record']['product_type'],
+            'key_themes': item['record']['key_themes'],
+            **passage
+        }
+        for item in ingested for passage in item['passages']
+    ]
+    passage_embeddings = [passage.pop('embedding') for passage in passage_rows]
+    for index_dir, rows, embeddings, text_fields, lexical_field in (
+        (settings.PRECEDENT_INDEX_DIR, index_rows, index_embeddings, ('full_text', 'digest'), 'full_text'),
+        (settings.PASSAGE_INDEX_DIR, passage_rows, passage_embeddings, ('text',), 'text'),
+    ):
+        print(f"Updating index in '{index_dir}'...")
+        if full:
+            # A full run rebuilds from scratch so nothing stale survives
+            build_index(index_dir, rows, embeddings, model_name=MODEL_KEY,
+                        text_fields=text_fields, quantize=settings.PRECEDENT_INDEX_QUANTIZE,
+                        lexical_field=lexical_field)
+        else:
+            update_index(index_dir, rows, embeddings, remove_case_ids=deleted_case_ids,
+                         model_name=MODEL_KEY, text_fields=text_fields,
+                         quantize=settings.PRECEDENT_INDEX_QUANTIZE, lexical_field=lexical_field)
+
+    # 4. Record what is now ingested
+    manifest = load_manifest()
+    for filename in deleted:
+        manifest.pop(filename, None)
+    for item in ingested:
+        manifest[item['filename']] = {
+            'hash': hashes[item['filename']],
+            'model': MODEL_KEY,
+            'extraction_version': EXTRACTION_VERSION,
+            'case_id': item['record']['case_id']
+        }
+    save_manifest(manifest)
+
+    print(f"\nIngestion complete. Total files processed: {len(ingested)} of {len(to_process)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest the knowledge base into Supabase and the local precedent index.")
+    parser.add_argument("--batch", action="store_true", help="Use the batched, parallel ingestion mode.")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-ingest every file.")
+    parser.add_argument("--dry-run", action="store_true", help="Report new, changed and deleted files without ingesting.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Extraction worker processes (batch mode).")
+    parser.add_argument("--embed-batch-size", type=int, default=DEFAULT_EMBED_BATCH_SIZE, help="Texts per encode call (batch mode).")
+    parser.add_argument("--pack", default=None, help="Read documents from this corpus pack (build_corpus_pack.py).")
+    parser.add_argument("--upsert-batch-size", type=int, default=DEFAULT_UPSERT_BATCH_SIZE, help="Rows per upsert/delete request.")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    process_and_ingest()
\ No newline at end of file
+    args = parse_args()
+    process_and_ingest(
+        batch=args.batch,
+        full=args.full,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        embed_batch_size=args.embed_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        pack=args.pack
+    )
@@ -0,0 +1,39 @@
+from app.services.supabase_client import supabase
+from app.services.dedup_index import duplicate_index
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PAGE_SIZE = 200
+
+def fetch_completed_jobs():
+    """Yields (job_id, complaint_text, frl_text) for every completed job that ran its own analysis."""
+    start = 0
+    while True:
+        res = supabase.table('jobs') \
+            .select('job_id, complaint_text, frl_text, reused_from:report_data->reused_from') \
+            .eq('status', 'COMPLETE') \
+            .order('job_id') \
+            .range(start, start + PAGE_SIZE - 1) \
+            .execute()
+        for job in res.data:
+            if not job.get('reused_from'):
+                yield job['job_id'], job.get('complaint_text') or '', job.get('frl_text') or ''
+        if len(res.data) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+def rebuild():
+    """Rebuilds the duplicate-submission index from the jobs table."""
+    print("Rebuilding the duplicate index from completed jobs...")
+    duplicate_index.clear()
+    indexed = skipped = 0
+    for job_id, complaint_text, frl_text in fetch_completed_jobs():
+        if duplicate_index.add(job_id, complaint_text, frl_text):
+            indexed += 1
+        else:
+            skipped += 1
+    print(f"Indexed {indexed} jobs ({skipped} skipped: too little text to fingerprint).")
+
+if __name__ == "__main__":
+    rebuild()
@@ -0,0 +1,34 @@
+from app.services.supabase_client import supabase
+from app.services import job_stats
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PAGE_SIZE = 1000
+
+def fetch_all_jobs():
+    """Yields (job_id, status, predicted outcome) for every job, one page at a time."""
+    start = 0
+    while True:
+        res = supabase.table('jobs') \
+            .select('job_id, status, outcome:report_data->predicted_fos_outcome->>outcome') \
+            .order('job_id') \
+            .range(start, start + PAGE_SIZE - 1) \
+            .execute()
+        for job in res.data:
+            yield job['job_id'], job['status'], job.get('outcome')
+        if len(res.data) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+def reconcile():
+    """Rebuilds the dashboard counters from the jobs table."""
+    print("Rebuilding dashboard counters from the jobs table...")
+    count = job_stats.rebuild(fetch_all_jobs())
+    counters = job_stats.get_counters()
+    print(f"Reconciled {count} jobs.")
+    for name, value in sorted(counters.items()):
+        print(f"  {name:<24} {value}")
+
+if __name__ == "__main__":
+    reconcile()
@@ -0,0 +1,39 @@
+-- Schema written by ingest_data.py on top of the original precedents table
+-- (case_id, firm_name, product_type, key_themes, fos_outcome,
+-- compensation_awarded, redress_amount, remedial_action, full_text, embedding).
+-- Apply with `supabase db push` or paste into the SQL editor; every statement
+-- is idempotent. Embedding columns match EMBEDDING_MODEL_NAME
+-- (all-MiniLM-L6-v2, 384 dimensions).
+
+create extension if not exists vector;
+
+-- 1. Precedent digests ('Outcome / Key reasoning / Redress', see app/services/digest.py)
+alter table precedents add column if not exists digest text;
+
+-- 2. Rule-based metadata (app/services/metadata_extractor.py): any field the
+-- rules cannot find is written as null, and amounts are in pounds
+alter table precedents add column if not exists firm_name text;
+alter table precedents add column if not exists product_type text;
+alter table precedents add column if not exists key_themes text[] not null default '{}';
+alter table precedents add column if not exists fos_outcome text;
+alter table precedents add column if not exists compensation_awarded numeric(12, 2);
+alter table precedents add column if not exists redress_amount numeric(12, 2);
+alter table precedents add column if not exists remedial_action text[] not null default '{}';
+alter table precedents alter column firm_name drop not null;
+alter table precedents alter column product_type drop not null;
+alter table precedents alter column fos_outcome drop not null;
+alter table precedents alter column compensation_awarded drop not null;
+alter table precedents alter column redress_amount drop not null;
+
+-- 3. Embedded passages of each decision, replaced per case on every ingest
+create table if not exists precedent_passages (
+    id bigint generated by default as identity primary key,
+    case_id text not null references precedents (case_id) on delete cascade,
+    passage_index integer not null,
+    section text,
+    text text not null,
+    embedding vector(384) not null,
+    unique (case_id, passage_index)
+);
+
+create index if not exists precedent_passages_case_id_idx on precedent_passages (case_id);
@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import pytest
+from app.core.config import settings
+from app.services import embedding_backends
+from app.services.embedding_backends import BatchingEmbedder, create_backend, create_embedder, model_key
+from app.services.passages import split_into_passages
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base")
+PASSAGES = 64
+
+# Minimum cosine similarity to the torch vector for the same text, and the
+# mean over all passages. ONNX runs the same fp32 graph; int8 loses a little.
+TOLERANCES = {
+    "torch-int8": {"min": 0.95, "mean": 0.98},
+    "onnx": {"min": 0.999, "mean": 0.9995},
+}
+
+
+def load_passages() -> list:
+    passages = []
+    for filename in sorted(f for f in os.listdir(CORPUS_DIR) if f.endswith(".txt")):
+        with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8", errors="replace") as f:
+            passages.extend(passage["text"] for passage in split_into_passages(f.read()))
+        if len(passages) >= PASSAGES:
+            return passages[:PASSAGES]
+    return passages
+
+
+def load_backend(name: str, **kwargs):
+    """The backend, or a skip when its runtime or the model weights are not available here."""
+    pytest.importorskip("sentence_transformers")
+    if name == "onnx":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("optimum")
+    try:
+        return create_backend(name, **kwargs)
+    except OSError as e:
+        pytest.skip(f"model not available: {e}")
+
+
+def normalised(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+@pytest.fixture(scope="module")
+def passages():
+    return load_passages()
+
+
+@pytest.fixture(scope="module")
+def reference(passages):
+    return normalised(load_backend("torch").encode(passages, batch_size=32))
+
+
+@pytest.mark.parametrize("name", sorted(TOLERANCES))
+def test_backend_parity_with_torch(name, passages, reference):
+    options = {"onnx_file": "onnx/model.onnx"} if name == "onnx" else {}
+    vectors = normalised(load_backend(name, **options).encode(passages, batch_size=32))
+    assert vectors.shape == reference.shape
+    cosines = np.sum(vectors * reference, axis=1)
+    assert cosines.min() >= TOLERANCES[name]["min"]
+    assert cosines.mean() >= TOLERANCES[name]["mean"]
+
+
+def test_single_text_gives_one_vector(passages):
+    backend = load_backend("torch")
+    assert np.asarray(backend.encode(passages[0])).ndim == 1
+
+
+def test_model_key_changes_with_backend():
+    assert model_key("torch", "all-MiniLM-L6-v2") == "all-MiniLM-L6-v2"
+    assert model_key("torch-int8", "all-MiniLM-L6-v2") == "all-MiniLM-L6-v2@torch-int8"
+    assert model_key("onnx", "all-MiniLM-L6-v2", "onnx/model.onnx") != \
+        model_key("onnx", "all-MiniLM-L6-v2", "onnx/model_quint8_avx2.onnx")
+
+
+class CountingBackend:
+    """Encodes each text as [len(text), call number] and records batch sizes."""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs):
+        texts = [sentences] if isinstance(sentences, str) else list(sentences)
+        self.batches.append(len(texts))
+        vectors = np.array([[len(text), len(self.batches)] for text in texts], dtype=np.float32)
+        return vectors[0] if isinstance(sentences, str) else vectors
+
+
+def test_batching_embedder_returns_each_callers_vectors():
+    from concurrent.futures import ThreadPoolExecutor
+    backend = CountingBackend()
+    embedder = BatchingEmbedder(backend, max_batch=8, wait_ms=20)
+    texts = ["x" * n for n in range(1, 25)]
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        vectors = list(pool.map(embedder.encode, texts))
+    assert [int(vector[0]) for vector in vectors] == list(range(1, 25))
+    assert max(backend.batches) <= 8
+    assert len(backend.batches) < len(texts)
+
+
+def test_batching_only_with_in_process_jobs(monkeypatch):
+    monkeypatch.setattr(embedding_backends, "create_backend", CountingBackend)
+    monkeypatch.setattr(settings, "EMBEDDING_DYNAMIC_BATCHING", True)
+    monkeypatch.setattr(settings, "JOB_WORKERS", 0)
+    assert isinstance(create_embedder(), BatchingEmbedder)
+    monkeypatch.setattr(settings, "JOB_WORKERS", 2)
+    assert isinstance(create_embedder(), CountingBackend)
+    assert isinstance(create_embedder(batching=True), BatchingEmbedder)
@@ -0,0 +1,58 @@
+import os
+import time
+import pytest
+from app.core.config import settings
+from app.services import job_queue
+
+
+@pytest.fixture
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_QUEUE_PATH", str(tmp_path / "queue.db"))
+    monkeypatch.setattr(settings, "JOB_SPOOL_DIR", str(tmp_path / "spool"))
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 60.0)
+    conn = job_queue._connect()
+    yield conn
+    conn.close()
+
+
+def status(conn, job_id):
+    return conn.execute("SELECT status, worker_pid FROM queue WHERE job_id = ?", (job_id,)).fetchone()
+
+
+def test_live_lease_is_not_requeued_even_if_pid_is_gone(queue_db):
+    job_queue.enqueue("job-1")
+    # A pid that is not running: only the lease decides now
+    assert job_queue.claim_next(queue_db, 2 ** 22 + 7) == ("job-1", "job")
+    assert job_queue.requeue_orphans() == []
+    assert status(queue_db, "job-1")[0] == "running"
+
+
+def test_expired_lease_is_requeued_even_if_pid_is_reused(queue_db):
+    job_queue.enqueue("job-1")
+    # The claim's pid is alive (this process), as after a restart that reused it
+    job_queue.claim_next(queue_db, os.getpid())
+    queue_db.execute("UPDATE queue SET lease_expires_at = ? WHERE job_id = 'job-1'", (time.time() - 1,))
+    assert job_queue.requeue_orphans() == ["job-1"]
+    assert status(queue_db, "job-1") == ("queued", None)
+
+
+def test_renewed_lease_survives(queue_db):
+    job_queue.enqueue("job-1")
+    job_queue.claim_next(queue_db, 1234)
+    queue_db.execute("UPDATE queue SET lease_expires_at = ? WHERE job_id = 'job-1'", (time.time() - 1,))
+    assert not job_queue.renew_lease(queue_db, "job-1", 999)  # not this worker's claim
+    assert job_queue.renew_lease(queue_db, "job-1", 1234)
+    assert job_queue.requeue_orphans() == []
+
+
+def test_dead_worker_pids_are_requeued(queue_db):
+    job_queue.enqueue("job-1")
+    job_queue.claim_next(queue_db, 1234)
+    assert job_queue.requeue_orphans([1234]) == ["job-1"]
+
+
+def test_claims_without_lease_fall_back_to_pid(queue_db):
+    job_queue.enqueue("job-1")
+    job_queue.claim_next(queue_db, 2 ** 22 + 7)
+    queue_db.execute("UPDATE queue SET lease_expires_at = NULL")
+    assert job_queue.requeue_orphans() == ["job-1"]
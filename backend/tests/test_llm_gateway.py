@@ -0,0 +1,236 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.services.llm_gateway import (
+    FakeBackend, LLMGateway, StreamInterrupted, TokenBucket, is_retryable, with_stream_restarts,
+)
+
+
+class ScriptedBackend:
+    """Raises the queued errors in order, then answers like FakeBackend."""
+
+    def __init__(self, errors=(), latency: float = 0.0):
+        self.errors = list(errors)
+        self.latency = latency
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate(self, model_name, prompt, timeout):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            error = self.errors.pop(0) if self.errors else None
+        try:
+            time.sleep(self.latency)
+            if error:
+                raise error
+            return f"answer {self.calls}", 1, 1
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def make_gateway(backend, **kwargs):
+    options = dict(max_in_flight=4, requests_per_minute=60_000, tokens_per_minute=10_000_000,
+                   max_retries=3, backoff_seconds=0.0)
+    options.update(kwargs)
+    return LLMGateway(backend, **options)
+
+
+def test_fake_backend_round_trip():
+    gateway = make_gateway(FakeBackend(latency=0.0))
+    assert '"predicted_fos_outcome"' in gateway.generate("prompt", "model")
+    assert "".join(gateway.stream("prompt", "model")) == FakeBackend.response_text()
+    assert gateway.stats()["calls"] == 2
+
+
+def test_in_flight_cap():
+    backend = ScriptedBackend(latency=0.05)
+    gateway = make_gateway(backend, max_in_flight=2)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: gateway.generate(f"prompt {i}", "model"), range(8)))
+    assert backend.calls == 8
+    assert backend.max_active == 2
+
+
+def test_token_bucket_throttles_past_capacity():
+    bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 10 per second
+    started = time.monotonic()
+    waited = sum(bucket.acquire() for _ in range(5))
+    elapsed = time.monotonic() - started
+    # Two come from the initial capacity, the other three wait ~0.1s each
+    assert elapsed >= 0.25
+    assert waited >= 0.25
+
+
+def test_gateway_waits_on_request_quota():
+    gateway = make_gateway(FakeBackend(latency=0.0))
+    # A full-size bucket starts full; with capacity 1 every call after the first waits its turn (20/s)
+    gateway._requests = TokenBucket(1200, capacity=1)
+    started = time.monotonic()
+    for _ in range(3):
+        gateway.generate("prompt", "model")
+    assert time.monotonic() - started >= 0.09
+    assert gateway.stats()["rate_limit_wait_seconds"] > 0
+
+
+def test_retries_retryable_errors():
+    backend = ScriptedBackend(errors=[TimeoutError("slow"), ConnectionError("reset")])
+    gateway = make_gateway(backend)
+    assert gateway.generate("prompt", "model") == "answer 3"
+    assert backend.calls == 3
+    assert gateway.stats()["retries"] == 2
+
+
+def test_does_not_retry_other_errors():
+    backend = ScriptedBackend(errors=[ValueError("blocked prompt")])
+    gateway = make_gateway(backend)
+    with pytest.raises(ValueError):
+        gateway.generate("prompt", "model")
+    assert backend.calls == 1
+    assert gateway.stats()["retries"] == 0
+
+
+def test_gives_up_after_max_retries():
+    backend = ScriptedBackend(errors=[TimeoutError("slow")] * 10)
+    gateway = make_gateway(backend, max_retries=2)
+    with pytest.raises(TimeoutError):
+        gateway.generate("prompt", "model")
+    assert backend.calls == 3
+
+
+def test_is_retryable_by_class_name():
+    ResourceExhausted = type("ResourceExhausted", (Exception,), {})
+    assert is_retryable(ResourceExhausted("quota"))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ValueError())
+
+
+class FlakyStreamBackend:
+    """Streams `chunks`, failing with TimeoutError after `fail_after` chunks on the first `failures` calls."""
+
+    def __init__(self, chunks, fail_after: int, failures: int = 1):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.failures = failures
+        self.calls = 0
+
+    def stream(self, model_name, prompt, timeout, usage):
+        self.calls += 1
+        for i, chunk in enumerate(self.chunks):
+            if self.calls <= self.failures and i == self.fail_after:
+                raise TimeoutError("stream dropped")
+            yield chunk
+
+
+def test_stream_retried_before_first_chunk():
+    backend = FlakyStreamBackend(["a", "b", "c"], fail_after=0)
+    gateway = make_gateway(backend)
+    assert list(gateway.stream("prompt", "model")) == ["a", "b", "c"]
+    assert backend.calls == 2
+
+
+def test_stream_not_retried_after_first_chunk():
+    backend = FlakyStreamBackend(["a", "b", "c"], fail_after=1)
+    gateway = make_gateway(backend)
+    received = []
+    with pytest.raises(StreamInterrupted):
+        for chunk in gateway.stream("prompt", "model"):
+            received.append(chunk)
+    assert received == ["a"]
+    assert backend.calls == 1
+
+
+class SlowFirstBackend:
+    """The first call takes `slow` seconds, later calls answer at once."""
+
+    def __init__(self, slow: float):
+        self.slow = slow
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, model_name, prompt, timeout):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            time.sleep(self.slow)
+            return "primary", 1, 1
+        return "hedge", 1, 1
+
+
+def test_hedge_returns_first_answer():
+    backend = SlowFirstBackend(slow=1.0)
+    gateway = make_gateway(backend, hedge_after_seconds=0.05)
+    started = time.monotonic()
+    assert gateway.generate("prompt", "model") == "hedge"
+    assert time.monotonic() - started < 0.5
+    stats = gateway.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_hedge_clock_starts_after_admission():
+    gateway = make_gateway(ScriptedBackend(latency=0.05), max_in_flight=1, hedge_after_seconds=0.1)
+    gateway._slots.acquire()  # another call holds the only slot for 0.2s
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        answer = pool.submit(gateway.generate, "prompt", "model")
+        time.sleep(0.2)
+        gateway._slots.release()
+        answer.result()
+    assert gateway.stats()["hedges"] == 0
+
+
+def test_no_hedge_when_primary_is_fast():
+    backend = SlowFirstBackend(slow=0.0)
+    gateway = make_gateway(backend, hedge_after_seconds=0.5)
+    assert gateway.generate("prompt", "model") == "primary"
+    assert backend.calls == 1
+    assert gateway.stats()["hedges"] == 0
+
+
+def test_fake_backend_interruption_raises_stream_interrupted():
+    gateway = make_gateway(FakeBackend(latency=0.0, interruptions=1))
+    received = []
+    with pytest.raises(StreamInterrupted):
+        for chunk in gateway.stream("prompt", "model"):
+            received.append(chunk)
+    assert len(received) == 1
+    assert gateway.stats()["retries"] == 0
+
+
+def test_non_retryable_error_after_first_chunk_is_not_wrapped():
+    class BlockedStream:
+        def stream(self, model_name, prompt, timeout, usage):
+            yield "a"
+            raise ValueError("response blocked")
+
+    gateway = make_gateway(BlockedStream())
+    with pytest.raises(ValueError):
+        list(gateway.stream("prompt", "model"))
+
+
+def test_interrupted_stream_is_restarted_from_scratch():
+    gateway = make_gateway(FakeBackend(latency=0.0, interruptions=2))
+    attempts = []
+
+    def attempt():
+        # Like generate_report's attempt: state built from the chunks starts over
+        chunks = []
+        attempts.append(chunks)
+        for chunk in gateway.stream("prompt", "model"):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    assert with_stream_restarts(attempt, restarts=2) == FakeBackend.response_text()
+    assert len(attempts) == 3
+
+
+def test_stream_restarts_are_bounded():
+    gateway = make_gateway(FakeBackend(latency=0.0, interruptions=5))
+    with pytest.raises(StreamInterrupted):
+        with_stream_restarts(lambda: "".join(gateway.stream("prompt", "model")), restarts=1)
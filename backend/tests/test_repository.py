@@ -0,0 +1,137 @@
+import asyncio
+import re
+import httpx
+import pytest
+from app.services.repository import JobRepository, RepositoryError, SupabaseREST
+
+KEYSET = re.compile(r'^\(created_at\.lt\."([^"]+)",and\(created_at\.eq\."([^"]+)",job_id\.lt\.([^)]+)\)\)$')
+
+
+class FakePostgREST:
+    """Stand-in for the jobs table: supports the keyset `or` filter, order, limit and HEAD counts."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+        self.count_results = {}  # filter param -> Content-Range total
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        params = request.url.params
+        if request.method == "HEAD":
+            if "and" in params:
+                total = self.count_results.get("at_risk", "0")
+            else:
+                key = next(value for name, value in params.multi_items() if name != "select")
+                total = self.count_results.get(key, "0")
+            return httpx.Response(200, headers={"content-range": f"0-0/{total}"})
+
+        rows = list(self.rows)
+        if "or" in params:
+            match = KEYSET.match(params["or"])
+            assert match, params["or"]
+            created_at, same_created_at, job_id = match.groups()
+            assert created_at == same_created_at
+            rows = [row for row in rows if row["created_at"] < created_at
+                    or (row["created_at"] == created_at and row["job_id"] < job_id)]
+        assert params["order"] == "created_at.desc,job_id.desc"
+        rows.sort(key=lambda row: (row["created_at"], row["job_id"]), reverse=True)
+        return httpx.Response(200, json=rows[:int(params["limit"])])
+
+
+def make_repository(handler) -> JobRepository:
+    client = httpx.AsyncClient(base_url="http://supabase.test", transport=httpx.MockTransport(handler))
+    return JobRepository(SupabaseREST(client))
+
+
+def test_list_recent_builds_keyset_filter():
+    server = FakePostgREST([])
+    jobs = make_repository(server)
+    asyncio.run(jobs.list_recent(limit=5, columns="job_id, created_at", before=("2024-05-01T10:00:00+00:00", "abc")))
+    params = server.requests[0].url.params
+    assert params["or"] == '(created_at.lt."2024-05-01T10:00:00+00:00",and(created_at.eq."2024-05-01T10:00:00+00:00",job_id.lt.abc))'
+    assert params["select"] == "job_id, created_at"
+    assert params["limit"] == "5"
+
+
+def test_list_recent_first_page_has_no_filter():
+    server = FakePostgREST([])
+    asyncio.run(make_repository(server).list_recent(limit=3))
+    assert "or" not in server.requests[0].url.params
+
+
+def test_keyset_pages_cover_ties_exactly_once():
+    # Several jobs share a timestamp, so a page boundary falls inside a tie
+    rows = [{"job_id": f"job-{i:02d}", "created_at": f"2024-05-0{1 + i // 4}T10:00:00+00:00"} for i in range(11)]
+    jobs = make_repository(FakePostgREST(rows))
+
+    async def page_through():
+        seen, before = [], None
+        while True:
+            page = await jobs.list_recent(limit=3, before=before)
+            seen.extend(row["job_id"] for row in page)
+            if len(page) < 3:
+                return seen
+            before = (page[-1]["created_at"], page[-1]["job_id"])
+
+    expected = [row["job_id"] for row in sorted(rows, key=lambda r: (r["created_at"], r["job_id"]), reverse=True)]
+    assert asyncio.run(page_through()) == expected
+
+
+def test_dashboard_counts_parses_content_range():
+    server = FakePostgREST([])
+    server.count_results = {"in.(PENDING,PROCESSING)": "7", "eq.COMPLETE": "12"}
+    counts = asyncio.run(make_repository(server).dashboard_counts())
+    assert counts["open"] == 7
+    assert counts["completed"] == 12
+    assert counts["at_risk"] == 0
+    assert all(request.method == "HEAD" for request in server.requests)
+    assert all(request.headers["Prefer"] == "count=exact" for request in server.requests)
+
+
+def test_count_without_total_is_zero():
+    rest = SupabaseREST(httpx.AsyncClient(
+        base_url="http://supabase.test",
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, headers={"content-range": "*/*"})),
+    ))
+    assert asyncio.run(rest.count("jobs")) == 0
+
+
+def test_errors_raise_repository_error():
+    jobs = make_repository(lambda request: httpx.Response(400, json={"message": "column jobs.nope does not exist"}))
+    with pytest.raises(RepositoryError) as error:
+        asyncio.run(jobs.get("abc", columns="nope"))
+    assert error.value.status_code == 400
+    assert error.value.message == "column jobs.nope does not exist"
+
+
+def test_errors_with_non_json_body():
+    jobs = make_repository(lambda request: httpx.Response(503, text="upstream unavailable"))
+    with pytest.raises(RepositoryError) as error:
+        asyncio.run(jobs.update("abc", {"status": "COMPLETE"}))
+    assert error.value.status_code == 503
+    assert error.value.message == "upstream unavailable"
+
+
+def test_count_errors_propagate_from_gather():
+    jobs = make_repository(lambda request: httpx.Response(401, json={"msg": "invalid JWT"}))
+    with pytest.raises(RepositoryError) as error:
+        asyncio.run(jobs.dashboard_counts())
+    assert error.value.status_code == 401
+
+
+def test_single_row_not_found_is_none():
+    jobs = make_repository(lambda request: httpx.Response(406, json={"message": "JSON object requested, multiple (or no) rows returned"}))
+    assert asyncio.run(jobs.get("missing")) is None
+
+
+def test_at_risk_count_matches_outcome_buckets():
+    server = FakePostgREST([])
+    server.count_results = {"at_risk": "3"}
+    assert asyncio.run(make_repository(server).dashboard_counts())["at_risk"] == 3
+    params = next(request.url.params for request in server.requests if "and" in request.url.params)
+    # Only completed jobs, and "Not Upheld" / "Rejected" are not at risk (as in job_stats.outcome_bucket)
+    assert params["status"] == "eq.COMPLETE"
+    outcome = "report_data->predicted_fos_outcome->>outcome"
+    assert params["and"] == (f"({outcome}.ilike.*upheld*,{outcome}.not.ilike.*not upheld*,"
+                             f"{outcome}.not.ilike.*rejected*)")